@@ -381,8 +381,8 @@ WHERE md.active_ind = 'Y'
 -------------------------------------------------------------------------------
 -- STEP 9: Refresh FactEncounter (Incremental insert example)
 -------------------------------------------------------------------------------
--- Might store a last-run timestamp. For simplicity, we do an upsert by encounter_id.
--- Using a basic approach. If existing rows exist, do nothing. If new, insert.
+-- Insert-if-absent by encounter_id. Fact steps only scan source rows changed since
+-- the watermark etl_monitor.py passes in the etl.since_<table> setting (unset = all rows).
 
 INSERT INTO phm_star.fact_encounter (
     encounter_id,
@@ -419,7 +419,8 @@ LEFT JOIN phm_star.dim_organization dorg
     ON dorg.org_id = e.org_id AND dorg.is_current = TRUE
 JOIN phm_star.dim_date dd -- Ensure the encounter date exists in dim_date
     ON dd.date_key = TO_CHAR(COALESCE(e.encounter_datetime, e.admission_datetime), 'YYYYMMDD')::int
-WHERE NOT EXISTS (
+WHERE COALESCE(e.updated_date, e.created_date) >= COALESCE(NULLIF(current_setting('etl.since_encounter', true), '')::timestamp, '-infinity') -- Watermark
+  AND NOT EXISTS (
     SELECT 1
     FROM phm_star.fact_encounter fe
     WHERE fe.encounter_id = e.encounter_id
@@ -461,7 +462,8 @@ JOIN phm_star.dim_condition dc
     ON dc.condition_id = cd.condition_id
 LEFT JOIN phm_star.fact_encounter fe
     ON fe.encounter_id = cd.encounter_id
-WHERE NOT EXISTS (
+WHERE COALESCE(cd.updated_date, cd.created_date) >= COALESCE(NULLIF(current_setting('etl.since_condition_diagnosis', true), '')::timestamp, '-infinity') -- Watermark
+  AND NOT EXISTS (
     SELECT 1
     FROM phm_star.fact_diagnosis fd
     JOIN phm_star.fact_encounter fe2 ON fd.encounter_key = fe2.encounter_key
@@ -498,6 +500,7 @@ LEFT JOIN phm_star.fact_encounter fe -- Use LEFT JOIN if encounter might not exi
 LEFT JOIN phm_star.dim_provider dprov -- Use LEFT JOIN if provider might not exist yet or is optional
     ON dprov.provider_id = pp.provider_id AND dprov.is_current = TRUE
 WHERE pp.active_ind = 'Y' -- Assuming only active procedures should be loaded
+  AND COALESCE(pp.updated_date, pp.created_date) >= COALESCE(NULLIF(current_setting('etl.since_procedure_performed', true), '')::timestamp, '-infinity') -- Watermark
   AND NOT EXISTS ( -- Check if this specific procedure instance already exists
     SELECT 1
     FROM phm_star.fact_procedure fp
@@ -546,6 +549,7 @@ LEFT JOIN phm_star.fact_encounter fe
 LEFT JOIN phm_star.dim_provider dprov
     ON dprov.provider_id = mo.provider_id AND dprov.is_current = TRUE
 WHERE mo.active_ind = 'Y' -- Assuming only active orders should be loaded
+  AND COALESCE(mo.updated_date, mo.created_date) >= COALESCE(NULLIF(current_setting('etl.since_medication_order', true), '')::timestamp, '-infinity') -- Watermark
   AND NOT EXISTS ( -- Check if this specific medication order instance already exists
     SELECT 1
     FROM phm_star.fact_medication_order fmo
@@ -593,6 +597,7 @@ LEFT JOIN phm_star.fact_encounter fe
 LEFT JOIN phm_star.dim_provider dprov
     ON dprov.provider_id = obs.provider_id AND dprov.is_current = TRUE
 WHERE obs.active_ind = 'Y' -- Assuming only active observations
+  AND COALESCE(obs.updated_date, obs.created_date) >= COALESCE(NULLIF(current_setting('etl.since_observation', true), '')::timestamp, '-infinity') -- Watermark
   AND NOT EXISTS ( -- Check if this specific observation instance already exists
     SELECT 1
     FROM phm_star.fact_observation fo
@@ -605,8 +610,37 @@ WHERE obs.active_ind = 'Y' -- Assuming only active observations
 );
 
 -------------------------------------------------------------------------------
--- STEP 14: Refresh FactCareGap (Incremental insert example)
+-- STEP 14: Refresh FactCareGap (Incremental upsert)
+-- care_gaps.py keeps one active phm_edw.care_gap row per patient and measure
+-- and opens, closes and reopens it in place, so a changed gap first updates
+-- the patient's existing fact row for the measure (under any version of the
+-- patient, moved to the current one); only gaps without a fact row insert.
 -------------------------------------------------------------------------------
+UPDATE phm_star.fact_care_gap fcg -- Carry status, resolution and reopen dates of existing gaps
+SET
+    patient_key = dp.patient_key,
+    date_key_identified = TO_CHAR(cg.identified_date, 'YYYYMMDD')::int,
+    date_key_resolved = TO_CHAR(cg.resolved_date, 'YYYYMMDD')::int,
+    gap_status = cg.gap_status
+FROM phm_edw.care_gap cg
+JOIN phm_star.dim_patient dp
+    ON dp.patient_id = cg.patient_id AND dp.is_current = TRUE
+JOIN phm_star.dim_patient dp_version -- Any version, for rows loaded before an SCD change
+    ON dp_version.patient_id = cg.patient_id
+JOIN phm_star.dim_measure dm
+    ON dm.measure_id = cg.measure_id
+WHERE fcg.patient_key = dp_version.patient_key
+  AND fcg.measure_key = dm.measure_key
+  AND cg.active_ind = 'Y'
+  AND COALESCE(cg.updated_date, cg.created_date) >= COALESCE(NULLIF(current_setting('etl.since_care_gap', true), '')::timestamp, '-infinity') -- Watermark
+  AND ( -- Only rows that actually changed
+       fcg.patient_key IS DISTINCT FROM dp.patient_key
+    OR fcg.date_key_identified IS DISTINCT FROM TO_CHAR(cg.identified_date, 'YYYYMMDD')::int
+    OR fcg.date_key_resolved IS DISTINCT FROM TO_CHAR(cg.resolved_date, 'YYYYMMDD')::int
+    OR fcg.gap_status IS DISTINCT FROM cg.gap_status
+  );
+
+-- Insert gaps the patient has no fact row for yet
 INSERT INTO phm_star.fact_care_gap (
     patient_key,
     measure_key,
@@ -628,14 +662,12 @@ JOIN phm_star.dim_patient dp
 JOIN phm_star.dim_measure dm
     ON dm.measure_id = cg.measure_id
 WHERE cg.active_ind = 'Y' -- Assuming only active care gaps
-  AND NOT EXISTS ( -- Check if this specific care gap instance already exists
+  AND COALESCE(cg.updated_date, cg.created_date) >= COALESCE(NULLIF(current_setting('etl.since_care_gap', true), '')::timestamp, '-infinity') -- Watermark
+  AND NOT EXISTS ( -- One fact row per patient and measure, kept current by the UPDATE above
     SELECT 1
     FROM phm_star.fact_care_gap fcg
     WHERE fcg.patient_key = dp.patient_key
       AND fcg.measure_key = dm.measure_key
-      AND fcg.date_key_identified = TO_CHAR(cg.identified_date, 'YYYYMMDD')::int
-      -- Add gap_status to uniqueness check if a patient can have multiple gaps for the same measure identified on the same day but with different statuses over time?
-      -- AND fcg.gap_status = cg.gap_status
 );
 
 -------------------------------------------------------------------------------
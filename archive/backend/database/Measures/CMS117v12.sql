@@ -33,8 +33,13 @@ denominator_exclusions AS (
         AND (
             -- Severe combined immunodeficiency
             (c.condition_code IN ('D81.0', 'D81.1', 'D81.2') AND c.code_system = 'ICD-10')
-            -- HIV
-            OR (c.condition_code LIKE 'B20%' AND c.code_system = 'ICD-10')
+            -- HIV (value set: ICD-10 B20*)
+            OR cd.condition_id IN (
+                SELECT cvs.condition_id
+                FROM phm_edw.condition_value_set cvs
+                JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+                WHERE vs.value_set_name = 'HIV'
+            )
             -- Cancer conditions
             OR (c.condition_code IN ('C81%', 'C82%', 'C83%', 'C84%', 'C85%', 'C88%', 'C90%', 'C91%', 'C92%', 'C93%') 
                 AND c.code_system = 'ICD-10')
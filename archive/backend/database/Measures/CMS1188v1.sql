@@ -2,33 +2,38 @@
 -- Using PHM EDW Schema
 
 -- Step 1: Define measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2025-01-01'::DATE AS start_date,
-        '2025-12-31'::DATE AS end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2025-01-01', '2025-12-31')
 ),
 
 -- Step 2: Initial population - patients 13+ with HIV diagnosis and encounter
 initial_population AS (
     SELECT DISTINCT 
-        p.patient_id,
-        p.date_of_birth
-    FROM phm_edw.patient p
-    JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
-    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+        mc.patient_id,
+        mc.date_of_birth
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
     WHERE 
         -- Age 13+ at start of measurement period
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) >= 13
-        -- HIV diagnosis (using ICD-10 codes)
-        AND c.condition_code LIKE 'B20%'
-        AND c.code_system = 'ICD-10'
+        mc.age_at_start >= 13
+        -- HIV diagnosis (value set: ICD-10 B20*)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'HIV'
+        )
         -- HIV diagnosis before end of measurement period
         AND cd.onset_date <= mp.end_date
         -- Had encounter during measurement period
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
-        AND e.active_ind = 'Y'
+        AND mc.encounter_count > 0
 ),
 
 -- Step 3: Check for chlamydia testing
@@ -2,47 +2,48 @@
 -- Using PHM EDW Schema
 
 -- Step 1: Define measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2025-01-01'::DATE AS start_date,
-        '2025-12-31'::DATE AS end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2025-01-01', '2025-12-31')
 ),
 
 -- Step 2: Initial population - patients 18-75 with diabetes
 initial_population AS (
     SELECT DISTINCT 
-        p.patient_id,
-        p.date_of_birth,
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
-    FROM phm_edw.patient p
-    JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
-    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+        mc.patient_id,
+        mc.date_of_birth,
+        mc.age_at_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
     WHERE 
         -- Age between 18-75 at end of measurement period
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) BETWEEN 18 AND 75
-        -- Diabetes diagnosis (using ICD-10 codes for diabetes)
-        AND c.condition_code LIKE 'E11%'  -- Type 2 Diabetes
-        AND c.code_system = 'ICD-10'
+        mc.age_at_end BETWEEN 18 AND 75
+        -- Diabetes diagnosis (value set: ICD-10 E11*, Type 2 Diabetes)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Diabetes Type 2'
+        )
         -- Active diagnosis overlapping measurement period
         AND cd.onset_date <= mp.end_date
         AND (cd.resolution_date IS NULL OR cd.resolution_date >= mp.start_date)
         -- Had encounter during measurement period
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
-        AND e.active_ind = 'Y'
+        AND mc.encounter_count > 0
 ),
 
 -- Step 3: Identify patients in hospice care
 hospice_patients AS (
-    SELECT DISTINCT cd.patient_id
-    FROM phm_edw.condition_diagnosis cd
-    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    CROSS JOIN measurement_period mp
-    WHERE 
-        c.condition_code IN ('Z51.5')  -- Encounter for palliative care
-        AND cd.onset_date <= mp.end_date
-        AND (cd.resolution_date IS NULL OR cd.resolution_date >= mp.start_date)
+    SELECT mc.patient_id
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    WHERE mc.hospice_diagnosis  -- Z51.5 palliative care overlapping the period
 ),
 
 -- Step 4: Identify nursing home patients (age 66+)
@@ -83,7 +84,7 @@ recent_hba1c AS (
         o.value_numeric,
         ROW_NUMBER() OVER (
             PARTITION BY o.patient_id 
-            ORDER BY o.observation_datetime DESC
+            ORDER BY o.observation_datetime DESC, o.observation_id DESC  -- Same-day results: latest recorded
         ) as result_rank
     FROM phm_edw.observation o
     CROSS JOIN measurement_period mp
@@ -2,26 +2,28 @@
 -- Using PHM EDW Schema
 
 -- Step 1: Define measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2025-01-01'::DATE AS start_date,
-        '2025-12-31'::DATE AS end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2025-01-01', '2025-12-31')
 ),
 
 -- Step 2: Initial population - women 24-64 with encounter
 initial_population AS (
-    SELECT DISTINCT 
-        p.patient_id,
-        p.date_of_birth,
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+    SELECT 
+        mc.patient_id,
+        mc.date_of_birth,
+        mc.age_at_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
-        p.gender = 'F'
-        AND DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) BETWEEN 24 AND 64
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
-        AND e.active_ind = 'Y'
+        mc.gender = 'F'
+        AND mc.age_at_end BETWEEN 24 AND 64
+        AND mc.encounter_count > 0  -- Active encounter during the period
 ),
 
 -- Step 3: Identify exclusions
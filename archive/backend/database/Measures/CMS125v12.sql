@@ -2,27 +2,29 @@
 -- Using PHM EDW Schema
 
 -- Step 1: Define measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2025-01-01'::DATE AS start_date,
-        '2025-12-31'::DATE AS end_date,
+        period_id,
+        start_date,
+        end_date,
         '2023-10-01'::DATE AS lookback_start  -- October 1 two years prior
+    FROM phm_edw.cohort_period('2025-01-01', '2025-12-31')
 ),
 
 -- Step 2: Initial population - women 52-74 with encounter
 initial_population AS (
-    SELECT DISTINCT 
-        p.patient_id,
-        p.date_of_birth,
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+    SELECT 
+        mc.patient_id,
+        mc.date_of_birth,
+        mc.age_at_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
-        p.gender = 'F'
-        AND DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) BETWEEN 52 AND 74
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
-        AND e.active_ind = 'Y'
+        mc.gender = 'F'
+        AND mc.age_at_end BETWEEN 52 AND 74
+        AND mc.encounter_count > 0  -- Active encounter during the period
 ),
 
 -- Step 3: Identify exclusions
@@ -61,14 +63,10 @@ unilateral_mastectomies AS (
 
 -- Step 3c: Hospice care
 hospice_patients AS (
-    SELECT DISTINCT cd.patient_id
-    FROM phm_edw.condition_diagnosis cd
-    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    CROSS JOIN measurement_period mp
-    WHERE 
-        c.condition_code = 'Z51.5'  -- Hospice care
-        AND cd.onset_date <= mp.end_date
-        AND (cd.resolution_date IS NULL OR cd.resolution_date >= mp.start_date)
+    SELECT mc.patient_id
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    WHERE mc.hospice_diagnosis  -- Z51.5 hospice care overlapping the period
 ),
 
 -- Step 3d: Nursing home patients (age 66+)
@@ -91,11 +89,13 @@ advanced_illness_patients AS (
     WHERE 
         ip.age_at_end >= 66
         AND (
-            -- Advanced illness diagnoses
-            c.condition_code LIKE 'G30%'  -- Alzheimer's
-            OR c.condition_code LIKE 'F01%'  -- Vascular dementia
-            OR c.condition_code LIKE 'F02%'  -- Dementia in other diseases
-            OR c.condition_code LIKE 'F03%'  -- Unspecified dementia
+            -- Advanced illness diagnoses (value set: G30*, F01*-F03*, any code system)
+            cd.condition_id IN (
+                SELECT cvs.condition_id
+                FROM phm_edw.condition_value_set cvs
+                JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+                WHERE vs.value_set_name = 'Dementia'
+            )
         )
         AND cd.onset_date <= mp.end_date
 ),
@@ -35,7 +35,13 @@ initial_population AS (
         )
         AND mo.start_datetime BETWEEN mp.start_date AND mp.end_date
         -- Major depression diagnosis within 60 days before/after med start
-        AND c.condition_code LIKE 'F32%'  -- ICD-10 codes for major depression
+        -- Major depression (value set: F32*, any code system)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Major Depression'
+        )
         AND cd.onset_date BETWEEN (mo.start_datetime - INTERVAL '60 days') AND (mo.start_datetime + INTERVAL '60 days')
         -- Eligible encounter within 60 days before/after med start
         AND e.encounter_datetime BETWEEN (mo.start_datetime - INTERVAL '60 days') AND (mo.start_datetime + INTERVAL '60 days')
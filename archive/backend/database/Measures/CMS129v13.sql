@@ -15,11 +15,15 @@ initial_population AS (
         cd.onset_date as diagnosis_date
     FROM phm_edw.patient p
     JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
-    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     CROSS JOIN measurement_period mp
     WHERE 
-        c.condition_code LIKE 'C61%'  -- ICD-10 code for prostate cancer
-        AND c.code_system = 'ICD-10'
+        -- Prostate cancer (value set: ICD-10 C61*)
+        cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Prostate Cancer'
+        )
         AND cd.onset_date <= mp.end_date
         AND cd.active_ind = 'Y'
 ),
@@ -100,8 +104,13 @@ exceptions AS (
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     WHERE 
-        -- Pain diagnosis
-        (c.condition_code LIKE 'M54%' OR c.condition_code LIKE 'R52%')
+        -- Pain diagnosis (value set: M54*, R52*, any code system)
+        (cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Pain'
+        ))
         -- Salvage therapy
         OR c.condition_code IN ('Z92.3')  -- History of irradiation
         AND cd.active_ind = 'Y'
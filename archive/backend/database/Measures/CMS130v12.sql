@@ -1,24 +1,25 @@
 -- CMS130v12 Colorectal Cancer Screening Measure
 -- Using Inmon-style EDW schema (phm_edw)
 
-WITH patient_age AS (
-    -- Calculate patient age at end of measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
+WITH measurement_period AS (
     SELECT 
-        p.patient_id,
-        DATE_PART('year', AGE('2024-12-31', p.date_of_birth)) as age_at_period_end
-    FROM phm_edw.patient p
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 initial_population AS (
-    -- Patients 46-75 with eligible encounter
-    SELECT DISTINCT 
-        p.patient_id,
-        pa.age_at_period_end
-    FROM phm_edw.patient p
-    JOIN patient_age pa ON p.patient_id = pa.patient_id
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    WHERE pa.age_at_period_end BETWEEN 46 AND 75
-    AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+    -- Patients 46-75 (age at end of measurement period) with eligible encounter
+    SELECT 
+        mc.patient_id,
+        mc.age_at_end as age_at_period_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    WHERE mc.age_at_end BETWEEN 46 AND 75
+    AND mc.any_encounter_count > 0
 ),
 
 denominator_exclusions AS (
@@ -31,10 +32,11 @@ denominator_exclusions AS (
         -- Hospice care
         EXISTS (
             SELECT 1 
-            FROM phm_edw.encounter e
-            WHERE e.patient_id = p.patient_id
-            AND e.encounter_type = 'HOSPICE'
-            AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+            FROM phm_edw.measure_cohort_encounter ce
+            JOIN measurement_period mp ON mp.period_id = ce.period_id
+            WHERE ce.patient_id = p.patient_id
+            AND ce.encounter_type = 'HOSPICE'
+            AND ce.encounter_count > 0
         )
         -- Total colectomy or colorectal cancer
         OR EXISTS (
@@ -1,12 +1,14 @@
 -- CMS131v12 Diabetes Eye Exam Measure
 -- Using Inmon-style EDW schema (phm_edw)
 
-WITH patient_age AS (
-    -- Calculate patient age at end of measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
+WITH measurement_period AS (
     SELECT 
-        p.patient_id,
-        DATE_PART('year', AGE('2024-12-31', p.date_of_birth)) as age_at_period_end
-    FROM phm_edw.patient p
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 diabetes_diagnosis AS (
@@ -16,8 +18,13 @@ diabetes_diagnosis AS (
         MIN(cd.onset_date) as earliest_diabetes_date
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    WHERE c.condition_code LIKE 'E11%' -- Type 2 Diabetes ICD-10 codes
-        OR c.condition_code LIKE 'E10%' -- Type 1 Diabetes ICD-10 codes
+    -- Type 1 or 2 diabetes (value set: E10*, E11*, any code system)
+    WHERE cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Diabetes'
+    )
     GROUP BY cd.patient_id
 ),
 
@@ -31,25 +38,29 @@ retinopathy_diagnosis AS (
         END as has_retinopathy
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    WHERE c.condition_code LIKE 'E11.3%' -- Diabetic retinopathy codes
-        OR c.condition_code LIKE 'E10.3%'
+    -- Diabetic retinopathy (value set: E10.3*, E11.3*, any code system)
+    WHERE cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Diabetic Retinopathy'
+    )
     GROUP BY cd.patient_id
 ),
 
 initial_population AS (
     -- Patients 18-75 with diabetes and eligible encounter
     SELECT DISTINCT 
-        p.patient_id,
-        pa.age_at_period_end,
+        mc.patient_id,
+        mc.age_at_end as age_at_period_end,
         dd.earliest_diabetes_date,
         COALESCE(rd.has_retinopathy, false) as has_retinopathy
-    FROM phm_edw.patient p
-    JOIN patient_age pa ON p.patient_id = pa.patient_id
-    JOIN diabetes_diagnosis dd ON p.patient_id = dd.patient_id
-    LEFT JOIN retinopathy_diagnosis rd ON p.patient_id = rd.patient_id
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    WHERE pa.age_at_period_end BETWEEN 18 AND 75
-    AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN diabetes_diagnosis dd ON mc.patient_id = dd.patient_id
+    LEFT JOIN retinopathy_diagnosis rd ON mc.patient_id = rd.patient_id
+    WHERE mc.age_at_end BETWEEN 18 AND 75
+    AND mc.any_encounter_count > 0
 ),
 
 denominator_exclusions AS (
@@ -61,10 +72,11 @@ denominator_exclusions AS (
         -- Hospice care
         EXISTS (
             SELECT 1 
-            FROM phm_edw.encounter e2
-            WHERE e2.patient_id = p.patient_id
-            AND e2.encounter_type = 'HOSPICE'
-            AND e2.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+            FROM phm_edw.measure_cohort_encounter ce
+            JOIN measurement_period mp ON mp.period_id = ce.period_id
+            WHERE ce.patient_id = p.patient_id
+            AND ce.encounter_type = 'HOSPICE'
+            AND ce.encounter_count > 0
         )
         -- Age 66+ in nursing home
         OR (
@@ -100,10 +112,11 @@ denominator_exclusions AS (
         -- Palliative care
         OR EXISTS (
             SELECT 1
-            FROM phm_edw.encounter e5
-            WHERE e5.patient_id = p.patient_id
-            AND e5.encounter_type = 'PALLIATIVE_CARE'
-            AND e5.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+            FROM phm_edw.measure_cohort_encounter ce
+            JOIN measurement_period mp ON mp.period_id = ce.period_id
+            WHERE ce.patient_id = p.patient_id
+            AND ce.encounter_type = 'PALLIATIVE_CARE'
+            AND ce.encounter_count > 0
         )
 ),
 
@@ -1,24 +1,26 @@
 -- CMS135v12 Heart Failure Treatment Measure
 -- Using Inmon-style EDW schema (phm_edw)
 
-WITH patient_age AS (
-    -- Calculate patient age at end of measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
+WITH measurement_period AS (
     SELECT 
-        p.patient_id,
-        DATE_PART('year', AGE('2024-12-31', p.date_of_birth)) as age_at_period_end
-    FROM phm_edw.patient p
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 qualifying_encounters AS (
     -- Identify patients with two eligible encounters
     SELECT 
-        patient_id,
-        COUNT(DISTINCT encounter_id) as encounter_count
-    FROM phm_edw.encounter
-    WHERE encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
-    AND encounter_type IN ('OUTPATIENT', 'OFFICE VISIT')
-    GROUP BY patient_id
-    HAVING COUNT(DISTINCT encounter_id) >= 2
+        ce.patient_id,
+        SUM(ce.encounter_count) as encounter_count
+    FROM phm_edw.measure_cohort_encounter ce
+    JOIN measurement_period mp ON mp.period_id = ce.period_id
+    WHERE ce.encounter_type IN ('OUTPATIENT', 'OFFICE VISIT')
+    GROUP BY ce.patient_id
+    HAVING SUM(ce.encounter_count) >= 2
 ),
 
 heart_failure_diagnosis AS (
@@ -29,7 +31,13 @@ heart_failure_diagnosis AS (
         cd.diagnosis_status
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    WHERE c.condition_code LIKE 'I50%' -- ICD-10 codes for heart failure
+    -- Heart failure (value set: I50*, any code system)
+    WHERE cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Heart Failure'
+    )
     AND cd.diagnosis_status = 'ACTIVE'
 ),
 
@@ -50,14 +58,14 @@ lvef_observations AS (
 initial_population AS (
     -- Combine age, encounters, and HF diagnosis criteria
     SELECT DISTINCT 
-        p.patient_id,
-        pa.age_at_period_end,
+        mc.patient_id,
+        mc.age_at_end as age_at_period_end,
         hf.onset_date as hf_diagnosis_date
-    FROM phm_edw.patient p
-    JOIN patient_age pa ON p.patient_id = pa.patient_id
-    JOIN qualifying_encounters qe ON p.patient_id = qe.patient_id
-    JOIN heart_failure_diagnosis hf ON p.patient_id = hf.patient_id
-    WHERE pa.age_at_period_end >= 18
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN qualifying_encounters qe ON mc.patient_id = qe.patient_id
+    JOIN heart_failure_diagnosis hf ON mc.patient_id = hf.patient_id
+    WHERE mc.age_at_end >= 18
 ),
 
 denominator_exclusions AS (
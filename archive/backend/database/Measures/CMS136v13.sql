@@ -1,7 +1,17 @@
 -- CMS136v13 ADHD Follow-up Care Measure
 -- Using Inmon-style EDW schema (phm_edw)
 
-WITH patient_age AS (
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
+WITH measurement_period AS (
+    SELECT 
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
+),
+
+patient_age AS (
     -- Calculate patient age as of IPSD
     SELECT 
         p.patient_id,
@@ -79,10 +89,11 @@ denominator_exclusions AS (
         c.condition_code = 'G47.4' -- ICD-10 for narcolepsy
         OR EXISTS (
             SELECT 1 
-            FROM phm_edw.encounter e
-            WHERE e.patient_id = cd.patient_id
-            AND e.encounter_type = 'HOSPICE'
-            AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+            FROM phm_edw.measure_cohort_encounter ce
+            JOIN measurement_period mp ON mp.period_id = ce.period_id
+            WHERE ce.patient_id = cd.patient_id
+            AND ce.encounter_type = 'HOSPICE'
+            AND ce.encounter_count > 0
         )
     )
 ),
@@ -1,12 +1,23 @@
 -- CMS137v12 SUD Treatment Initiation and Engagement Measure
 -- Using Inmon-style EDW schema (phm_edw)
 
-WITH patient_age AS (
-    -- Calculate patient age at start of measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
+WITH measurement_period AS (
     SELECT 
-        p.patient_id,
-        DATE_PART('year', AGE('2024-01-01', p.date_of_birth)) as age_at_start
-    FROM phm_edw.patient p
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
+),
+
+patient_age AS (
+    -- Patient age at start of measurement period
+    SELECT 
+        mc.patient_id,
+        mc.age_at_start
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
 ),
 
 sud_diagnoses AS (
@@ -23,12 +34,24 @@ sud_diagnoses AS (
             WHERE cd2.patient_id = cd.patient_id
             AND cd2.onset_date BETWEEN e.encounter_datetime - INTERVAL '60 days' 
                 AND e.encounter_datetime - INTERVAL '1 day'
-            AND c2.condition_code LIKE 'F1%' -- ICD-10 SUD codes
+            -- SUD diagnosis (value set: F1*, any code system)
+            AND cd2.condition_id IN (
+                SELECT cvs.condition_id
+                FROM phm_edw.condition_value_set cvs
+                JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+                WHERE vs.value_set_name = 'Substance Use Disorder'
+            )
         ) as is_new_episode
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     JOIN phm_edw.encounter e ON cd.encounter_id = e.encounter_id
-    WHERE c.condition_code LIKE 'F1%' -- ICD-10 SUD codes
+    -- SUD diagnosis (value set: F1*, any code system)
+    WHERE cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Substance Use Disorder'
+    )
     AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-11-14'
 ),
 
@@ -59,10 +82,11 @@ initial_population AS (
 
 denominator_exclusions AS (
     -- Identify patients in hospice
-    SELECT DISTINCT e.patient_id
-    FROM phm_edw.encounter e
-    WHERE e.encounter_type = 'HOSPICE'
-    AND e.encounter_datetime BETWEEN '2024-01-01' AND '2024-12-31'
+    SELECT DISTINCT ce.patient_id
+    FROM phm_edw.measure_cohort_encounter ce
+    JOIN measurement_period mp ON mp.period_id = ce.period_id
+    WHERE ce.encounter_type = 'HOSPICE'
+    AND ce.encounter_count > 0
 ),
 
 initiation_visits AS (
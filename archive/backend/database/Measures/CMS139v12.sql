@@ -1,10 +1,14 @@
 -- CMS139v12: Falls: Screening for Future Fall Risk
 -- Using the 3NF EDW schema for direct source data access
 
+-- Hospice status comes from the shared cohort cache (measure_cohorts.py);
+-- cohort_period raises if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::DATE as start_date,
-        '2024-12-31'::DATE as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 65+ at start of measurement period with eligible encounter
@@ -27,13 +31,12 @@ initial_population AS (
 
 -- Denominator Exclusions: Patients in hospice during measurement period
 hospice_patients AS (
-    SELECT DISTINCT
-        e.patient_id
-    FROM phm_edw.encounter e
-    CROSS JOIN measurement_period mp
+    SELECT
+        mc.patient_id
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
-        e.encounter_type = 'HOSPICE'
-        AND e.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
+        mc.hospice_encounter  -- HOSPICE encounter during the period
 ),
 
 -- Numerator: Patients screened for fall risk during measurement period
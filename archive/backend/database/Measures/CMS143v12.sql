@@ -1,10 +1,14 @@
 -- CMS143v12: Primary Open-Angle Glaucoma (POAG): Optic Nerve Evaluation
 -- Using the 3NF EDW schema for direct source data access
 
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::DATE as start_date,
-        '2024-12-31'::DATE as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 18+ with POAG diagnosis
@@ -18,14 +22,14 @@ poag_patients AS (
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     JOIN phm_edw.encounter e ON cd.encounter_id = e.encounter_id
-    JOIN phm_edw.patient p ON cd.patient_id = p.patient_id
-    CROSS JOIN measurement_period mp
+    JOIN phm_edw.measure_cohort mc ON cd.patient_id = mc.patient_id
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
         -- POAG diagnosis codes
         c.condition_code IN ('H40.11X0', 'H40.11X1', 'H40.11X2', 'H40.11X3', 'H40.11X4') -- Replace with actual codes
         AND cd.diagnosis_status = 'ACTIVE'
         -- Age 18+ at start of measurement period
-        AND EXTRACT(YEAR FROM AGE(mp.start_date, p.date_of_birth)) >= 18
+        AND mc.age_at_start >= 18
         -- Encounter during measurement period
         AND e.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
         AND e.status = 'COMPLETED'
@@ -1,10 +1,14 @@
 -- CMS144v12: Heart Failure Beta-Blocker Therapy for LVSD
 -- Using the 3NF EDW schema for direct source data access
 
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::DATE as start_date,
-        '2024-12-31'::DATE as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 18+ with HF diagnosis and qualifying encounters
@@ -18,23 +22,21 @@ heart_failure_patients AS (
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     JOIN phm_edw.encounter e ON cd.encounter_id = e.encounter_id
-    JOIN phm_edw.patient p ON cd.patient_id = p.patient_id
-    CROSS JOIN measurement_period mp
+    JOIN phm_edw.measure_cohort mc ON cd.patient_id = mc.patient_id
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
         -- Heart Failure diagnosis codes
         c.condition_code IN ('I50.1', 'I50.20', 'I50.21', 'I50.22', 'I50.23') -- Replace with actual codes
         AND cd.diagnosis_status = 'ACTIVE'
         -- Age 18+ at start of measurement period
-        AND EXTRACT(YEAR FROM AGE(mp.start_date, p.date_of_birth)) >= 18
+        AND mc.age_at_start >= 18
         -- Two qualifying encounters
-        AND EXISTS (
-            SELECT 1 FROM phm_edw.encounter e2
-            WHERE e2.patient_id = cd.patient_id
-            AND e2.encounter_type IN ('OUTPATIENT', 'OFFICE_VISIT')
-            AND e2.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
-            GROUP BY e2.patient_id
-            HAVING COUNT(*) >= 2
-        )
+        AND (
+            SELECT SUM(ce.encounter_day_count) FROM phm_edw.measure_cohort_encounter ce
+            WHERE ce.period_id = mc.period_id
+            AND ce.patient_id = mc.patient_id
+            AND ce.encounter_type IN ('OUTPATIENT', 'OFFICE_VISIT')
+        ) >= 2
         AND cd.active_ind = 'Y'
         AND e.active_ind = 'Y'
 ),
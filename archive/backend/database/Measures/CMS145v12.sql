@@ -1,10 +1,14 @@
 -- CMS145v12: CAD Beta-Blocker Therapy
 -- Using the 3NF EDW schema for direct source data access
 
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::DATE as start_date,
-        '2024-12-31'::DATE as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population (shared logic for both populations)
@@ -19,8 +23,8 @@ cad_patients AS (
     FROM phm_edw.condition_diagnosis cd
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     JOIN phm_edw.encounter e ON cd.encounter_id = e.encounter_id
-    JOIN phm_edw.patient p ON cd.patient_id = p.patient_id
-    CROSS JOIN measurement_period mp
+    JOIN phm_edw.measure_cohort mc ON cd.patient_id = mc.patient_id
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
         -- CAD diagnosis codes
         (c.condition_code IN ('I25.1', 'I25.10', 'I25.11', 'I25.2') -- Replace with actual CAD codes
@@ -35,17 +39,15 @@ cad_patients AS (
         ))
         AND cd.diagnosis_status = 'ACTIVE'
         -- Age 18+ at start of period
-        AND EXTRACT(YEAR FROM AGE(mp.start_date, p.date_of_birth)) >= 18
+        AND mc.age_at_start >= 18
         -- Two qualifying encounters
-        AND EXISTS (
-            SELECT 1 FROM phm_edw.encounter e2
-            WHERE e2.patient_id = cd.patient_id
-            AND e2.encounter_type IN ('OUTPATIENT', 'OFFICE_VISIT')
-            AND e2.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
-            AND e2.status = 'COMPLETED'
-            GROUP BY e2.patient_id
-            HAVING COUNT(*) >= 2
-        )
+        AND (
+            SELECT SUM(ce.encounter_day_count) FROM phm_edw.measure_cohort_encounter ce
+            WHERE ce.period_id = mc.period_id
+            AND ce.patient_id = mc.patient_id
+            AND ce.encounter_type IN ('OUTPATIENT', 'OFFICE_VISIT')
+            AND ce.status = 'COMPLETED'
+        ) >= 2
         AND cd.active_ind = 'Y'
         AND e.active_ind = 'Y'
 ),
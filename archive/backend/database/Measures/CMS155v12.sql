@@ -1,10 +1,14 @@
 -- CMS155v12: Weight Assessment and Counseling for Children/Adolescents
 -- Using PHM EDW Schema
 
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        DATE '2024-01-01' as start_date,
-        DATE '2024-12-31' as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Common base population (used for all three populations)
@@ -14,16 +18,16 @@ base_population AS (
         e.patient_id,
         e.provider_id,
         e.encounter_datetime,
-        p.date_of_birth,
+        mc.date_of_birth,
         pr.specialty,
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
+        mc.age_at_end
     FROM phm_edw.encounter e
-    JOIN phm_edw.patient p ON e.patient_id = p.patient_id
+    JOIN phm_edw.measure_cohort mc ON e.patient_id = mc.patient_id
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     JOIN phm_edw.provider pr ON e.provider_id = pr.provider_id
-    CROSS JOIN measurement_period mp
     WHERE 
         -- Age 3-17 at end of measurement period
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) BETWEEN 3 AND 17
+        mc.age_at_end BETWEEN 3 AND 17
         -- Encounter during measurement period
         AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
         -- PCP or OB/GYN visit
@@ -44,7 +48,13 @@ common_exclusions AS (
         FROM phm_edw.condition_diagnosis cd
         JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
         WHERE cd.patient_id = bp.patient_id
-        AND c.condition_code LIKE 'Z3[23]%'  -- Pregnancy exam/test codes
+        -- Pregnancy exam/test codes (value set: Z32*, Z33*, any code system)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Pregnancy Exam or Test'
+        )
         AND cd.onset_date BETWEEN 
             (SELECT start_date FROM measurement_period)
             AND (SELECT end_date FROM measurement_period)
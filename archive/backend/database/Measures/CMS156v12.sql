@@ -1,25 +1,28 @@
 -- CMS156v12: Use of High-Risk Medications in Older Adults
 -- Using PHM EDW Schema
 
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        DATE '2024-01-01' as start_date,
-        DATE '2024-12-31' as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Common base population (used for all three populations)
 base_population AS (
-    SELECT DISTINCT
-        p.patient_id,
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+    SELECT
+        mc.patient_id,
+        mc.age_at_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     WHERE 
         -- Age 65+ at end of measurement period
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) >= 65
+        mc.age_at_end >= 65
         -- Encounter during measurement period
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
+        AND mc.any_encounter_count > 0
 ),
 
 -- Common exclusions (used for all three populations)
@@ -61,16 +61,14 @@ exclusions AS (
     LEFT JOIN phm_edw.condition_diagnosis cd ON ie.patient_id = cd.patient_id
     LEFT JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     WHERE 
-        -- Bipolar disorder
-        c.condition_code LIKE 'F31%'
-        -- Personality disorder
-        OR c.condition_code LIKE 'F60%'
-        -- Schizophrenia
-        OR c.condition_code LIKE 'F20%'
-        -- Psychotic disorder
-        OR c.condition_code LIKE 'F23%'
-        -- Pervasive developmental disorder
-        OR c.condition_code LIKE 'F84%'
+        -- Bipolar, personality, schizophrenia, psychotic or pervasive developmental
+        -- disorder (value set: F31*, F60*, F20*, F23*, F84*, any code system)
+        cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Depression Exclusions'
+        )
 ),
 
 -- Get follow-up PHQ-9 scores at 12 months
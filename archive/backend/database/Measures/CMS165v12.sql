@@ -1,29 +1,33 @@
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        DATE '2024-01-01' as start_date,
-        DATE '2024-12-31' as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 18-85 with essential HTN diagnosis
 initial_population AS (
     SELECT DISTINCT
-        p.patient_id,
-        p.date_of_birth,
+        mc.patient_id,
+        mc.date_of_birth,
         cd.condition_diagnosis_id,
         c.condition_code,
         cd.onset_date,
         e.encounter_id,
         e.encounter_datetime,
-        -- Calculate age at end of measurement period
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) as age_at_end
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+        -- Age at end of measurement period
+        mc.age_at_end
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.encounter e ON mc.patient_id = e.patient_id
+    JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    CROSS JOIN measurement_period mp
     WHERE 
         -- Age between 18-85 at end of measurement period
-        DATE_PART('year', AGE(mp.end_date, p.date_of_birth)) BETWEEN 18 AND 85
+        mc.age_at_end BETWEEN 18 AND 85
         -- Essential hypertension diagnosis codes
         AND c.condition_code IN ('I10', 'I10.0', 'I10.1', 'I10.9')
         -- HTN diagnosis starts before or during first 6 months of measurement period
@@ -46,7 +50,13 @@ exclusions AS (
     LEFT JOIN phm_edw.procedure p ON pp.procedure_id = p.procedure_id
     WHERE 
         -- Pregnancy
-        c.condition_code LIKE 'O%'  -- Any pregnancy diagnosis
+        -- Any pregnancy diagnosis (value set: O*, any code system)
+        cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Pregnancy'
+        )
         -- ESRD
         OR c.condition_code IN ('N18.6')  -- End stage renal disease
         OR p.procedure_code IN ('90935', '90937')  -- Dialysis procedures
@@ -83,7 +93,13 @@ exclusions AS (
                 FROM phm_edw.condition_diagnosis cd3
                 JOIN phm_edw.condition c3 ON cd3.condition_id = c3.condition_id
                 WHERE cd3.patient_id = i.patient_id
-                AND c3.condition_code LIKE 'R54%'  -- Frailty codes
+                -- Frailty (value set: R54*, any code system)
+                AND cd3.condition_id IN (
+                    SELECT cvs.condition_id
+                    FROM phm_edw.condition_value_set cvs
+                    JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+                    WHERE vs.value_set_name = 'Frailty'
+                )
             ))
 ),
 
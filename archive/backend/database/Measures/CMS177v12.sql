@@ -1,8 +1,12 @@
 -- CMS177v12: Child and Adolescent Major Depressive Disorder (MDD): Suicide Risk Assessment
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        DATE '2024-01-01' as start_date,
-        DATE '2024-12-31' as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 6-16 with MDD diagnosis
@@ -11,21 +15,21 @@ encounters_with_mdd AS (
         e.encounter_id,
         e.patient_id,
         e.encounter_datetime,
-        p.date_of_birth,
+        mc.date_of_birth,
         c.condition_code,
         c.condition_name,
         cd.diagnosis_status,
-        -- Calculate age at start of measurement period
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) as age_at_start
+        -- Age at start of measurement period
+        mc.age_at_start
     FROM phm_edw.encounter e
-    JOIN phm_edw.patient p ON e.patient_id = p.patient_id
+    JOIN phm_edw.measure_cohort mc ON e.patient_id = mc.patient_id
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
     JOIN phm_edw.condition_diagnosis cd ON e.patient_id = cd.patient_id
         AND e.encounter_id = cd.encounter_id
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    CROSS JOIN measurement_period mp
     WHERE 
         -- Age between 6-16 at start of measurement period
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) BETWEEN 6 AND 16
+        mc.age_at_start BETWEEN 6 AND 16
         -- Major Depressive Disorder ICD-10 codes
         AND c.condition_code IN (
             'F32.0', 'F32.1', 'F32.2', 'F32.3',  -- Major depressive disorder, single episode
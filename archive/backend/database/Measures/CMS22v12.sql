@@ -34,7 +34,13 @@ prior_htn AS (
         -- HTN diagnosis before encounter
         cd.onset_date < i.encounter_datetime
         AND cd.diagnosis_status = 'ACTIVE'
-        AND c.condition_code LIKE 'I10%'  -- HTN ICD-10 codes
+        -- Hypertension (value set: I10*, any code system)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Hypertension'
+        )
 ),
 
 -- Get BP readings for encounters
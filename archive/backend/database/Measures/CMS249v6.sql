@@ -1,27 +1,31 @@
 -- CMS249v6: DXA Scan Use in Women Under 65 Years
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        DATE '2024-01-01' as start_date,
-        DATE '2024-12-31' as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Female patients 50-63 years with encounter
 initial_population AS (
     SELECT DISTINCT
-        p.patient_id,
-        p.date_of_birth,
+        mc.patient_id,
+        mc.date_of_birth,
         e.encounter_id,
         e.encounter_datetime,
-        -- Calculate age at start of measurement period
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) as age_at_start
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    CROSS JOIN measurement_period mp
+        -- Age at start of measurement period
+        mc.age_at_start
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.encounter e ON mc.patient_id = e.patient_id
     WHERE 
         -- Female patients
-        p.gender = 'F'
+        mc.gender = 'F'
         -- Age 50-63 at start of measurement period
-        AND DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) BETWEEN 50 AND 63
+        AND mc.age_at_start BETWEEN 50 AND 63
         -- Visit during measurement period
         AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
 ),
@@ -2,10 +2,14 @@
 -- Using the Inmon-style EDW schema (phm_edw)
 
 -- Common date parameters for measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
   SELECT 
-    '2024-01-01'::date as period_start,
-    '2024-12-31'::date as period_end
+    period_id,
+    start_date as period_start,
+    end_date as period_end
+  FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population 1: Patients with ASCVD
@@ -15,8 +19,13 @@ initial_pop_1 AS (
   JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   WHERE 
-    -- Active ASCVD diagnosis
-    c.condition_code LIKE 'I%' -- ICD-10 codes for ASCVD
+    -- Active ASCVD diagnosis (value set: I*, any code system)
+    cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'ASCVD'
+    )
     AND cd.diagnosis_status = 'ACTIVE'
     AND cd.active_ind = 'Y'
     AND p.active_ind = 'Y'
@@ -42,15 +51,15 @@ denominator_exclusions AS (
 
 -- Initial Population 2: Patients with LDL >= 190 or familial hypercholesterolemia
 initial_pop_2 AS (
-  SELECT DISTINCT p.patient_id
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
-  LEFT JOIN phm_edw.observation o ON p.patient_id = o.patient_id
-  LEFT JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+  SELECT DISTINCT mc.patient_id
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
+  LEFT JOIN phm_edw.observation o ON mc.patient_id = o.patient_id
+  LEFT JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   WHERE 
     -- Age 20-75 during measurement period
-    EXTRACT(YEAR FROM age(mp.period_start, p.date_of_birth)) BETWEEN 20 AND 75
+    mc.age_at_start BETWEEN 20 AND 75
     AND (
       -- LDL >= 190
       (o.observation_code = '13457-7' -- LOINC code for LDL-C
@@ -61,39 +70,39 @@ initial_pop_2 AS (
       AND cd.diagnosis_status = 'ACTIVE'
       AND cd.active_ind = 'Y')
     )
-    AND p.active_ind = 'Y'
+    AND mc.active_ind = 'Y'
 ),
 
 -- Initial Population 3: Diabetic patients aged 40-75
 initial_pop_3 AS (
-  SELECT DISTINCT p.patient_id
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
-  JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+  SELECT DISTINCT mc.patient_id
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
+  JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   WHERE
     -- Age 40-75 during measurement period
-    EXTRACT(YEAR FROM age(mp.period_start, p.date_of_birth)) BETWEEN 40 AND 75
+    mc.age_at_start BETWEEN 40 AND 75
     -- Diabetes diagnosis
     AND c.condition_code IN ('E10%', 'E11%') -- ICD-10 codes for Type 1 and Type 2 diabetes
     AND cd.diagnosis_status = 'ACTIVE'
     AND cd.active_ind = 'Y'
-    AND p.active_ind = 'Y'
+    AND mc.active_ind = 'Y'
 ),
 
 -- Initial Population 4: Patients aged 40-75 with ASCVD risk score >= 20%
 initial_pop_4 AS (
-  SELECT DISTINCT p.patient_id
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
-  JOIN phm_edw.observation o ON p.patient_id = o.patient_id
+  SELECT DISTINCT mc.patient_id
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
+  JOIN phm_edw.observation o ON mc.patient_id = o.patient_id
   WHERE
     -- Age 40-75 during measurement period
-    EXTRACT(YEAR FROM age(mp.period_start, p.date_of_birth)) BETWEEN 40 AND 75
+    mc.age_at_start BETWEEN 40 AND 75
     -- ASCVD risk score >= 20%
     AND o.observation_code = '79423-0' -- LOINC code for ASCVD risk score
     AND o.value_numeric >= 20
-    AND p.active_ind = 'Y'
+    AND mc.active_ind = 'Y'
 ),
 
 -- Numerator: Patients on statin therapy
@@ -121,10 +130,13 @@ denominator_exceptions AS (
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   JOIN measurement_period mp ON true
   WHERE
-    -- Hepatitis A, B, liver disease
-    (c.condition_code LIKE 'B15%' -- Hep A
-    OR c.condition_code LIKE 'B16%' -- Hep B
-    OR c.condition_code LIKE 'K7%') -- Liver disease
+    -- Hepatitis A, B, liver disease (value set: B15*, B16*, K7*, any code system)
+    cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Hepatitis or Liver Disease'
+    )
     AND cd.diagnosis_status = 'ACTIVE'
     AND cd.active_ind = 'Y'
     -- Add ESRD, palliative care, and statin allergy conditions
@@ -2,27 +2,35 @@
 -- Using the Inmon-style EDW schema (phm_edw)
 
 -- Common date parameters for measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
   SELECT 
-    '2024-01-01'::date as period_start,
-    '2024-12-31'::date as period_end
+    period_id,
+    start_date as period_start,
+    end_date as period_end
+  FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients 15-65 with eligible encounter
 initial_population AS (
-  SELECT DISTINCT 
-    p.patient_id
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
-  JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
+  SELECT 
+    mc.patient_id
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
   WHERE 
     -- Age 15-65 at start of measurement period
-    EXTRACT(YEAR FROM age(mp.period_start, p.date_of_birth)) BETWEEN 15 AND 65
+    mc.age_at_start BETWEEN 15 AND 65
     -- Eligible outpatient encounter during measurement period
-    AND e.encounter_type = 'OUTPATIENT'
-    AND e.encounter_datetime BETWEEN mp.period_start AND mp.period_end
-    AND e.active_ind = 'Y'
-    AND p.active_ind = 'Y'
+    AND EXISTS (
+      SELECT 1 FROM phm_edw.measure_cohort_encounter ce
+      WHERE ce.period_id = mc.period_id
+      AND ce.patient_id = mc.patient_id
+      AND ce.encounter_type = 'OUTPATIENT'
+      AND ce.active_ind = 'Y'
+      AND ce.encounter_count > 0
+    )
+    AND mc.active_ind = 'Y'
 ),
 
 -- Denominator Exclusions: Prior HIV diagnosis
@@ -33,8 +41,13 @@ denominator_exclusions AS (
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   JOIN measurement_period mp ON true
   WHERE 
-    -- HIV diagnosis codes (using ICD-10)
-    c.condition_code LIKE 'B20%' -- HIV disease
+    -- HIV disease (value set: B20*, any code system)
+    cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'HIV (Any Code System)'
+    )
     OR c.condition_code = 'Z21' -- Asymptomatic HIV
     -- Prior to measurement period
     AND cd.onset_date < mp.period_start
@@ -49,10 +49,20 @@ denominator_exclusions AS (
   WHERE 
     -- Hospice care
     (c.condition_code = 'Z51.5' AND cd.active_ind = 'Y')
-    -- Severe cognitive impairment
-    OR (c.condition_code LIKE 'F0%' AND cd.active_ind = 'Y')
-    -- Lower body fractures within 24 hours
-    OR (c.condition_code LIKE 'S7%' 
+    -- Severe cognitive impairment (value set: F0*, any code system)
+    OR (cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Cognitive Impairment'
+    ) AND cd.active_ind = 'Y')
+    -- Lower body fractures within 24 hours (value set: S7*, any code system)
+    OR (cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Lower Body Fracture'
+    )
         AND cd.onset_date BETWEEN i.surgery_date - INTERVAL '24 hours' AND i.surgery_date)
     -- Partial hip procedure same day
     OR (p.procedure_code = '27125' 
@@ -60,8 +70,13 @@ denominator_exclusions AS (
     -- Revision procedures same day
     OR (p.procedure_code IN ('27134', '27137', '27138') 
         AND pp.procedure_datetime::date = i.surgery_date::date)
-    -- Malignant neoplasm
-    OR (c.condition_code LIKE 'C4%' 
+    -- Malignant neoplasm (value set: C4*, any code system)
+    OR (cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Bone, Skin or Soft Tissue Cancer'
+    )
         AND cd.diagnosis_status = 'ACTIVE' 
         AND cd.active_ind = 'Y')
     -- Second THA within 1 year
@@ -2,33 +2,40 @@
 -- Using the Inmon-style EDW schema (phm_edw)
 
 -- Common date parameters for measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
   SELECT 
-    '2024-01-01'::date as period_start,
-    '2024-12-31'::date as period_end
+    period_id,
+    start_date as period_start,
+    end_date as period_end
+  FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Male patients with prostate cancer on ADT
 initial_population AS (
   SELECT DISTINCT 
-    p.patient_id,
+    mc.patient_id,
     cd.onset_date as cancer_diagnosis_date,
     mo.start_datetime as adt_start_date
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
   -- Prostate Cancer Diagnosis
-  JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+  JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
   -- ADT Therapy
-  JOIN phm_edw.medication_order mo ON p.patient_id = mo.patient_id
+  JOIN phm_edw.medication_order mo ON mc.patient_id = mo.patient_id
   JOIN phm_edw.medication m ON mo.medication_id = m.medication_id
-  -- Encounter during measurement period
-  JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
   WHERE 
     -- Male patients
-    p.gender = 'M'
-    -- Prostate cancer diagnosis (ICD-10 code)
-    AND c.condition_code LIKE 'C61%'
+    mc.gender = 'M'
+    -- Prostate cancer diagnosis (value set: C61*, any code system)
+    AND cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Prostate Cancer (Any Code System)'
+    )
     AND cd.diagnosis_status = 'ACTIVE'
     -- ADT medication
     AND m.medication_code IN (
@@ -42,9 +49,8 @@ initial_population AS (
     AND (mo.end_datetime IS NULL OR 
          mo.end_datetime >= mo.start_datetime + INTERVAL '12 months')
     -- Encounter during measurement period
-    AND e.encounter_datetime BETWEEN mp.period_start AND mp.period_end
-    AND e.active_ind = 'Y'
-    AND p.active_ind = 'Y'
+    AND mc.encounter_count > 0
+    AND mc.active_ind = 'Y'
     AND cd.active_ind = 'Y'
     AND mo.active_ind = 'Y'
 ),
@@ -2,25 +2,27 @@
 -- Using the Inmon-style EDW schema (phm_edw)
 
 -- Common date parameters for measurement period
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
   SELECT 
-    '2024-01-01'::date as period_start,
-    '2024-12-31'::date as period_end
+    period_id,
+    start_date as period_start,
+    end_date as period_end
+  FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 
 -- Initial Population: Patients with non-muscle invasive bladder cancer
 initial_population AS (
   SELECT DISTINCT 
-    p.patient_id,
+    mc.patient_id,
     cd.onset_date as diagnosis_date,
     cd.created_date as staging_date  -- Using created_date as proxy for staging date
-  FROM phm_edw.patient p
-  JOIN measurement_period mp ON true
+  FROM phm_edw.measure_cohort mc
+  JOIN measurement_period mp ON mp.period_id = mc.period_id
   -- Bladder Cancer Diagnosis
-  JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+  JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
   JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-  -- Encounter during measurement period
-  JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
   WHERE 
     -- Non-muscle invasive bladder cancer (T1, Tis, or high-grade Ta)
     c.condition_code IN (
@@ -39,7 +41,7 @@ initial_population AS (
     AND EXISTS (
       SELECT 1 
       FROM phm_edw.observation o 
-      WHERE o.patient_id = p.patient_id
+      WHERE o.patient_id = mc.patient_id
       AND o.observation_code IN (
         '21908-9', -- Stage (T1)
         '21899-0', -- Stage (Tis)
@@ -53,9 +55,8 @@ initial_population AS (
     -- Active diagnosis
     AND cd.diagnosis_status = 'ACTIVE'
     -- Encounter during measurement period
-    AND e.encounter_datetime BETWEEN mp.period_start AND mp.period_end
-    AND e.active_ind = 'Y'
-    AND p.active_ind = 'Y'
+    AND mc.encounter_count > 0
+    AND mc.active_ind = 'Y'
     AND cd.active_ind = 'Y'
 ),
 
@@ -84,8 +85,13 @@ denominator_exclusions AS (
       AND mo.start_datetime <= i.staging_date
       AND mo.active_ind = 'Y'
     )
-    -- Active tuberculosis
-    OR (c.condition_code LIKE 'A15%' 
+    -- Active tuberculosis (value set: A15*, any code system)
+    OR (cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Active Tuberculosis'
+    )
         AND cd.diagnosis_status = 'ACTIVE'
         AND cd.onset_date <= i.staging_date)
     -- Mixed histology
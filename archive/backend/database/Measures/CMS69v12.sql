@@ -136,7 +136,13 @@ denominator_exclusions AS (
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     CROSS JOIN measurement_period mp
     WHERE 
-        (c.condition_code LIKE 'Z34%' OR c.condition_code LIKE 'O0%' OR c.condition_code LIKE 'Z33%')
+        -- Current pregnancy (value set: Z33*, Z34*, O0*, any code system)
+        cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Current Pregnancy'
+        )
         AND cd.diagnosis_status = 'ACTIVE'
         AND mp.start_date BETWEEN cd.effective_start_date 
             AND COALESCE(cd.effective_end_date, '9999-12-31')
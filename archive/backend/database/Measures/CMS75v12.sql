@@ -1,15 +1,19 @@
 -- Using Inmon 3NF model (phm_edw)
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::date as start_date,
-        '2024-12-31'::date as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 age_at_start AS (
     SELECT 
-        p.patient_id,
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) as age_years
-    FROM phm_edw.patient p
-    CROSS JOIN measurement_period mp
+        mc.patient_id,
+        mc.age_at_start as age_years
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
 ),
 initial_population AS (
     -- Children 1-20 with dental evaluation
@@ -45,8 +49,13 @@ dental_decay AS (
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
     CROSS JOIN measurement_period mp
     WHERE 
-        c.code_system = 'ICD-10'
-        AND c.condition_code LIKE 'K02%'  -- ICD-10 codes for dental caries
+        -- Dental caries (value set: ICD-10 K02*)
+        cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Dental Caries'
+        )
         AND cd.diagnosis_status = 'ACTIVE'
         AND cd.onset_date BETWEEN mp.start_date AND mp.end_date
 )
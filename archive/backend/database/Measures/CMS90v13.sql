@@ -1,13 +1,17 @@
 -- Using Inmon 3NF model (phm_edw)
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::date as start_date,
-        '2024-12-31'::date as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 initial_population AS (
     -- Patients 18+ with heart failure and 2 encounters
     SELECT DISTINCT
-        p.patient_id,
+        mc.patient_id,
         MIN(e1.encounter_datetime) as first_encounter_date,
         MIN(e2.encounter_datetime) as second_encounter_date,
         MIN(cd.onset_date) as hf_diagnosis_date,
@@ -16,16 +20,16 @@ initial_population AS (
         o2.observation_datetime as followup_assessment_date,
         o1.value_numeric as initial_score,
         o2.value_numeric as followup_score
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e1 ON p.patient_id = e1.patient_id
-    JOIN phm_edw.encounter e2 ON p.patient_id = e2.patient_id
-    JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.encounter e1 ON mc.patient_id = e1.patient_id
+    JOIN phm_edw.encounter e2 ON mc.patient_id = e2.patient_id
+    JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    JOIN phm_edw.observation o1 ON p.patient_id = o1.patient_id -- Initial assessment
-    JOIN phm_edw.observation o2 ON p.patient_id = o2.patient_id -- Follow-up assessment
-    CROSS JOIN measurement_period mp
+    JOIN phm_edw.observation o1 ON mc.patient_id = o1.patient_id -- Initial assessment
+    JOIN phm_edw.observation o2 ON mc.patient_id = o2.patient_id -- Follow-up assessment
     WHERE 
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) >= 18
+        mc.age_at_start >= 18
         AND c.condition_code IN ('I50.1', 'I50.2', 'I50.20', 'I50.21', 'I50.22', 'I50.23', 'I50.3', 'I50.30', 'I50.31', 'I50.32', 'I50.33', 'I50.4', 'I50.40', 'I50.41', 'I50.42', 'I50.43', 'I50.8', 'I50.81', 'I50.82', 'I50.83', 'I50.84', 'I50.89', 'I50.9') -- Heart failure ICD-10 codes
         AND cd.diagnosis_status = 'ACTIVE'
         AND e1.encounter_datetime BETWEEN mp.start_date AND mp.end_date
@@ -35,7 +39,7 @@ initial_population AS (
         AND o2.observation_datetime BETWEEN o1.observation_datetime + INTERVAL '30 days' 
             AND o1.observation_datetime + INTERVAL '180 days'
     GROUP BY 
-        p.patient_id, o1.observation_code, o1.observation_datetime, 
+        mc.patient_id, o1.observation_code, o1.observation_datetime, 
         o2.observation_datetime, o1.value_numeric, o2.value_numeric
 ),
 denominator_exclusions AS (
@@ -1,23 +1,32 @@
 -- Using Inmon 3NF model (phm_edw)
+-- Cohorts come from the shared cache (measure_cohorts.py); cohort_period raises
+-- if it was never refreshed for this period or is out of date
 WITH measurement_period AS (
     SELECT 
-        '2024-01-01'::date as start_date,
-        '2024-12-31'::date as end_date
+        period_id,
+        start_date,
+        end_date
+    FROM phm_edw.cohort_period('2024-01-01', '2024-12-31')
 ),
 initial_population AS (
     SELECT DISTINCT
-        p.patient_id,
+        mc.patient_id,
         cd.onset_date as diabetes_diagnosis_date
-    FROM phm_edw.patient p
-    JOIN phm_edw.encounter e ON p.patient_id = e.patient_id
-    JOIN phm_edw.condition_diagnosis cd ON p.patient_id = cd.patient_id
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    JOIN phm_edw.condition_diagnosis cd ON mc.patient_id = cd.patient_id
     JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
-    CROSS JOIN measurement_period mp
     WHERE 
-        DATE_PART('year', AGE(mp.start_date, p.date_of_birth)) BETWEEN 18 AND 75
-        AND c.condition_code LIKE 'E11%' -- Type 2 Diabetes
+        mc.age_at_start BETWEEN 18 AND 75
+        -- Type 2 diabetes (value set: E11*, any code system)
+        AND cd.condition_id IN (
+            SELECT cvs.condition_id
+            FROM phm_edw.condition_value_set cvs
+            JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+            WHERE vs.value_set_name = 'Diabetes Type 2 (Any Code System)'
+        )
         AND cd.diagnosis_status = 'ACTIVE'
-        AND e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
+        AND mc.any_encounter_count > 0
 ),
 denominator_exclusions AS (
     -- ESRD, CKD Stage 5, or hospice care
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Run metrics for assign_providers_by_geo.py.
+
+``RunMetrics`` times named phases and accumulates counters (haversine
+evaluations, provider probes, row counts). At the end of a run it can be
+written as a JSON file and/or as a Prometheus node_exporter textfile-collector
+file, so the nightly job's phase timings can be graphed and alerted on.
+Both files are written to a temp name and renamed into place, so a collector
+never reads a half-written file.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then reported as 0
+    resource = None
+
+METRIC_PREFIX = 'assign_providers'
+
+
+def peak_rss_bytes(who='self'):
+    """Peak resident set size of this process ('self') or its reaped workers ('children')."""
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class RunMetrics:
+    """Phase timings and counters for one assignment run."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block; repeated phases accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        return {
+            'started_at': self.started_at,
+            'finished_at': time.time(),
+            'phase_seconds': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            'counters': dict(self.counters),
+            'peak_rss_bytes': peak_rss_bytes('self'),
+            'peak_worker_rss_bytes': peak_rss_bytes('children'),
+        }
+
+    def print_summary(self):
+        print("\n--- Phase Timings ---")
+        for name, seconds in self.phases.items():
+            print(f"{name}: {seconds:.3f}s")
+        for name, value in self.counters.items():
+            print(f"{name}: {value}")
+        print(f"peak_rss: {peak_rss_bytes('self') / (1024 * 1024):.1f} MiB")
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2) + "\n")
+
+    def write_prometheus(self, path):
+        """Writes gauges in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_phase_seconds Wall time of each phase in the last run.",
+            f"# TYPE {METRIC_PREFIX}_phase_seconds gauge",
+        ]
+        for name, seconds in snapshot['phase_seconds'].items():
+            lines.append(f'{METRIC_PREFIX}_phase_seconds{{phase="{name}"}} {seconds}')
+        for name, value in snapshot['counters'].items():
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {name.replace('_', ' ').capitalize()} in the last run.")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        for name in ('peak_rss_bytes', 'peak_worker_rss_bytes'):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {name.replace('_', ' ').capitalize()} of the last run.")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {snapshot[name]}")
+        lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Unix time the last run finished.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {snapshot['finished_at']:.0f}")
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
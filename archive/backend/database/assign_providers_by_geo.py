@@ -1,79 +1,197 @@
 #!/usr/bin/env python3
 
-import psycopg2
+import argparse
 import os
-from dotenv import load_dotenv
-from haversine import haversine, Unit
 import sys
+import io
+import math
+import time
+from array import array
 from collections import defaultdict
 import itertools # For round-robin provider selection
 
+# The database drivers are only needed by the entry point; the assignment
+# functions below can be imported without them (see bench_assign_providers.py).
+try:
+    import psycopg2
+    from dotenv import load_dotenv
+except ImportError:
+    psycopg2 = None
+
+from assign_metrics import RunMetrics
+from geo_distance import HAVE_NUMPY, nearest_orgs_numpy
+from geo_index import OrgBallTree, nearest_orgs_brute
+from geo_parallel import SHARD_KEYS, compute_nearest_orgs_parallel
+from provider_capacity import CapacityAssigner
+from zip_centroids import ADDRESS_SOURCE, load_zip_centroids
+
 # --- Configuration ---
 MAX_PATIENTS_PER_PROVIDER = 380
+NEAREST_ENGINES = ('balltree', 'numpy', 'brute')
+ASSIGNMENT_ENGINES = ('capacity', 'roundrobin')
+STREAM_ITERSIZE = 20000 # Rows per round trip for the server-side patient cursor
+WRITERS = ('copy', 'executemany')
+COPY_CHUNK_SIZE = 50000 # Assignments per COPY + UPDATE ... FROM commit
+RUN_LOG_SOURCE = 'assign_providers_by_geo' # phm_edw.etl_log.source_system for run history / high-water mark
 
-# --- Load Environment Variables ---
-dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-if not os.path.exists(dotenv_path):
-    print(f"Error: .env file not found at expected location: {dotenv_path}")
-    print("Please ensure the .env file exists in the 'backend' directory with DB credentials.")
-    sys.exit(1)
+# --- Database Connection ---
+def connect_to_database():
+    """Loads DB credentials from backend/.env and opens a connection."""
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+    if not os.path.exists(dotenv_path):
+        print(f"Error: .env file not found at expected location: {dotenv_path}")
+        print("Please ensure the .env file exists in the 'backend' directory with DB credentials.")
+        sys.exit(1)
+
+    load_dotenv(dotenv_path=dotenv_path)
+
+    db_name = os.getenv("DB_DATABASE")
+    db_user = os.getenv("DB_USERNAME")
+    db_password = os.getenv("DB_PASSWORD")
+    db_host = os.getenv("DB_HOST")
+    db_port = os.getenv("DB_PORT")
+
+    if not all([db_name, db_user, db_password, db_host, db_port]):
+        print("Error: Database credentials missing in .env file.")
+        sys.exit(1)
 
-load_dotenv(dotenv_path=dotenv_path)
+    try:
+        conn = psycopg2.connect(
+            dbname=db_name,
+            user=db_user,
+            password=db_password,
+            host=db_host,
+            port=db_port
+        )
+        print("Database connection established.")
+        return conn
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+
+# --- Patient Data ---
+class PatientColumns:
+    """Active patients packed into parallel typed arrays.
+
+    One entry per patient across ``ids`` (int64), ``lat``/``lon`` (float64,
+    NaN when the address is not geocoded), ``zip_index`` (int32 offsets into
+    ``zip_codes``, -1 when there is no ZIP) and ``current_pcp`` (int64, the
+    stored pcp_provider_id or -1). Each distinct ZIP string is stored once, so a
+    patient costs a few dozen bytes instead of a dict and its values.
+    """
 
-DB_NAME = os.getenv("DB_DATABASE")
-DB_USER = os.getenv("DB_USERNAME")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
+    def __init__(self):
+        self.ids = array('q')
+        self.lat = array('d')
+        self.lon = array('d')
+        self.zip_index = array('i')
+        self.current_pcp = array('q')
+        self.zip_codes = []
+        self._zip_lookup = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, patient_id, lat, lon, zip_code, pcp_provider_id=None):
+        self.ids.append(patient_id)
+        self.current_pcp.append(pcp_provider_id if pcp_provider_id is not None else -1)
+        if lat is None or lon is None:
+            self.lat.append(math.nan)
+            self.lon.append(math.nan)
+        else:
+            self.lat.append(float(lat))
+            self.lon.append(float(lon))
+        if zip_code:
+            code = self._zip_lookup.get(zip_code)
+            if code is None:
+                code = len(self.zip_codes)
+                self._zip_lookup[zip_code] = code
+                self.zip_codes.append(zip_code)
+            self.zip_index.append(code)
+        else:
+            self.zip_index.append(-1)
 
-if not all([DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT]):
-    print("Error: Database credentials missing in .env file.")
-    sys.exit(1)
+    def has_location(self, i):
+        return not math.isnan(self.lat[i])
 
-# --- Database Connection ---
-conn = None
-cur = None
-try:
-    conn = psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-    )
-    cur = conn.cursor()
-    print("Database connection established.")
-except psycopg2.Error as e:
-    print(f"Error connecting to database: {e}")
-    sys.exit(1)
+    def location(self, i):
+        return (self.lat[i], self.lon[i])
+
+    def zip_at(self, i):
+        code = self.zip_index[i]
+        return self.zip_codes[code] if code >= 0 else None
 
 # --- Helper Functions ---
-def get_active_patients(cursor):
-    """Fetches active patients with their address details."""
-    query = """
+ACTIVE_PATIENTS_QUERY = """
     SELECT
         p.patient_id,
         a.latitude,
         a.longitude,
-        a.zip
+        a.zip,
+        p.pcp_provider_id
     FROM phm_edw.patient p
     JOIN phm_edw.address a ON p.address_id = a.address_id
     WHERE p.active_ind = 'Y'
-      AND p.address_id IS NOT NULL;
+      AND p.address_id IS NOT NULL
     """
+
+# Incremental selection: patients with no PCP, or whose patient row (e.g. a new
+# address_id) or address row (e.g. re-geocoded coordinates) changed since the
+# last successful run.
+CHANGED_PATIENTS_FILTER = """
+      AND (p.pcp_provider_id IS NULL
+           OR GREATEST(COALESCE(p.updated_date, p.created_date),
+                       COALESCE(a.updated_date, a.created_date)) > %(since)s)
+    """
+
+def pack_patient_rows(rows):
+    """Packs (patient_id, lat, lon, zip, pcp_provider_id) rows into PatientColumns."""
+    patient_data = PatientColumns()
+    for row in rows:
+        patient_data.append(row[0], row[1], row[2], row[3], row[4])
+    return patient_data
+
+def active_patients_query(since=None):
+    """Returns (query, params) for all active patients, or only changed ones when ``since`` is set."""
+    if since is None:
+        return ACTIVE_PATIENTS_QUERY, None
+    return ACTIVE_PATIENTS_QUERY + CHANGED_PATIENTS_FILTER, {'since': since}
+
+def get_active_patients(cursor, since=None):
+    """Fetches active patients with their address details."""
     try:
-        cursor.execute(query)
-        patients = cursor.fetchall()
-        patient_data = [
-            {'id': row[0], 'lat': row[1], 'lon': row[2], 'zip': row[3]}
-            for row in patients
-        ]
+        cursor.execute(*active_patients_query(since))
+        patient_data = pack_patient_rows(cursor.fetchall())
         print(f"Fetched {len(patient_data)} active patients with addresses.")
         return patient_data
     except psycopg2.Error as e:
         print(f"Error fetching patients: {e}")
+        cursor.connection.rollback()
+        return PatientColumns()
+
+def stream_active_patients(conn, itersize=STREAM_ITERSIZE, since=None):
+    """Streams active patients through a server-side cursor into PatientColumns.
+
+    Rows arrive ``itersize`` at a time and are packed straight into the typed
+    arrays, so the full result set never exists as Python rows on the client.
+    """
+    stream_cursor = conn.cursor(name='assign_providers_active_patients')
+    stream_cursor.itersize = itersize
+    try:
+        stream_cursor.execute(*active_patients_query(since))
+        patient_data = pack_patient_rows(stream_cursor)
+        print(f"Streamed {len(patient_data)} active patients with addresses (itersize={itersize}).")
+        return patient_data
+    except psycopg2.Error as e:
+        print(f"Error streaming patients: {e}")
         conn.rollback()
-        return []
+        return PatientColumns()
+    finally:
+        if not stream_cursor.closed:
+            stream_cursor.close()
 
 def get_organization_locations(cursor):
     """Fetches organizations with their address details."""
@@ -98,75 +216,176 @@ def get_organization_locations(cursor):
         return org_data
     except psycopg2.Error as e:
         print(f"Error fetching organizations: {e}")
-        conn.rollback()
+        cursor.connection.rollback()
         return []
 
-def get_active_provider_ids(cursor):
-    """Fetches IDs of all active providers."""
-    query = "SELECT provider_id FROM phm_edw.provider WHERE active_ind = 'Y';"
+def get_active_providers(cursor):
+    """Fetches (provider_id, org_id) for all active providers, ordered by provider_id."""
+    query = "SELECT provider_id, org_id FROM phm_edw.provider WHERE active_ind = 'Y' ORDER BY provider_id;"
     try:
         cursor.execute(query)
-        provider_ids = [row[0] for row in cursor.fetchall()]
-        print(f"Fetched {len(provider_ids)} active provider IDs.")
-        return provider_ids
+        providers = [(row[0], row[1]) for row in cursor.fetchall()]
+        print(f"Fetched {len(providers)} active providers.")
+        return providers
     except psycopg2.Error as e:
-        print(f"Error fetching active provider IDs: {e}")
-        conn.rollback()
+        print(f"Error fetching active providers: {e}")
+        cursor.connection.rollback()
         return []
 
-# --- Main Logic ---
-try:
-    patients = get_active_patients(cur)
-    organizations = get_organization_locations(cur)
-    active_provider_ids = get_active_provider_ids(cur)
+def fill_missing_locations(patients, centroids):
+    """Gives patients without coordinates their ZIP centroid; returns how many were filled."""
+    filled = 0
+    for i in range(len(patients)):
+        if patients.has_location(i):
+            continue
+        centroid = centroids.get(patients.zip_at(i))
+        if centroid is not None:
+            patients.lat[i], patients.lon[i] = centroid
+            filled += 1
+    return filled
+
+# --- Incremental Runs ---
+def get_database_time(cursor):
+    """Returns the server's current local timestamp, used as this run's high-water mark."""
+    cursor.execute("SELECT LOCALTIMESTAMP;")
+    return cursor.fetchone()[0]
+
+def get_assignment_high_water_mark(cursor):
+    """Returns the start time of the last successful assignment run, or None."""
+    query = """
+    SELECT MAX(load_start_timestamp)
+    FROM phm_edw.etl_log
+    WHERE source_system = %s AND load_status = 'SUCCESS';
+    """
+    cursor.execute(query, (RUN_LOG_SOURCE,))
+    return cursor.fetchone()[0]
 
-    if not patients or not organizations or not active_provider_ids:
-        print("Missing required data (patients, organizations with addresses, or active providers). Exiting.")
-        if not patients: print("- No active patients with addresses found.")
-        if not organizations: print("- No organizations with addresses found.")
-        if not active_provider_ids: print("- No active providers found.")
-        sys.exit(0)
+def get_current_provider_load(cursor):
+    """Counts active patients per PCP as currently stored in phm_edw.patient."""
+    query = """
+    SELECT pcp_provider_id, COUNT(*)
+    FROM phm_edw.patient
+    WHERE active_ind = 'Y' AND pcp_provider_id IS NOT NULL
+    GROUP BY pcp_provider_id;
+    """
+    cursor.execute(query)
+    return {row[0]: row[1] for row in cursor.fetchall()}
 
-    provider_load = defaultdict(int)
-    patient_assignments = {}
-    unassigned_patients = []
+def record_assignment_run(conn, run_start, rows_updated, status, error_message=None):
+    """Logs a run to phm_edw.etl_log; SUCCESS rows advance the incremental high-water mark."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO phm_edw.etl_log
+                (source_system, load_start_timestamp, load_end_timestamp, rows_updated, load_status, error_message)
+            VALUES (%s, %s, LOCALTIMESTAMP, %s, %s, %s)
+        """, (RUN_LOG_SOURCE, run_start, rows_updated, status, error_message))
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"Error recording run in phm_edw.etl_log: {e}")
+        conn.rollback()
+    finally:
+        cursor.close()
+
+def compute_nearest_orgs(patients, orgs_with_latlon, engine, metrics=None):
+    """Finds the nearest geocoded org for every patient.
+
+    Returns ``(positions, distances)``: an int64 array of positions in
+    ``orgs_with_latlon`` (-1 for patients without coordinates) and a float64
+    array of distances in miles (inf where there is no position). The 'numpy'
+    engine scores all geocoded patients in one batched kernel call; the other
+    engines look patients up one at a time. Haversine evaluations are counted
+    into ``metrics`` when given.
+    """
+    nearest = array('q', [-1]) * len(patients)
+    distances = array('d', [math.inf]) * len(patients)
+    if not orgs_with_latlon:
+        return nearest, distances
+
+    geocoded = array('q', (i for i in range(len(patients)) if patients.has_location(i)))
+
+    if engine == 'numpy':
+        positions, kernel_distances = nearest_orgs_numpy(
+            array('d', (patients.lat[i] for i in geocoded)),
+            array('d', (patients.lon[i] for i in geocoded)),
+            [float(org['lat']) for org in orgs_with_latlon],
+            [float(org['lon']) for org in orgs_with_latlon],
+        )
+        for i, position, distance in zip(geocoded, positions.tolist(), kernel_distances.tolist()):
+            nearest[i] = position
+            distances[i] = distance
+        if metrics is not None:
+            metrics.count('haversine_evaluations', len(geocoded) * len(orgs_with_latlon))
+        return nearest, distances
+
+    if engine == 'brute':
+        for i in geocoded:
+            distances[i], nearest[i] = nearest_orgs_brute(patients.location(i), orgs_with_latlon)[0]
+        if metrics is not None:
+            metrics.count('haversine_evaluations', len(geocoded) * len(orgs_with_latlon))
+        return nearest, distances
+
+    index = OrgBallTree(orgs_with_latlon)
+    for i in geocoded:
+        distances[i], nearest[i] = index.nearest(patients.location(i))[0]
+    if metrics is not None:
+        metrics.count('haversine_evaluations', index.distance_evaluations)
+    return nearest, distances
+
+def assign_with_capacity(patients, providers, orgs_with_latlon, orgs_by_zip,
+                         nearest_orgs, nearest_distances, assigned_provider, initial_load=None):
+    """Capacity-aware assignment: nearest org with room, least-loaded provider there.
+
+    Geocoded patients are placed closest-first, so when a site fills up it is
+    the patients who live farthest from it that move on to the next site.
+    Patients without coordinates follow in their original order and are matched
+    through their ZIP code. Returns the CapacityAssigner for its load and counters.
+    """
+    assigner = CapacityAssigner(providers, orgs_with_latlon, MAX_PATIENTS_PER_PROVIDER, initial_load)
 
-    # Separate organizations by data availability
-    orgs_with_latlon = [org for org in organizations if org['lat'] is not None and org['lon'] is not None]
-    orgs_by_zip = defaultdict(list)
-    for org in organizations:
-        if org['zip']:
-            orgs_by_zip[org['zip']].append(org)
+    geocoded = sorted((i for i in range(len(patients)) if nearest_orgs[i] >= 0),
+                      key=lambda i: (nearest_distances[i], i))
+    zip_only = (i for i in range(len(patients)) if nearest_orgs[i] < 0)
 
+    processed_count = 0
+    for i in itertools.chain(geocoded, zip_only):
+        processed_count += 1
+        if processed_count % 50000 == 0:
+            print(f"  Processed {processed_count}/{len(patients)} patients...")
+
+        if nearest_orgs[i] >= 0:
+            provider_id = assigner.assign_near(patients.location(i), nearest_orgs[i])
+        else:
+            patient_zip = patients.zip_at(i)
+            if not patient_zip or patient_zip not in orgs_by_zip:
+                continue
+            provider_id = assigner.assign_in_zip(orgs_by_zip[patient_zip])
+        if provider_id is not None:
+            assigned_provider[i] = provider_id
+    return assigner
+
+def assign_round_robin(patients, active_provider_ids, nearest_orgs, orgs_by_zip,
+                       assigned_provider, provider_load, metrics=None):
+    """Original selection: cycles through all active providers, ignoring which org is nearest."""
     # Create a round-robin iterator for active providers
     provider_iterator = itertools.cycle(active_provider_ids)
     # Keep track of providers checked in a full cycle to detect when none are available
     providers_checked_in_cycle = set()
 
-    print(f"\nProcessing {len(patients)} patients...")
+    probes = 0
     processed_count = 0
-    for patient in patients:
+    for i in range(len(patients)):
         processed_count += 1
         if processed_count % 500 == 0: # Adjusted print frequency
             print(f"  Processed {processed_count}/{len(patients)} patients...")
 
-        assigned = False
-        patient_loc = (patient['lat'], patient['lon']) if patient['lat'] is not None and patient['lon'] is not None else None
-        patient_zip = patient['zip']
+        patient_zip = patients.zip_at(i)
         nearest_org_found = False
 
-        # 1. Find nearest organization by Latitude/Longitude
-        if patient_loc and orgs_with_latlon:
-            distances = []
-            for org in orgs_with_latlon:
-                org_loc = (org['lat'], org['lon'])
-                distance = haversine(patient_loc, org_loc, unit=Unit.MILES)
-                distances.append({'org_id': org['id'], 'distance': distance})
-
-            if distances:
-                distances.sort(key=lambda x: x['distance'])
-                # nearest_org_id = distances[0]['org_id'] # We don't strictly need the ID now
-                nearest_org_found = True
+        # 1. Nearest organization by Latitude/Longitude (computed above)
+        if nearest_orgs[i] >= 0:
+            # orgs_with_latlon[nearest_orgs[i]] is not used for provider choice yet
+            nearest_org_found = True
 
         # 2. Find nearest organization by ZIP code (if not found by distance or patient lacks lat/lon)
         if not nearest_org_found and patient_zip and patient_zip in orgs_by_zip:
@@ -176,108 +395,466 @@ try:
         # 3. Assign an available active provider (if a nearest org was conceptually found)
         if nearest_org_found:
             # Try to find an active provider under the cap using round-robin
-            initial_provider_cycle_count = len(providers_checked_in_cycle)
             while len(providers_checked_in_cycle) < len(active_provider_ids):
                 potential_provider_id = next(provider_iterator)
                 providers_checked_in_cycle.add(potential_provider_id)
+                probes += 1
 
                 if provider_load[potential_provider_id] < MAX_PATIENTS_PER_PROVIDER:
                     # Assign this provider
-                    patient_assignments[patient['id']] = potential_provider_id
+                    assigned_provider[i] = potential_provider_id
                     provider_load[potential_provider_id] += 1
-                    assigned = True
-                    providers_checked_in_cycle.clear() # Reset for next patient
                     break # Move to next patient
 
-            # If we completed a full cycle without finding a provider under the cap
-            if not assigned:
-                 providers_checked_in_cycle.clear() # Reset for next patient anyway
-                 # print(f"  Patient {patient['id']} found nearest org, but no active provider under cap available.")
+            # Reset for next patient, whether or not a provider under the cap was found
+            providers_checked_in_cycle.clear()
 
+    if metrics is not None:
+        metrics.count('provider_probes', probes)
 
-        if not assigned:
-            unassigned_patients.append(patient['id'])
-            # print(f"  Could not assign patient {patient['id']} (nearest org found: {nearest_org_found})")
+# --- Assignment Pipeline ---
+def split_organizations(organizations):
+    """Returns (orgs_with_latlon, orgs_by_zip) from the fetched organization list."""
+    orgs_with_latlon = [org for org in organizations if org['lat'] is not None and org['lon'] is not None]
+    orgs_by_zip = defaultdict(list)
+    for org in organizations:
+        if org['zip']:
+            orgs_by_zip[org['zip']].append(org)
+    return orgs_with_latlon, orgs_by_zip
+
+def find_nearest_sites(patients, orgs_with_latlon, nearest='balltree', workers=1, shard_by='zip3',
+                       metrics=None):
+    """Nearest-site phase; returns (positions, distances) as from compute_nearest_orgs."""
+    if workers > 1:
+        return compute_nearest_orgs_parallel(patients, orgs_with_latlon, nearest, workers, shard_by, metrics)
+    return compute_nearest_orgs(patients, orgs_with_latlon, nearest, metrics)
+
+def select_providers(patients, providers, orgs_with_latlon, orgs_by_zip, nearest_orgs,
+                     nearest_distances, engine='capacity', initial_load=None, metrics=None):
+    """Provider-selection phase.
+
+    Returns ``(assigned_provider, provider_load)``: an int64 provider id per
+    patient (-1 = unassigned) and the resulting panel size per provider,
+    including ``initial_load``.
+    """
+    # Provider per patient, parallel to patients.ids; -1 = unassigned
+    assigned_provider = array('q', [-1]) * len(patients)
+    if engine == 'capacity':
+        assigner = assign_with_capacity(patients, providers, orgs_with_latlon, orgs_by_zip,
+                                        nearest_orgs, nearest_distances, assigned_provider,
+                                        initial_load=initial_load)
+        print(f"Capacity engine: {assigner.heap_operations} heap operations, "
+              f"{assigner.fallback_assignments} patients placed through the global fallback.")
+        if metrics is not None:
+            metrics.count('provider_probes', assigner.provider_probes)
+            metrics.count('heap_operations', assigner.heap_operations)
+            metrics.count('haversine_evaluations', assigner.distance_evaluations)
+        return assigned_provider, assigner.load
 
-    print(f"\nAssignment phase complete. {len(patient_assignments)} patients assigned.")
-    print(f"{len(unassigned_patients)} patients could not be assigned.")
+    provider_load = defaultdict(int)
+    if initial_load:
+        provider_load.update(initial_load)
+    active_provider_ids = [provider_id for provider_id, _ in providers]
+    assign_round_robin(patients, active_provider_ids, nearest_orgs, orgs_by_zip,
+                       assigned_provider, provider_load, metrics)
+    return assigned_provider, provider_load
 
-    # --- Update Database ---
-    if patient_assignments:
-        print("\nUpdating patient records in the database...")
-        update_count = 0
-        update_errors = 0
-        try:
-            # Use executemany for potential efficiency
-            update_data = list(patient_assignments.items())
-            update_query = "UPDATE phm_edw.patient SET pcp_provider_id = %s WHERE patient_id = %s"
-
-            # Reorder data for executemany: list of (provider_id, patient_id) tuples
-            update_tuples = [(prov_id, pat_id) for pat_id, prov_id in update_data]
-
-            # Execute in batches if needed, though psycopg2 might handle large ones
-            # For simplicity, executing all at once here. Consider batching for very large datasets.
-            cur.executemany(update_query, update_tuples)
-            update_count = len(update_tuples)
-
-            conn.commit()
-            print(f"Successfully updated {update_count} patient records.")
-        except psycopg2.Error as e:
-            print(f"Error updating database: {e}")
-            conn.rollback()
-            # Cannot easily determine partial success with executemany rollback
-            update_errors = len(patient_assignments)
-            update_count = 0
-            print("Database transaction rolled back due to error.")
-        finally:
-             print(f"Database update summary: Attempted={len(patient_assignments)}, Success={update_count}, Errors={update_errors}.")
-
-    else:
-        print("\nNo assignments made, skipping database update.")
-
-    # --- Final Report ---
-    print("\n--- Final Provider Load ---")
-    assigned_provider_count = 0
-    providers_at_max = 0
-
-    # Sort providers by ID for consistent reporting
-    sorted_provider_ids = sorted([pid for pid, count in provider_load.items() if count > 0])
-
-    for provider_id in sorted_provider_ids:
-        count = provider_load[provider_id]
-        print(f"Provider ID {provider_id}: {count} patients")
-        assigned_provider_count += 1
-        if count == MAX_PATIENTS_PER_PROVIDER:
-            providers_at_max += 1
-
-    print("\n--- Summary ---")
-    print(f"Total Patients Processed: {len(patients)}")
-    print(f"Total Patients Assigned: {len(patient_assignments)}")
-    print(f"Total Patients Unassigned: {len(unassigned_patients)}")
-    print(f"Total Providers Assigned Patients: {assigned_provider_count} / {len(active_provider_ids)}")
-    print(f"Providers Reaching Max ({MAX_PATIENTS_PER_PROVIDER}): {providers_at_max}")
-
-    if unassigned_patients:
-        print(f"\nUnassigned Patient IDs ({len(unassigned_patients)}):")
-        # Print only a sample if too many
-        if len(unassigned_patients) > 50:
-            print(unassigned_patients[:50], "...")
-        else:
-            print(unassigned_patients)
+def iter_assignments(patients, assigned_provider, changed_only=False):
+    """Yields (provider_id, patient_id) pairs for every assigned patient.
+
+    With ``changed_only``, patients whose stored PCP already matches are skipped.
+    """
+    for i, provider_id in enumerate(assigned_provider):
+        if provider_id >= 0 and not (changed_only and provider_id == patients.current_pcp[i]):
+            yield (provider_id, patients.ids[i])
+
+def iter_released(patients, assigned_provider):
+    """Yields ids of patients who had a stored PCP but were left unassigned this run."""
+    for i, provider_id in enumerate(assigned_provider):
+        if provider_id < 0 and patients.current_pcp[i] >= 0:
+            yield patients.ids[i]
+
+# --- Write-back ---
+def clear_pcp_assignments(conn, patient_ids):
+    """Clears the stored PCP of the given patients in one transaction.
+
+    Incremental runs release a reselected patient's slot before selection, so
+    a patient left unassigned must not keep counting against that panel.
+    Returns (cleared, errors).
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE phm_edw.patient SET pcp_provider_id = NULL WHERE patient_id = ANY(%s)",
+            (list(patient_ids),)
+        )
+        cleared = cursor.rowcount
+        conn.commit()
+        return cleared, 0
+    except psycopg2.Error as e:
+        print(f"Error clearing PCP assignments: {e}")
+        conn.rollback()
+        return 0, len(patient_ids)
+    finally:
+        cursor.close()
 
+def write_assignments_executemany(conn, update_tuples, attempted):
+    """Applies assignments with one UPDATE per patient in a single transaction.
 
-except Exception as e:
-    print(f"\nAn unexpected error occurred: {e}")
-    import traceback
-    traceback.print_exc() # Print full traceback for debugging
-    if conn:
+    Returns (updated, errors).
+    """
+    cursor = conn.cursor()
+    try:
+        # Use executemany for potential efficiency
+        update_query = "UPDATE phm_edw.patient SET pcp_provider_id = %s WHERE patient_id = %s"
+        cursor.executemany(update_query, update_tuples)
+        conn.commit()
+        print(f"Successfully updated {attempted} patient records.")
+        return attempted, 0
+    except psycopg2.Error as e:
+        print(f"Error updating database: {e}")
         conn.rollback()
-finally:
-    # --- Close Connection ---
-    if cur:
-        cur.close()
-    if conn:
-        conn.close()
-        print("\nDatabase connection closed.")
-
-print("\nScript finished.")
+        # Cannot easily determine partial success with executemany rollback
+        print("Database transaction rolled back due to error.")
+        return 0, attempted
+    finally:
+        cursor.close()
+
+def format_copy_rows(chunk):
+    """Renders (provider_id, patient_id) pairs as COPY text rows (patient_id, pcp_provider_id)."""
+    buffer = io.StringIO()
+    for provider_id, patient_id in chunk:
+        buffer.write(f"{patient_id}\t{provider_id}\n")
+    buffer.seek(0)
+    return buffer
+
+def write_assignments_copy(conn, update_tuples, attempted, chunk_size=COPY_CHUNK_SIZE):
+    """COPYs assignments into a temp table and applies each chunk with one UPDATE ... FROM.
+
+    Every chunk is committed on its own, so a failure only rolls back that
+    chunk; earlier chunks stay applied. Returns (updated, errors).
+    """
+    cursor = conn.cursor()
+    updated = 0
+    errors = 0
+    total_chunks = (attempted + chunk_size - 1) // chunk_size
+    write_start = time.perf_counter()
+    try:
+        # ON COMMIT DELETE ROWS empties the staging table after every chunk commit
+        cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS tmp_pcp_assignment (
+                patient_id      INT NOT NULL,
+                pcp_provider_id INT NOT NULL
+            ) ON COMMIT DELETE ROWS
+        """)
+        conn.commit()
+
+        chunk_number = 0
+        while True:
+            chunk = list(itertools.islice(update_tuples, chunk_size))
+            if not chunk:
+                break
+            chunk_number += 1
+            chunk_start = time.perf_counter()
+            buffer = format_copy_rows(chunk)
+            try:
+                cursor.copy_expert(
+                    "COPY tmp_pcp_assignment (patient_id, pcp_provider_id) FROM STDIN", buffer
+                )
+                cursor.execute("ANALYZE tmp_pcp_assignment")
+                cursor.execute("""
+                    UPDATE phm_edw.patient p
+                    SET pcp_provider_id = t.pcp_provider_id
+                    FROM tmp_pcp_assignment t
+                    WHERE p.patient_id = t.patient_id
+                """)
+                conn.commit()
+                updated += len(chunk)
+                elapsed = time.perf_counter() - chunk_start
+                rate = len(chunk) / elapsed if elapsed > 0 else float('inf')
+                print(f"  Chunk {chunk_number}/{total_chunks}: {len(chunk)} rows in {elapsed:.2f}s "
+                      f"({rate:,.0f} rows/sec) - {updated}/{attempted} applied")
+            except psycopg2.Error as e:
+                print(f"  Chunk {chunk_number}/{total_chunks}: error updating database: {e}")
+                conn.rollback()
+                errors += len(chunk)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - write_start
+    rate = updated / elapsed if elapsed > 0 else float('inf')
+    print(f"Successfully updated {updated} patient records in {elapsed:.2f}s ({rate:,.0f} rows/sec).")
+    return updated, errors
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Assign active patients a PCP based on proximity to organizations."
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ASSIGNMENT_ENGINES,
+        default="capacity",
+        help="Provider selection: 'capacity' picks the least-loaded provider at the nearest "
+             "organization with room (default); 'roundrobin' cycles through all active providers."
+    )
+    parser.add_argument(
+        "--nearest",
+        choices=NEAREST_ENGINES,
+        default="balltree",
+        help="Nearest-organization search: 'balltree' spatial index (default), "
+             "'numpy' batched haversine kernel, or 'brute' pure-Python reference scan."
+    )
+    parser.add_argument(
+        "--zip-centroids",
+        default=ADDRESS_SOURCE,
+        metavar="SOURCE",
+        help="ZIP centroids for patients without coordinates: 'address' averages geocoded "
+             "phm_edw.address rows (default), a path reads a zip,latitude,longitude CSV, "
+             "'none' keeps the ZIP exact-match fallback only. Cached in zip_centroids.cache."
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only (re)assign patients without a PCP or whose address changed since the last "
+             "successful run; other panels are kept and only changed rows are written."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes for the nearest-organization search (default 1). Above 1, patients are "
+             "sharded and searched in parallel; assignments are the same for any worker count."
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_KEYS,
+        default="zip3",
+        help="How --workers splits patients: 'zip3' ZIP prefix (default) or 'tile' 1-degree lat/lon tile."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream patients through a server-side cursor into compact arrays instead of fetchall()."
+    )
+    parser.add_argument(
+        "--itersize",
+        type=int,
+        default=STREAM_ITERSIZE,
+        help=f"Rows fetched per round trip in --stream mode (default {STREAM_ITERSIZE})."
+    )
+    parser.add_argument(
+        "--writer",
+        choices=WRITERS,
+        default="copy",
+        help="Write-back method: 'copy' into a temp table + UPDATE ... FROM (default), "
+             "or 'executemany' with one UPDATE per patient."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=COPY_CHUNK_SIZE,
+        help=f"Assignments per COPY chunk and commit in --writer copy mode (default {COPY_CHUNK_SIZE})."
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write phase timings, counters and peak RSS of the run to a JSON file."
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="PATH",
+        help="Write the same metrics for the Prometheus node_exporter textfile collector "
+             "(e.g. /var/lib/node_exporter/textfile_collector/assign_providers.prom)."
+    )
+    args = parser.parse_args(argv)
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size must be positive")
+    if args.zip_centroids not in (ADDRESS_SOURCE, 'none') and not os.path.exists(args.zip_centroids):
+        parser.error(f"--zip-centroids file not found: {args.zip_centroids}")
+    if args.nearest == 'numpy' and not HAVE_NUMPY:
+        parser.error("--nearest numpy requires numpy to be installed")
+    return args
+
+# --- Main Logic ---
+def write_metrics(metrics, args):
+    """Prints the phase summary and writes the requested metrics files."""
+    metrics.print_summary()
+    for path, writer in ((args.metrics_json, metrics.write_json), (args.metrics_prom, metrics.write_prometheus)):
+        if not path:
+            continue
+        try:
+            writer(path)
+            print(f"Metrics written to {path}.")
+        except OSError as e:
+            print(f"Error writing metrics to {path}: {e}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics = RunMetrics()
+    conn = connect_to_database()
+    cur = conn.cursor()
+    try:
+        run_start = get_database_time(cur)
+        since = None
+        if args.incremental:
+            since = get_assignment_high_water_mark(cur)
+            if since is None:
+                print("Incremental run: no previous successful run recorded, selecting all active patients.")
+            else:
+                print(f"Incremental run: selecting patients without a PCP or changed since {since}.")
+
+        with metrics.phase('fetch_patients'):
+            if args.stream:
+                patients = stream_active_patients(conn, args.itersize, since)
+            else:
+                patients = get_active_patients(cur, since)
+        with metrics.phase('fetch_organizations'):
+            organizations = get_organization_locations(cur)
+        with metrics.phase('fetch_providers'):
+            providers = get_active_providers(cur)
+        metrics.count('patients', len(patients))
+        active_provider_ids = [provider_id for provider_id, _ in providers]
+
+        if args.incremental and not patients and organizations and active_provider_ids:
+            print("No new or changed patients to assign.")
+            record_assignment_run(conn, run_start, 0, 'SUCCESS')
+            return
+
+        if not patients or not organizations or not active_provider_ids:
+            print("Missing required data (patients, organizations with addresses, or active providers). Exiting.")
+            if not patients: print("- No active patients with addresses found.")
+            if not organizations: print("- No organizations with addresses found.")
+            if not active_provider_ids: print("- No active providers found.")
+            return
+
+        initial_load = None
+        if args.incremental:
+            # Start from the stored panels, minus the patients about to be reassigned
+            initial_load = defaultdict(int, get_current_provider_load(cur))
+            for pcp in patients.current_pcp:
+                if pcp >= 0:
+                    initial_load[pcp] -= 1
+            print(f"Seeded provider load from {sum(initial_load.values())} existing assignments.")
+
+        if args.zip_centroids != 'none':
+            with metrics.phase('zip_centroids'):
+                centroids = load_zip_centroids(args.zip_centroids, cur)
+                filled = fill_missing_locations(patients, centroids)
+            print(f"Located {filled} patients without coordinates by ZIP centroid ({len(centroids)} ZIPs).")
+
+        # Separate organizations by data availability
+        orgs_with_latlon, orgs_by_zip = split_organizations(organizations)
+
+        print(f"Finding nearest organization ({args.nearest}) over {len(orgs_with_latlon)} geocoded organizations...")
+        with metrics.phase('nearest_site'):
+            nearest_orgs, nearest_distances = find_nearest_sites(
+                patients, orgs_with_latlon, args.nearest, args.workers, args.shard_by, metrics
+            )
+
+        print(f"\nProcessing {len(patients)} patients ({args.engine})...")
+        with metrics.phase('provider_selection'):
+            assigned_provider, provider_load = select_providers(
+                patients, providers, orgs_with_latlon, orgs_by_zip, nearest_orgs, nearest_distances,
+                args.engine, initial_load, metrics
+            )
+        assigned_count = 0
+        unassigned_patients = array('q')
+        for i in range(len(patients)):
+            if assigned_provider[i] >= 0:
+                assigned_count += 1
+            else:
+                unassigned_patients.append(patients.ids[i])
+
+        metrics.count('assigned', assigned_count)
+        print(f"\nAssignment phase complete. {assigned_count} patients assigned.")
+        print(f"{len(unassigned_patients)} patients could not be assigned.")
+
+        # --- Update Database ---
+        # Incremental runs only write patients whose PCP actually changes
+        write_count = sum(1 for _ in iter_assignments(patients, assigned_provider, args.incremental))
+        update_count, update_errors = 0, 0
+        if args.incremental and assigned_count:
+            print(f"{assigned_count - write_count} assignments match the stored PCP and are not rewritten.")
+        if write_count:
+            print(f"\nUpdating patient records in the database ({args.writer})...")
+            # (provider_id, patient_id) tuples are generated on demand from the arrays
+            update_tuples = iter_assignments(patients, assigned_provider, args.incremental)
+            with metrics.phase('write_back'):
+                if args.writer == 'copy':
+                    update_count, update_errors = write_assignments_copy(conn, update_tuples, write_count, args.chunk_size)
+                else:
+                    update_count, update_errors = write_assignments_executemany(conn, update_tuples, write_count)
+            metrics.count('rows_written', update_count)
+            metrics.count('write_errors', update_errors)
+            print(f"Database update summary: Attempted={write_count}, Success={update_count}, Errors={update_errors}.")
+
+        else:
+            print("\nNo assignments to write, skipping database update.")
+
+        if args.incremental:
+            # Their stored slot was freed for this run; keeping the PCP would overfill the panel
+            released = array('q', iter_released(patients, assigned_provider))
+            if released:
+                cleared, clear_errors = clear_pcp_assignments(conn, released)
+                metrics.count('pcp_cleared', cleared)
+                update_count += cleared
+                update_errors += clear_errors
+                print(f"Cleared the stored PCP of {cleared} reselected patients left unassigned.")
+
+        if update_errors:
+            record_assignment_run(conn, run_start, update_count, 'FAILURE', f"{update_errors} assignments failed to write")
+        else:
+            record_assignment_run(conn, run_start, update_count, 'SUCCESS')
+
+        # --- Final Report ---
+        print("\n--- Final Provider Load ---")
+        assigned_provider_count = 0
+        providers_at_max = 0
+
+        # Sort providers by ID for consistent reporting
+        sorted_provider_ids = sorted([pid for pid, count in provider_load.items() if count > 0])
+
+        for provider_id in sorted_provider_ids:
+            count = provider_load[provider_id]
+            print(f"Provider ID {provider_id}: {count} patients")
+            assigned_provider_count += 1
+            if count >= MAX_PATIENTS_PER_PROVIDER:
+                providers_at_max += 1
+
+        print("\n--- Summary ---")
+        print(f"Total Patients Processed: {len(patients)}")
+        print(f"Total Patients Assigned: {assigned_count}")
+        print(f"Total Patients Unassigned: {len(unassigned_patients)}")
+        print(f"Total Providers Assigned Patients: {assigned_provider_count} / {len(active_provider_ids)}")
+        print(f"Providers Reaching Max ({MAX_PATIENTS_PER_PROVIDER}): {providers_at_max}")
+
+        if unassigned_patients:
+            print(f"\nUnassigned Patient IDs ({len(unassigned_patients)}):")
+            # Print only a sample if too many
+            if len(unassigned_patients) > 50:
+                print(unassigned_patients[:50].tolist(), "...")
+            else:
+                print(unassigned_patients.tolist())
+
+
+    except Exception as e:
+        print(f"\nAn unexpected error occurred: {e}")
+        import traceback
+        traceback.print_exc() # Print full traceback for debugging
+        if conn:
+            conn.rollback()
+    finally:
+        # --- Close Connection ---
+        if cur:
+            cur.close()
+        if conn:
+            conn.close()
+            print("\nDatabase connection closed.")
+        write_metrics(metrics, args)
+
+    print("\nScript finished.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark for assign_providers_by_geo.py on synthetic data.
+
+Generates patients, organizations and providers clustered around a set of
+US metro areas and runs the assignment pipeline through its importable
+functions, without psycopg2 or a database. Each phase is timed separately:
+
+    fetch           packing cursor-shaped rows into PatientColumns
+    nearest-site    find_nearest_sites
+    selection       select_providers
+    write-back      rendering the COPY payload (client side only; the
+                    server-side UPDATE is not part of the benchmark)
+
+For every phase the report shows wall time, the process peak RSS at the end
+of the phase, and patients per second. Each scale runs in a fresh process so
+peak RSS is not inherited from a previous, larger run.
+
+    python bench_assign_providers.py --patients 10000 --patients 1000000 --nearest numpy
+"""
+
+import argparse
+import itertools
+import json
+import random
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from assign_providers_by_geo import (
+    ASSIGNMENT_ENGINES, COPY_CHUNK_SIZE, MAX_PATIENTS_PER_PROVIDER, NEAREST_ENGINES,
+    find_nearest_sites, format_copy_rows, iter_assignments, pack_patient_rows,
+    select_providers, split_organizations,
+)
+from geo_distance import HAVE_NUMPY
+from geo_parallel import SHARD_KEYS
+
+DEFAULT_SCALES = (10000, 100000)
+MAX_SCALE = 5000000
+PHASES = ('fetch', 'nearest-site', 'selection', 'write-back')
+
+# (latitude, longitude, ZIP3) of the metro areas synthetic addresses cluster around.
+METROS = (
+    (40.71, -74.01, '100'), (34.05, -118.24, '900'), (41.88, -87.63, '606'),
+    (29.76, -95.37, '770'), (33.45, -112.07, '850'), (39.95, -75.17, '191'),
+    (29.42, -98.49, '782'), (32.72, -117.16, '921'), (32.78, -96.80, '752'),
+    (37.34, -121.89, '951'), (30.27, -97.74, '787'), (39.77, -86.16, '462'),
+    (40.44, -79.99, '152'), (47.61, -122.33, '981'), (39.74, -104.99, '802'),
+    (42.36, -71.06, '021'), (36.16, -86.78, '372'), (35.23, -80.84, '282'),
+    (44.98, -93.27, '554'), (25.76, -80.19, '331'),
+)
+
+# Share of synthetic patients whose address has no coordinates.
+UNGEOCODED_RATE = 0.08
+
+
+# --- Synthetic data ---
+def synthetic_address(rng):
+    """Returns (lat, lon, zip) scattered around a random metro."""
+    lat, lon, zip3 = METROS[rng.randrange(len(METROS))]
+    return (lat + rng.gauss(0.0, 0.35), lon + rng.gauss(0.0, 0.45), f"{zip3}{rng.randrange(100):02d}")
+
+
+def generate_organizations(n_orgs, seed=0):
+    rng = random.Random(seed)
+    orgs = []
+    for org_id in range(1, n_orgs + 1):
+        lat, lon, zip_code = synthetic_address(rng)
+        orgs.append({'id': org_id, 'lat': lat, 'lon': lon, 'zip': zip_code})
+    return orgs
+
+
+def generate_providers(n_providers, organizations, seed=0):
+    """Returns (provider_id, org_id) pairs; one in twenty providers has no org."""
+    rng = random.Random(seed + 1)
+    return [
+        (provider_id, None if provider_id % 20 == 0 else organizations[rng.randrange(len(organizations))]['id'])
+        for provider_id in range(1, n_providers + 1)
+    ]
+
+
+def iter_patient_rows(n_patients, seed=0):
+    """Yields rows shaped like ACTIVE_PATIENTS_QUERY results."""
+    rng = random.Random(seed + 2)
+    for patient_id in range(1, n_patients + 1):
+        lat, lon, zip_code = synthetic_address(rng)
+        if rng.random() < UNGEOCODED_RATE:
+            lat = lon = None
+        yield (patient_id, lat, lon, zip_code, None)
+
+
+# --- Measurement ---
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scale(n_patients, n_orgs, n_providers, nearest, engine, workers, shard_by, seed=0):
+    """Runs every phase once at one scale; returns a result dict."""
+    organizations = generate_organizations(n_orgs, seed)
+    providers = generate_providers(n_providers, organizations, seed)
+    orgs_with_latlon, orgs_by_zip = split_organizations(organizations)
+    phases = {}
+
+    def record(phase, start):
+        elapsed = time.perf_counter() - start
+        phases[phase] = {
+            'seconds': round(elapsed, 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'patients_per_sec': round(n_patients / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    start = time.perf_counter()
+    patients = pack_patient_rows(iter_patient_rows(n_patients, seed))
+    record('fetch', start)
+
+    start = time.perf_counter()
+    nearest_orgs, nearest_distances = find_nearest_sites(patients, orgs_with_latlon, nearest, workers, shard_by)
+    record('nearest-site', start)
+
+    start = time.perf_counter()
+    assigned_provider, _ = select_providers(patients, providers, orgs_with_latlon, orgs_by_zip,
+                                            nearest_orgs, nearest_distances, engine)
+    record('selection', start)
+
+    start = time.perf_counter()
+    update_tuples = iter_assignments(patients, assigned_provider)
+    payload_bytes = 0
+    while True:
+        chunk = list(itertools.islice(update_tuples, COPY_CHUNK_SIZE))
+        if not chunk:
+            break
+        payload_bytes += len(format_copy_rows(chunk).getvalue())
+    record('write-back', start)
+
+    assigned = sum(1 for provider_id in assigned_provider if provider_id >= 0)
+    total = sum(phase['seconds'] for phase in phases.values())
+    return {
+        'patients': n_patients,
+        'organizations': n_orgs,
+        'providers': n_providers,
+        'nearest': nearest,
+        'engine': engine,
+        'workers': workers,
+        'assigned': assigned,
+        'copy_payload_bytes': payload_bytes,
+        'total_seconds': round(total, 4),
+        'assignments_per_sec': round(assigned / total, 1) if total > 0 else None,
+        'phases': phases,
+    }
+
+
+def print_result(result):
+    print(f"\n--- {result['patients']:,} patients, {result['organizations']:,} orgs, "
+          f"{result['providers']:,} providers ({result['nearest']}, {result['engine']}, "
+          f"{result['workers']} workers) ---")
+    print(f"{'Phase':<14}{'Wall (s)':>10}{'Peak RSS (MiB)':>16}{'Patients/sec':>15}")
+    for phase in PHASES:
+        stats = result['phases'][phase]
+        rate = f"{stats['patients_per_sec']:,.0f}" if stats['patients_per_sec'] else '-'
+        print(f"{phase:<14}{stats['seconds']:>10.3f}{stats['peak_rss_mb']:>16.1f}{rate:>15}")
+    print(f"Assigned {result['assigned']:,}/{result['patients']:,} in {result['total_seconds']:.3f}s "
+          f"({result['assignments_per_sec']:,.0f} assignments/sec).")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark patient-to-provider geo assignment on synthetic data (no database)."
+    )
+    parser.add_argument("--patients", type=int, action="append",
+                        help=f"Patients per run; repeat for several scales (default {', '.join(map(str, DEFAULT_SCALES))}).")
+    parser.add_argument("--orgs", type=int, default=None,
+                        help="Organizations per run (default: one per 2,000 patients, at least 20).")
+    parser.add_argument("--providers", type=int, default=None,
+                        help=f"Providers per run (default: enough for the patients at {MAX_PATIENTS_PER_PROVIDER} "
+                             "each, plus 20%%).")
+    parser.add_argument("--nearest", choices=NEAREST_ENGINES, default="balltree",
+                        help="Nearest-organization engine (default balltree).")
+    parser.add_argument("--engine", choices=ASSIGNMENT_ENGINES, default="capacity",
+                        help="Provider selection engine (default capacity).")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for the nearest-site phase.")
+    parser.add_argument("--shard-by", choices=SHARD_KEYS, default="zip3", help="Shard key for --workers > 1.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to a JSON file.")
+    args = parser.parse_args(argv)
+    args.patients = args.patients or list(DEFAULT_SCALES)
+    for n_patients in args.patients:
+        if not 1 <= n_patients <= MAX_SCALE:
+            parser.error(f"--patients must be between 1 and {MAX_SCALE:,}")
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    if args.nearest == 'numpy' and not HAVE_NUMPY:
+        parser.error("--nearest numpy requires numpy to be installed")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for n_patients in args.patients:
+        n_orgs = args.orgs or max(20, n_patients // 2000)
+        n_providers = args.providers or max(1, int(n_patients * 1.2) // MAX_PATIENTS_PER_PROVIDER)
+        print(f"\nRunning {n_patients:,} patients...")
+        # A fresh process per scale keeps peak RSS specific to that scale
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_scale, n_patients, n_orgs, n_providers, args.nearest,
+                                 args.engine, args.workers, args.shard_by, args.seed).result()
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'max_patients_per_provider': MAX_PATIENTS_PER_PROVIDER, 'runs': results}, f, indent=2)
+        print(f"\nResults written to {args.json}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Measures/ eCQM scripts on a synthetic phm_edw population.
+
+For each scale (--patients), the phm_edw clinical tables of the target
+database are replaced with a generated population, and every measure's
+summary statement (as measure_runner.py runs it) is then executed against
+it on a single connection:
+
+    generate        patients, encounters, condition_diagnosis, observation and
+                    procedure_performed rows, built server side with
+                    INSERT ... SELECT (setseed makes a seed reproducible)
+    cache refresh   the cohort cache and value set membership the scripts read
+    measures        one EXPLAIN (ANALYZE, BUFFERS) run per measure, which also
+                    warms the cache, then --repeat timed runs
+
+The code vocabulary comes from the measure definitions: codes cited in the
+measures_load.csv criteria (E11.x, Z51.5, 4548-4, 99241 ...) and the code
+literals of the Measures/ scripts, so every measure finds patients. Each
+code's patient prevalence follows CONDITION_PREVALENCE, OBSERVATION_PREVALENCE
+and PROCEDURE_PREVALENCE (split between the codes sharing a prefix), and
+HbA1c results are mostly drawn for diabetic patients. Medication orders are
+not generated.
+
+For every measure the report records median and minimum latency, buffer
+counters and planning/execution time from the analyzed plan, and the
+normalized result counts. With --compare the runs are checked against an
+earlier report of the same scale: slower measures, more buffer traffic,
+changed counts and new failures are listed and the exit status is 1.
+
+Generation TRUNCATEs the phm_edw patient, condition, procedure and
+measure_period tables with CASCADE, so it needs a database of its own
+(created from phm-edw-ddl.sql and phm-star-ddl.sql); without --patients the
+measures run against the data already in the database.
+
+    python bench_measures.py --database medgnosis_bench --patients 10000 --patients 1000000 --json bench.json
+    python bench_measures.py --database medgnosis_bench --patients 100000 --compare bench.json
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+import etl_explain
+import value_sets
+from care_gaps import error_summary
+from measure_runner import (
+    DEFAULT_STATEMENT_TIMEOUT, MeasureScript, connect_kwargs, discover_measures, normalize, refresh_shared_caches,
+)
+
+DEFAULT_SCALES = (10000, 100000)
+MAX_SCALE = 5000000
+DEFAULT_REPEAT = 3
+DEFAULT_VISITS = 5                  # Mean encounters per patient over the generated years
+DEFAULT_THRESHOLD = 0.20            # --compare: relative increase that counts as a regression
+MIN_REGRESSION_SECONDS = 0.005      # --compare: latency changes below this are noise
+GENERATED_START = datetime.date(2023, 1, 1)
+GENERATED_END = datetime.date(2025, 12, 31)
+MEASURES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "measures_load.csv")
+CRITERIA_COLUMNS = ('denominator_criteria', 'numerator_criteria', 'exclusion_criteria', 'denominator_exception')
+
+# Codes in the criteria text: ICD-10 (E11.x, Z51.5), LOINC (4548-4) and CPT (99241).
+CRITERIA_CODE = re.compile(r"\b([A-Z]\d{2}(?:\.[0-9A-Zx]+)?|\d{3,5}-\d|\d{5})\b")
+# Code literals in the scripts: condition_code LIKE 'E11%', observation_code IN ('4548-4', ...).
+SCRIPT_CODE = re.compile(
+    r"\b(condition_code|observation_code|procedure_code|encounter_type)\s*"
+    r"(?:=\s*'([^']*)'|IN\s*\(([^)]*)\)|LIKE\s*'([^']*)')", re.IGNORECASE)
+CODE_TOKEN = re.compile(r"[A-Z0-9][A-Za-z0-9.\-]*%?")
+SCRIPT_KINDS = {
+    'condition_code': 'condition', 'observation_code': 'observation',
+    'procedure_code': 'procedure', 'encounter_type': 'encounter_type',
+}
+
+# Share of patients with a diagnosis, by code prefix. The prevalence of a
+# prefix is split between the vocabulary codes it matches; other codes get
+# DEFAULT_CONDITION_PREVALENCE each.
+CONDITION_PREVALENCE = {
+    'I10': 0.30, 'E78': 0.25, 'E66': 0.12, 'E11': 0.11, 'N40': 0.08, 'J45': 0.08, 'F32': 0.07,
+    'I25': 0.06, 'J44': 0.05, 'N18': 0.05, 'F33': 0.03, 'C61': 0.03, 'I50': 0.025, 'C50': 0.02,
+    'G30': 0.015, 'F0': 0.01, 'Z51.5': 0.01, 'E10': 0.005, 'Z90.1': 0.005, 'B20': 0.004,
+    'Z99.2': 0.002, 'Z21': 0.001, 'Z94': 0.0005,
+}
+DEFAULT_CONDITION_PREVALENCE = 0.003
+SEX_SPECIFIC = {'C61': 'M', 'N40': 'M', 'C50': 'F', 'C53': 'F', 'Z90.1': 'F', 'Z39': 'F', 'O': 'F'}
+
+# Share of patients with a result, per generated year.
+OBSERVATION_PREVALENCE = {
+    '8480-6': 0.60, '8462-4': 0.60, '39156-5': 0.50, '2093-3': 0.35, '13457-7': 0.30,
+    '4548-4': 0.10, '44261-6': 0.10, '11488-4': 0.03, '34839-1': 0.02, '68448-7': 0.02,
+}
+DEFAULT_OBSERVATION_PREVALENCE = 0.02
+# code -> (condition prefix, prevalence among patients with such a diagnosis)
+LINKED_OBSERVATIONS = {'4548-4': ('E1', 0.90)}
+# code -> (mean, standard deviation, units) of value_numeric
+OBSERVATION_VALUES = {
+    '4548-4': (7.4, 1.5, '%'), '8480-6': (128.0, 17.0, 'mm[Hg]'), '8462-4': (79.0, 11.0, 'mm[Hg]'),
+    '39156-5': (29.0, 6.0, 'kg/m2'), '2093-3': (190.0, 40.0, 'mg/dL'), '13457-7': (110.0, 35.0, 'mg/dL'),
+    '44261-6': (6.0, 5.0, '{score}'),
+}
+
+# Share of patients with the procedure over the generated years.
+PROCEDURE_PREVALENCE = {
+    '9924': 0.08, '82274': 0.08, '45378': 0.06, '92250': 0.05, '80053': 0.05, '93000': 0.05,
+    '77080': 0.03, '66984': 0.02, '4533': 0.01, '66982': 0.005, '27130': 0.004, '90585': 0.001,
+}
+DEFAULT_PROCEDURE_PREVALENCE = 0.01
+
+# Relative frequency of encounter types; other types found in the scripts get 1.
+ENCOUNTER_TYPE_WEIGHTS = {
+    'OUTPATIENT': 30.0, 'OFFICE_VISIT': 20.0, 'OFFICE VISIT': 5.0, 'ANNUAL_WELLNESS': 6.0,
+    'TELEHEALTH': 6.0, 'PREVENTIVE': 4.0, 'ED': 4.0, 'INPATIENT': 3.0, 'DENTAL_EVAL': 3.0,
+    'NURSING_HOME': 0.5, 'NH': 0.5, 'HOSPICE': 0.3, 'PALLIATIVE_CARE': 0.3,
+}
+
+
+class VocabularyCode(NamedTuple):
+    kind: str                            # 'condition', 'observation', 'procedure' or 'encounter_type'
+    code: str
+    code_system: Optional[str]
+    prevalence: float                    # Share of patients; relative weight for encounter types
+    sex: Optional[str] = None            # 'M' or 'F' for sex-specific codes
+    linked_prefix: Optional[str] = None
+    linked_prevalence: Optional[float] = None
+    value_mean: Optional[float] = None
+    value_sd: Optional[float] = None
+    units: Optional[str] = None
+
+
+# --- Synthetic data ---
+def example_code(literal: str) -> str:
+    """A concrete code for a criteria code ('E11.x') or LIKE prefix ('E11%', 'E11.3%', 'F0%')."""
+    code = literal.rstrip('%')
+    if code.endswith('.x'):
+        code = code[:-2]
+    if code == literal:
+        return code
+    if code.endswith('.'):
+        return code + '9'
+    if re.fullmatch(r'[A-Z]\d{2}', code):
+        return code + '.9'
+    if len(code) < 3:
+        return code.ljust(3, '1')
+    return code + '9'
+
+
+def harvest_codes(scripts: Sequence[MeasureScript], csv_path: str = MEASURES_CSV) -> Dict[str, Set[str]]:
+    """kind -> codes cited by the measures_load.csv criteria and the scripts' code literals."""
+    codes: Dict[str, Set[str]] = {kind: set() for kind in SCRIPT_KINDS.values()}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            text = " ".join(row.get(column) or '' for column in CRITERIA_COLUMNS)
+            for code in CRITERIA_CODE.findall(text):
+                kind = 'observation' if '-' in code else 'procedure' if code.isdigit() else 'condition'
+                codes[kind].add(example_code(code))
+    for script in scripts:
+        with open(script.path, encoding='utf-8') as f:
+            text = re.sub(r'--[^\n]*', '', f.read())
+        for match in SCRIPT_CODE.finditer(text):
+            kind = SCRIPT_KINDS[match.group(1).lower()]
+            literals = re.findall(r"'([^']*)'", match.group(3)) if match.group(3) is not None \
+                else [match.group(2) if match.group(2) is not None else match.group(4)]
+            for literal in literals:
+                if kind == 'encounter_type':
+                    if literal.strip():
+                        codes[kind].add(literal)
+                elif CODE_TOKEN.fullmatch(literal):
+                    codes[kind].add(example_code(literal))
+    return codes
+
+
+def _prefix(code: str, table: Iterable[str]) -> Optional[str]:
+    """Longest key of ``table`` that ``code`` starts with."""
+    return max((prefix for prefix in table if code.startswith(prefix)), key=len, default=None)
+
+
+def _split_prevalence(codes: Iterable[str], table: Dict[str, float], default: float) -> Dict[str, float]:
+    """code -> prevalence; a prefix's prevalence is shared by the codes it matches."""
+    by_prefix: Dict[Optional[str], List[str]] = {}
+    for code in sorted(codes):
+        by_prefix.setdefault(_prefix(code, table), []).append(code)
+    return {code: (table[prefix] / len(members) if prefix else default)
+            for prefix, members in by_prefix.items() for code in members}
+
+
+def condition_code_system(code: str) -> str:
+    if re.match(r'[A-Z]\d', code):
+        return 'ICD-10'
+    if re.fullmatch(r'\d{3}(\.\d+)?', code):
+        return 'ICD-9'
+    return 'SNOMED' if code.isdigit() else 'OTHER'
+
+
+def procedure_code_system(code: str) -> str:
+    if re.fullmatch(r'\d{5}', code):
+        return 'CPT'
+    return 'HCPCS' if re.fullmatch(r'[A-Z]\d{4}', code) else 'OTHER'
+
+
+def build_vocabulary(codes: Dict[str, Set[str]]) -> List[VocabularyCode]:
+    vocabulary = []
+    for code, prevalence in _split_prevalence(codes['condition'], CONDITION_PREVALENCE,
+                                              DEFAULT_CONDITION_PREVALENCE).items():
+        sex = SEX_SPECIFIC.get(_prefix(code, SEX_SPECIFIC) or '')
+        vocabulary.append(VocabularyCode('condition', code, condition_code_system(code), prevalence, sex))
+    for code, prevalence in _split_prevalence(codes['observation'], OBSERVATION_PREVALENCE,
+                                              DEFAULT_OBSERVATION_PREVALENCE).items():
+        linked_prefix, linked_prevalence = LINKED_OBSERVATIONS.get(code, (None, None))
+        mean, sd, units = OBSERVATION_VALUES.get(code, (None, None, None))
+        vocabulary.append(VocabularyCode('observation', code, 'LOINC', prevalence, None,
+                                         linked_prefix, linked_prevalence, mean, sd, units))
+    for code, prevalence in _split_prevalence(codes['procedure'], PROCEDURE_PREVALENCE,
+                                              DEFAULT_PROCEDURE_PREVALENCE).items():
+        sex = SEX_SPECIFIC.get(_prefix(code, SEX_SPECIFIC) or '')
+        vocabulary.append(VocabularyCode('procedure', code, procedure_code_system(code), prevalence, sex))
+    for code in sorted(codes['encounter_type']):
+        vocabulary.append(VocabularyCode('encounter_type', code, None, ENCOUNTER_TYPE_WEIGHTS.get(code, 1.0)))
+    return vocabulary
+
+
+# Each statement fills one table from phm_edw.patient and the bench_vocabulary temp table.
+# Draws are random() columns of a subquery: a bare ``WHERE random() < v.prevalence``
+# would be pushed down to the vocabulary scan and drawn once per code.
+GENERATE_SQL = (
+    ('patient', """
+        INSERT INTO phm_edw.patient (mrn, first_name, last_name, date_of_birth, gender)
+        SELECT 'BENCH' || lpad(n::text, 8, '0'), 'Bench', 'Patient ' || n,
+               %(end)s::date - (random() * 90 * 365.25)::int,
+               CASE WHEN random() < 0.5 THEN 'F' ELSE 'M' END
+        FROM generate_series(1, %(patients)s) AS n;
+    """),
+    ('encounter', """
+        INSERT INTO phm_edw.encounter (patient_id, encounter_type, encounter_datetime, status)
+        SELECT p.patient_id, v.code, e.encounter_datetime,
+               CASE WHEN e.cancelled THEN 'CANCELLED' ELSE 'COMPLETED' END
+        FROM (
+            SELECT patient_id, 1 + floor(-ln(1 - random()) * (%(visits)s - 1))::int AS visits
+            FROM phm_edw.patient
+        ) p
+        CROSS JOIN LATERAL (
+            SELECT %(start)s::timestamp + random() * (%(end)s::timestamp - %(start)s::timestamp) AS encounter_datetime,
+                   random() AS pick, random() < 0.05 AS cancelled
+            FROM generate_series(1, p.visits)
+        ) e
+        JOIN bench_vocabulary v
+          ON v.kind = 'encounter_type' AND e.pick >= v.lower_bound AND e.pick < v.upper_bound;
+    """),
+    ('condition', """
+        INSERT INTO phm_edw.condition (condition_code, condition_name, code_system)
+        SELECT code, 'Synthetic ' || code, code_system FROM bench_vocabulary WHERE kind = 'condition';
+    """),
+    ('condition_diagnosis', """
+        INSERT INTO phm_edw.condition_diagnosis (patient_id, condition_id, diagnosis_type, diagnosis_status, onset_date)
+        SELECT d.patient_id, c.condition_id, 'CHRONIC',
+               CASE WHEN random() < 0.9 THEN 'ACTIVE' ELSE 'RESOLVED' END,
+               GREATEST(d.date_of_birth, %(end)s::date - (random() * 15 * 365.25)::int)
+        FROM (
+            SELECT p.patient_id, p.date_of_birth, v.code, v.code_system, v.prevalence, random() AS draw
+            FROM phm_edw.patient p
+            JOIN bench_vocabulary v ON v.kind = 'condition' AND (v.sex IS NULL OR v.sex = p.gender)
+        ) d
+        JOIN phm_edw.condition c ON c.condition_code = d.code AND c.code_system = d.code_system
+        WHERE d.draw < d.prevalence;
+    """),
+    ('observation', """
+        INSERT INTO phm_edw.observation (patient_id, observation_datetime, observation_code, observation_desc,
+                                         value_numeric, units, status)
+        SELECT pv.patient_id, make_date(y, 1, 1) + random() * INTERVAL '364 days', pv.code, 'Synthetic ' || pv.code,
+               CASE WHEN pv.value_mean IS NOT NULL THEN
+                   round(GREATEST(0, pv.value_mean + pv.value_sd * sqrt(-2 * ln(1 - random()))
+                                                             * cos(2 * pi() * random()))::numeric, 1)
+               END,
+               pv.units, 'Final'
+        FROM (
+            SELECT p.patient_id, v.code, v.value_mean, v.value_sd, v.units, y, random() AS draw,
+                   CASE WHEN v.linked_prefix IS NOT NULL AND EXISTS (
+                            SELECT 1 FROM phm_edw.condition_diagnosis cd
+                            JOIN phm_edw.condition c ON c.condition_id = cd.condition_id
+                            WHERE cd.patient_id = p.patient_id
+                              AND left(c.condition_code, length(v.linked_prefix)) = v.linked_prefix)
+                        THEN v.linked_prevalence ELSE v.prevalence END AS prevalence
+            FROM phm_edw.patient p
+            JOIN bench_vocabulary v ON v.kind = 'observation'
+            CROSS JOIN generate_series(extract(year FROM %(start)s::date)::int,
+                                       extract(year FROM %(end)s::date)::int) AS y
+        ) pv
+        WHERE pv.draw < pv.prevalence;
+    """),
+    ('procedure', """
+        INSERT INTO phm_edw.procedure (procedure_code, procedure_desc, code_system)
+        SELECT code, 'Synthetic ' || code, code_system FROM bench_vocabulary WHERE kind = 'procedure';
+    """),
+    ('procedure_performed', """
+        INSERT INTO phm_edw.procedure_performed (patient_id, procedure_id, procedure_datetime)
+        SELECT d.patient_id, pr.procedure_id,
+               %(start)s::timestamp + random() * (%(end)s::timestamp - %(start)s::timestamp)
+        FROM (
+            SELECT p.patient_id, v.code, v.prevalence, random() AS draw
+            FROM phm_edw.patient p
+            JOIN bench_vocabulary v ON v.kind = 'procedure' AND (v.sex IS NULL OR v.sex = p.gender)
+        ) d
+        JOIN phm_edw.procedure pr ON pr.procedure_code = d.code
+        WHERE d.draw < d.prevalence;
+    """),
+)
+
+
+def _load_vocabulary(cursor, vocabulary: Sequence[VocabularyCode]) -> None:
+    """Creates the bench_vocabulary temp table; encounter types get [lower_bound, upper_bound) slices of [0, 1)."""
+    cursor.execute("""
+        CREATE TEMP TABLE bench_vocabulary (
+            kind TEXT, code TEXT, code_system TEXT, prevalence FLOAT8, sex TEXT,
+            linked_prefix TEXT, linked_prevalence FLOAT8, value_mean FLOAT8, value_sd FLOAT8, units TEXT,
+            lower_bound FLOAT8, upper_bound FLOAT8
+        ) ON COMMIT DROP;
+    """)
+    cursor.executemany("""
+        INSERT INTO bench_vocabulary (kind, code, code_system, prevalence, sex, linked_prefix, linked_prevalence,
+                                      value_mean, value_sd, units)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """, vocabulary)
+    cursor.execute("""
+        UPDATE bench_vocabulary v
+        SET lower_bound = b.upper_bound - v.prevalence / b.total, upper_bound = b.upper_bound
+        FROM (
+            SELECT code, sum(prevalence) OVER (ORDER BY code) / sum(prevalence) OVER () AS upper_bound,
+                   sum(prevalence) OVER () AS total
+            FROM bench_vocabulary WHERE kind = 'encounter_type'
+        ) b
+        WHERE v.kind = 'encounter_type' AND v.code = b.code;
+    """)
+    # Rounding must not leave a gap at the top of the range
+    cursor.execute("""
+        UPDATE bench_vocabulary SET upper_bound = 2
+        WHERE kind = 'encounter_type' AND upper_bound = (SELECT max(upper_bound) FROM bench_vocabulary);
+    """)
+
+
+def generate_population(conn, vocabulary: Sequence[VocabularyCode], n_patients: int, seed: int = 0,
+                        visits: float = DEFAULT_VISITS) -> Dict[str, object]:
+    """Replaces the phm_edw clinical tables with ``n_patients`` synthetic patients and commits.
+
+    Returns rows and seconds per table. The value sets are reloaded from
+    value_sets.csv, since truncating phm_edw.condition empties their index.
+    """
+    params = {'patients': n_patients, 'visits': visits, 'start': GENERATED_START, 'end': GENERATED_END}
+    tables: Dict[str, Dict[str, float]] = {}
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        # Serial plans: parallel workers would not share the seeded random() sequence
+        cursor.execute("SET LOCAL max_parallel_workers_per_gather = 0;")
+        cursor.execute("SELECT setseed(%s);", (random.Random(seed).uniform(-1.0, 1.0),))
+        cursor.execute("""
+            TRUNCATE phm_edw.patient, phm_edw.condition, phm_edw.procedure, phm_edw.measure_period
+            RESTART IDENTITY CASCADE;
+        """)
+        _load_vocabulary(cursor, vocabulary)
+        for table, statement in GENERATE_SQL:
+            table_start = time.perf_counter()
+            cursor.execute(statement, params)
+            tables[table] = {'rows': cursor.rowcount, 'seconds': round(time.perf_counter() - table_start, 3)}
+            print(f"  {table:<20} {cursor.rowcount:>12,} rows in {tables[table]['seconds']:8.3f}s")
+    conn.commit()
+    value_sets.load_value_sets(conn, value_sets.read_value_sets())
+    with conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"ANALYZE phm_edw.{table};")
+    conn.commit()
+    return {'seconds': round(time.perf_counter() - start, 3), 'tables': tables}
+
+
+# --- Measurement ---
+def _row_dict(row) -> Dict[str, object]:
+    counts = row._asdict()
+    if counts['performance_rate'] is not None:
+        counts['performance_rate'] = float(counts['performance_rate'])
+    return counts
+
+
+def benchmark_measure(conn, script: MeasureScript, repeat: int, statement_timeout: float) -> Dict[str, object]:
+    """One analyzed run for buffers, then ``repeat`` timed runs; every run is rolled back."""
+    timeout_ms = int(statement_timeout * 1000)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+            _, plan = etl_explain.execute(cursor, script.sql, 'SELECT', 'analyze')
+            conn.rollback()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+                cursor.execute(script.sql)
+                if cursor.description is None:
+                    raise ValueError("the first statement returns no rows")
+                rows = normalize([column[0] for column in cursor.description], cursor.fetchall())
+                timings.append(time.perf_counter() - start)
+                conn.rollback()
+    except (psycopg2.Error, ValueError) as e:
+        conn.rollback()
+        return {'code': script.code, 'status': 'FAILURE', 'error': error_summary(e)}
+    return {
+        'code': script.code,
+        'status': 'SUCCESS',
+        'seconds_median': round(statistics.median(timings), 4),
+        'seconds_min': round(min(timings), 4),
+        'buffers': {name: round(value, 3) for name, value in etl_explain.plan_buffers(plan).items()},
+        'rows': [_row_dict(row) for row in rows],
+    }
+
+
+def run_benchmark(conn, scripts: Sequence[MeasureScript], repeat: int,
+                  statement_timeout: float = DEFAULT_STATEMENT_TIMEOUT) -> Dict[str, object]:
+    """Refreshes the shared caches, then benchmarks every script in order on ``conn``."""
+    start = time.perf_counter()
+    refresh_shared_caches(conn, [script.sql for script in scripts])
+    refresh_seconds = time.perf_counter() - start
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM phm_edw.patient;")
+        n_patients = cursor.fetchone()[0]
+    conn.commit()
+    measures = []
+    for script in scripts:
+        measure = benchmark_measure(conn, script, repeat, statement_timeout)
+        print_measure(measure)
+        measures.append(measure)
+    return {
+        'patients': n_patients,
+        'cache_refresh_seconds': round(refresh_seconds, 3),
+        'measure_seconds': round(sum(m.get('seconds_median', 0.0) for m in measures), 3),
+        'measures': measures,
+    }
+
+
+def _buffer_total(measure: Dict[str, object]) -> float:
+    return measure['buffers']['shared_hit'] + measure['buffers']['shared_read']
+
+
+def compare_runs(old_run: Dict[str, object], new_run: Dict[str, object], threshold: float) -> List[Tuple[str, str]]:
+    """(measure code, finding) for each regression of ``new_run`` against ``old_run``."""
+    old_measures = {measure['code']: measure for measure in old_run['measures']}
+    findings = []
+    for new in new_run['measures']:
+        old = old_measures.get(new['code'])
+        if old is None or old['status'] != 'SUCCESS':
+            continue
+        if new['status'] != 'SUCCESS':
+            findings.append((new['code'], f"now failing: {new['error']}"))
+            continue
+        old_seconds, new_seconds = old['seconds_median'], new['seconds_median']
+        if new_seconds > old_seconds * (1 + threshold) and new_seconds - old_seconds >= MIN_REGRESSION_SECONDS:
+            findings.append((new['code'], f"median {old_seconds * 1000:.1f} ms -> {new_seconds * 1000:.1f} ms "
+                                          f"({new_seconds / old_seconds - 1:+.0%})"))
+        old_buffers, new_buffers = _buffer_total(old), _buffer_total(new)
+        if new_buffers > old_buffers * (1 + threshold):
+            findings.append((new['code'], f"shared buffers {old_buffers:,.0f} -> {new_buffers:,.0f}"))
+        if new['rows'] != old['rows']:
+            findings.append((new['code'], "result counts changed"))
+    return findings
+
+
+def print_measure(measure: Dict[str, object]) -> None:
+    if measure['status'] == 'FAILURE':
+        print(f"  ERROR {measure['code']}: {measure['error']}")
+        return
+    buffers = measure['buffers']
+    first = measure['rows'][0] if measure['rows'] else {}
+    counts = "/".join('-' if first.get(column) is None else str(first[column])
+                      for column in ('initial_population', 'denominator', 'numerator'))
+    print(f"  {measure['code']:<12}{measure['seconds_median'] * 1000:>10.1f}{measure['seconds_min'] * 1000:>10.1f}"
+          f"{buffers['shared_hit']:>12,.0f}{buffers['shared_read']:>10,.0f}"
+          f"{buffers['temp_read'] + buffers['temp_written']:>10,.0f}  {counts}")
+
+
+def print_header(n_patients: Optional[int]) -> None:
+    scale = f"{n_patients:,} patients" if n_patients else "existing data"
+    print(f"\n--- Measures on {scale} ---")
+    print(f"  {'Measure':<12}{'Median ms':>10}{'Min ms':>10}{'Shared hit':>12}{'Read':>10}{'Temp':>10}"
+          f"  IPP/DEN/NUM")
+
+
+def print_run(run: Dict[str, object]) -> None:
+    failed = [measure['code'] for measure in run['measures'] if measure['status'] == 'FAILURE']
+    slowest = sorted((m for m in run['measures'] if m['status'] == 'SUCCESS'),
+                     key=lambda m: m['seconds_median'], reverse=True)[:5]
+    print(f"{len(run['measures'])} measures on {run['patients']:,} patients: {run['measure_seconds']:.3f}s "
+          f"of median measure time, cache refresh {run['cache_refresh_seconds']:.3f}s.")
+    print("Slowest measures: " + ", ".join(f"{m['code']} {m['seconds_median']:.3f}s" for m in slowest))
+    if failed:
+        print(f"{len(failed)} measures failed: {', '.join(failed)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Measures/ eCQM scripts on a synthetic phm_edw population."
+    )
+    parser.add_argument("--patients", type=int, action="append",
+                        help="Generate this many patients and benchmark them; repeat for several scales "
+                             f"(e.g. {', '.join(map(str, DEFAULT_SCALES))}). Default: benchmark the existing data.")
+    parser.add_argument("--database", help="Database to use instead of DB_DATABASE from .env.")
+    parser.add_argument("--force", action="store_true",
+                        help="Allow --patients to replace the data of the .env database itself.")
+    parser.add_argument("--measure", action="append", default=[], metavar="CODE",
+                        help="Benchmark only this measure (file name without .sql); repeatable.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Timed runs per measure after the analyzed run (default {DEFAULT_REPEAT}).")
+    parser.add_argument("--visits", type=float, default=DEFAULT_VISITS,
+                        help=f"Mean encounters per generated patient (default {DEFAULT_VISITS}).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    parser.add_argument("--statement-timeout", type=float, default=DEFAULT_STATEMENT_TIMEOUT,
+                        help=f"Seconds before a measure is cancelled (default {DEFAULT_STATEMENT_TIMEOUT}; 0 disables).")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to a JSON file.")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="Compare with an earlier --json report; exit 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Relative increase --compare reports as a regression (default {DEFAULT_THRESHOLD}).")
+    args = parser.parse_args(argv)
+    for n_patients in args.patients or ():
+        if not 1 <= n_patients <= MAX_SCALE:
+            parser.error(f"--patients must be between 1 and {MAX_SCALE:,}")
+    if args.repeat <= 0:
+        parser.error("--repeat must be positive")
+    if args.visits < 1:
+        parser.error("--visits must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    kwargs = connect_kwargs()
+    if args.patients and args.database in (None, kwargs['dbname']) and not args.force:
+        print(f"Error: --patients replaces every patient in {kwargs['dbname']}; "
+              "name a benchmark database with --database (or pass --force).")
+        sys.exit(1)
+    kwargs['dbname'] = args.database or kwargs['dbname']
+    kwargs['application_name'] = 'bench_measures'
+    previous = None
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                previous = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {args.compare}: {e}")
+            sys.exit(1)
+    try:
+        scripts = discover_measures(only=args.measure)
+        # Every script's codes, so that --measure does not change the generated data
+        vocabulary = build_vocabulary(harvest_codes(discover_measures())) if args.patients else []
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    try:
+        conn = psycopg2.connect(**kwargs)
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+    runs = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version;")
+            server_version = cursor.fetchone()[0]
+        conn.rollback()
+        for n_patients in args.patients or [None]:
+            generated = None
+            if n_patients:
+                print(f"\nGenerating {n_patients:,} patients in {kwargs['dbname']} "
+                      f"({len(vocabulary)} vocabulary codes, seed {args.seed})...")
+                generated = generate_population(conn, vocabulary, n_patients, args.seed, args.visits)
+            print_header(n_patients)
+            run = run_benchmark(conn, scripts, args.repeat, args.statement_timeout)
+            run['generated'] = generated
+            print_run(run)
+            runs.append(run)
+    except (psycopg2.Error, OSError, ValueError) as e:
+        print(f"Error running the benchmark: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'database': kwargs['dbname'], 'server_version': server_version, 'seed': args.seed,
+                       'repeat': args.repeat, 'visits': args.visits, 'runs': runs}, f, indent=2)
+        print(f"\nResults written to {args.json}.")
+
+    regressions = 0
+    if previous is not None:
+        if previous.get('seed') != args.seed:
+            print(f"\nWarning: {args.compare} was generated with seed {previous.get('seed')}, not {args.seed}.")
+        old_runs = {run['patients']: run for run in previous.get('runs', [])}
+        for run in runs:
+            old_run = old_runs.get(run['patients'])
+            if old_run is None:
+                print(f"\nNo run with {run['patients']:,} patients in {args.compare} to compare with.")
+                continue
+            findings = compare_runs(old_run, run, args.threshold)
+            print(f"\n--- Compared with {args.compare} at {run['patients']:,} patients: "
+                  f"{len(findings)} regressions ---")
+            for code, finding in findings:
+                print(f"  {code:<12} {finding}")
+            regressions += len(findings)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
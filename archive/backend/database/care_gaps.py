@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Incremental care-gap evaluation for the Measures/ scripts.
+
+Scripts that end with a patient-level statement (patient_id plus a status
+column such as ``patient_status``) can be evaluated per patient. That
+statement runs with the CTEs of the script's summary statement in scope
+(etl_statements.chain_ctes), and each patient's status becomes their row
+in phm_edw.care_gap:
+
+- a status that is not met (``Not Met ...``, ``Missing ...``,
+  ``Denominator-Only``) opens the patient's gap, or reopens a closed one;
+- a met, excluded or exception status closes an open gap, as does dropping
+  out of the measure population; patients without a gap get no row.
+
+Status texts outside these prefixes are mapped per measure in
+MEASURE_STATUSES. Others are left unclassified, and a measure whose
+statuses are all unclassified fails instead of silently changing nothing.
+
+There is one active care_gap row per patient and measure
+(uq_care_gap_active), updated in place with a new updated_date. Step 14 of
+ETL_edw_to_star.sql reads changed rows through care_gap's watermark and
+updates the patient's existing fact_care_gap row for the measure (status,
+identified and resolved dates) before inserting gaps that have none.
+
+Only patients whose clinical rows changed are re-evaluated. Each measure
+keeps a watermark in phm_edw.etl_log (``etl_watermark:care_gap:<code>``,
+see etl_watermarks.py). A patient is dirty when any of DIRTY_SOURCES has a
+row for them with ``COALESCE(updated_date, created_date)`` at or after the
+watermark, less WATERMARK_OVERLAP. The script's query then reads every
+patient-keyed phm_edw table through a subquery limited to those patients
+(etl_statements.restrict_tables), so the measure logic itself is unchanged.
+A measure's first run, or one with ``full``, evaluates every patient. The
+watermark only advances when the measure's transaction commits.
+
+This relies on a patient's status depending only on their own rows, which
+holds for the per-patient statements in Measures/. measure_runner.py
+--care-gaps drives it.
+"""
+
+import io
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import psycopg2
+    from psycopg2 import sql
+except ImportError:
+    psycopg2 = None
+
+from etl_statements import chain_ctes, classify, restrict_tables
+from etl_watermarks import WATERMARK_OVERLAP, get_watermarks, record_watermark
+
+# --- Configuration ---
+# Tables whose changes can change a patient's measure status.
+DIRTY_SOURCES = (
+    'phm_edw.encounter',
+    'phm_edw.observation',
+    'phm_edw.condition_diagnosis',
+    'phm_edw.procedure_performed',
+    'phm_edw.medication_order',
+    'phm_edw.patient',
+)
+WATERMARK_PREFIX = 'care_gap:'       # Watermark key per measure, e.g. 'care_gap:CMS122v12'
+DIRTY_TABLE = 'care_gap_patients'    # Temp table of the patients being re-evaluated
+STATUS_COLUMNS = ('patient_status', 'measure_status', 'gap_status', 'status')
+STATUS_COLUMN = re.compile(r'\b(?:' + '|'.join(STATUS_COLUMNS) + r')\b', re.IGNORECASE)
+# Lower-is-better measures: being in the numerator is the gap.
+INVERSE_MEASURES = ('CMS122', 'CMS249')
+EXCLUDED_PREFIXES = ('excluded', 'exception')
+GAP_PREFIXES = ('not met', 'missing', 'denominator')
+MET_PREFIXES = ('met', 'numerator', 'compliant')
+# Status texts the prefix rules do not cover, by measure (lower-cased text -> gap status).
+MEASURE_STATUSES = {
+    'CMS646': {'received bcg': 'Closed', 'no bcg': 'Open'},
+}
+NOT_IN_POPULATION = 'No longer in the measure population'
+
+
+class CareGapResult(NamedTuple):
+    code: str
+    status: str                  # 'SUCCESS', 'FAILURE' or 'UNMATCHED' (no measure_definition row)
+    seconds: float
+    full: bool
+    patients: Optional[int]      # Patients re-evaluated; None for a full run
+    opened: int                  # Gaps opened or reopened
+    closed: int
+    unclassified: int            # Patients whose status text matched no rule (left as they were)
+    error: Optional[str]
+
+
+def patient_query(statements: Sequence) -> Optional[str]:
+    """Per-patient query of a script (etl_statements.Statement list), or None if it has none."""
+    if len(statements) < 2 or classify(statements[1].sql)[0] != 'SELECT':
+        return None
+    detail = statements[1].sql
+    if 'patient_id' not in detail or not STATUS_COLUMN.search(detail):
+        return None
+    return chain_ctes(statements[0].sql, detail)
+
+
+def patient_tables(cursor) -> List[str]:
+    """phm_edw tables with a patient_id column, the ones restricted to dirty patients."""
+    cursor.execute("""
+        SELECT table_schema || '.' || table_name
+        FROM information_schema.columns
+        WHERE table_schema = 'phm_edw' AND column_name = 'patient_id'
+        ORDER BY 1;
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def measure_ids(cursor) -> Dict[str, int]:
+    """measure_definition ids by measure_code."""
+    cursor.execute("SELECT measure_code, measure_id FROM phm_edw.measure_definition;")
+    return dict(cursor.fetchall())
+
+
+def error_summary(error: Exception) -> str:
+    """First line of an error's message, or its type name when the message is empty."""
+    lines = str(error).strip().splitlines()
+    return lines[0] if lines else type(error).__name__
+
+
+def gap_status(code: str, status: Optional[str]) -> Optional[str]:
+    """'Open', 'Closed' or None (unclassified) for a script's status text."""
+    text = (status or '').strip().lower()
+    if text.startswith(EXCLUDED_PREFIXES):
+        return 'Closed'
+    family = code.split('v')[0]
+    if text in MEASURE_STATUSES.get(family, {}):
+        return MEASURE_STATUSES[family][text]
+    inverse = family in INVERSE_MEASURES
+    if text.startswith(GAP_PREFIXES):
+        return 'Closed' if inverse else 'Open'
+    if text.startswith(MET_PREFIXES):
+        return 'Open' if inverse else 'Closed'
+    return None
+
+
+def patient_statuses(code: str, columns: Sequence[str], rows: Sequence[tuple]) -> Dict[int, Tuple[Optional[str], str]]:
+    """patient_id -> (gap status, status text). Excluded wins over open, open over closed."""
+    if 'patient_id' not in columns:
+        raise ValueError("the patient-level statement has no patient_id column")
+    status_column = next((name for name in STATUS_COLUMNS if name in columns), None)
+    if status_column is None:
+        raise ValueError(f"the patient-level statement has none of {', '.join(STATUS_COLUMNS)}")
+    patient_index, status_index = columns.index('patient_id'), columns.index(status_column)
+    rank = {'Excluded': 0, 'Open': 1, 'Closed': 2, None: 3}
+    best: Dict[int, Tuple[int, Optional[str], str]] = {}
+    for row in rows:
+        text = str(row[status_index] or '')
+        gap = gap_status(code, text)
+        order = rank['Excluded' if text.strip().lower().startswith(EXCLUDED_PREFIXES) else gap]
+        if row[patient_index] not in best or order < best[row[patient_index]][0]:
+            best[row[patient_index]] = (order, gap, text)
+    return {patient_id: (gap, text) for patient_id, (_, gap, text) in best.items()}
+
+
+def _copy_text(value) -> str:
+    if value is None:
+        return r'\N'
+    return str(value).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ')
+
+
+def _write_results(cursor, statuses: Dict[int, Tuple[Optional[str], str]]) -> None:
+    cursor.execute("""
+        CREATE TEMP TABLE care_gap_results (
+            patient_id INT PRIMARY KEY,
+            gap_status VARCHAR(50),
+            comments   VARCHAR(500)
+        ) ON COMMIT DROP;
+    """)
+    buffer = io.StringIO()
+    for patient_id, (gap, text) in statuses.items():
+        buffer.write(f"{patient_id}\t{_copy_text(gap)}\t{_copy_text(text[:500])}\n")
+    buffer.seek(0)
+    cursor.copy_expert("COPY care_gap_results (patient_id, gap_status, comments) FROM STDIN", buffer)
+    cursor.execute("ANALYZE care_gap_results;")
+
+
+def _select_dirty(cursor, since) -> int:
+    """Fills DIRTY_TABLE with the patients changed since ``since``; returns how many."""
+    changed = sql.SQL("\nUNION\n").join(
+        sql.SQL("SELECT patient_id FROM {} WHERE COALESCE(updated_date, created_date) >= %(since)s")
+        .format(sql.Identifier(*table.split('.')))
+        for table in DIRTY_SOURCES)
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {} ON COMMIT DROP AS {};")
+                   .format(sql.Identifier(DIRTY_TABLE), changed), {'since': since})
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY (patient_id);").format(sql.Identifier(DIRTY_TABLE)))
+    cursor.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(DIRTY_TABLE)))
+    cursor.execute(sql.SQL("SELECT COUNT(*) FROM {};").format(sql.Identifier(DIRTY_TABLE)))
+    return cursor.fetchone()[0]
+
+
+def evaluate(conn, code: str, query: str, measure_id: int, tables: Sequence[str],
+             full: bool = False, statement_timeout: float = 0) -> CareGapResult:
+    """Re-evaluates one measure for its dirty patients (all patients when ``full``) and commits."""
+    start = time.perf_counter()
+    key = WATERMARK_PREFIX + code
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(statement_timeout * 1000),))
+            cursor.execute("SELECT LOCALTIMESTAMP;")
+            run_start = cursor.fetchone()[0]
+            since = None if full else get_watermarks(cursor, [key]).get(key)
+            full = since is None
+            patients = None
+            if not full:
+                patients = _select_dirty(cursor, since - WATERMARK_OVERLAP)
+                query = restrict_tables(query, tables, f"patient_id IN (SELECT patient_id FROM {DIRTY_TABLE})")
+
+            opened = closed = unclassified = 0
+            if full or patients:
+                cursor.execute(query)
+                statuses = patient_statuses(code, [column[0] for column in cursor.description], cursor.fetchall())
+                unclassified = sum(1 for gap, _ in statuses.values() if gap is None)
+                if statuses and unclassified == len(statuses):
+                    # Nothing would open or close; a status text the rules do not know
+                    sample = next(iter(statuses.values()))[1]
+                    raise ValueError(f"all {unclassified} patient statuses are unclassified "
+                                     f"(e.g. {sample!r}); add them to MEASURE_STATUSES")
+                _write_results(cursor, statuses)
+                cursor.execute("""
+                    INSERT INTO phm_edw.care_gap (patient_id, measure_id, gap_status, identified_date, comments)
+                    SELECT r.patient_id, %(measure_id)s, 'Open', LOCALTIMESTAMP, r.comments
+                    FROM care_gap_results r
+                    WHERE r.gap_status = 'Open'
+                    ON CONFLICT (patient_id, measure_id) WHERE active_ind = 'Y' DO UPDATE
+                    SET gap_status = 'Open',
+                        identified_date = EXCLUDED.identified_date,
+                        resolved_date = NULL,
+                        comments = EXCLUDED.comments,
+                        updated_date = NOW()
+                    WHERE care_gap.gap_status IS DISTINCT FROM 'Open';
+                """, {'measure_id': measure_id})
+                opened = max(cursor.rowcount, 0)
+                scope = sql.SQL("TRUE") if full else sql.SQL("cg.patient_id IN (SELECT patient_id FROM {})").format(
+                    sql.Identifier(DIRTY_TABLE))
+                # Closes gaps of patients now met, excluded or out of the population; unclassified ones stay
+                cursor.execute(sql.SQL("""
+                    UPDATE phm_edw.care_gap cg
+                    SET gap_status = 'Closed',
+                        resolved_date = LOCALTIMESTAMP,
+                        comments = COALESCE((SELECT r.comments FROM care_gap_results r WHERE r.patient_id = cg.patient_id),
+                                            %(absent)s),
+                        updated_date = NOW()
+                    WHERE cg.measure_id = %(measure_id)s
+                      AND cg.active_ind = 'Y'
+                      AND cg.gap_status = 'Open'
+                      AND {scope}
+                      AND NOT EXISTS (
+                          SELECT 1 FROM care_gap_results r
+                          WHERE r.patient_id = cg.patient_id AND r.gap_status IS DISTINCT FROM 'Closed'
+                      );
+                """).format(scope=scope), {'measure_id': measure_id, 'absent': NOT_IN_POPULATION})
+                closed = max(cursor.rowcount, 0)
+            record_watermark(cursor, key, run_start, opened + closed)
+        conn.commit()
+        return CareGapResult(code, 'SUCCESS', time.perf_counter() - start, full, patients,
+                             opened, closed, unclassified, None)
+    except (psycopg2.Error, ValueError) as e:
+        conn.rollback()
+        return CareGapResult(code, 'FAILURE', time.perf_counter() - start, full, None, 0, 0, 0,
+                             error_summary(e))
+
+
+def print_care_gap_result(result: CareGapResult) -> None:
+    if result.status == 'FAILURE':
+        print(f"[{result.seconds:8.3f}s] ERROR {result.code}: {result.error}")
+        return
+    if result.status == 'UNMATCHED':
+        print(f"[{result.seconds:8.3f}s] {result.code}  (no measure_definition row, skipped)")
+        return
+    scope = "all patients" if result.full else f"{result.patients} changed patients"
+    unclassified = f", {result.unclassified} unclassified" if result.unclassified else ""
+    print(f"[{result.seconds:8.3f}s] {result.code}: {scope}; "
+          f"{result.opened} gaps opened, {result.closed} closed{unclassified}")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Checkpoints for resumable star ETL runs, kept in phm_edw.etl_log.
+
+A checkpointed run writes one run row (``source_system = 'etl_edw_to_star'``)
+when it starts, and one step row (``'etl_edw_to_star:<step>'``) inside each
+step's own transaction, just before the step commits. A step is therefore
+recorded as complete if and only if its data is committed. All rows of a run
+share the run's ``load_start_timestamp``, which serves as the run id.
+
+When the latest run row is not SUCCESS (the run failed, or the process died
+and left it RUNNING), the next checkpointed run resumes it: steps with a
+SUCCESS row under that run id are skipped and the run row is reused.
+"""
+
+from typing import Optional, Set, Tuple
+
+RUN_SOURCE = 'etl_edw_to_star'
+STEP_SOURCE_PREFIX = RUN_SOURCE + ':'
+
+# phm_edw.etl_log.error_message is VARCHAR(2000)
+MAX_ERROR_LENGTH = 2000
+
+
+def _latest_run(cursor) -> Optional[Tuple[object, str]]:
+    cursor.execute("""
+        SELECT load_start_timestamp, load_status
+        FROM phm_edw.etl_log
+        WHERE source_system = %s
+        ORDER BY load_start_timestamp DESC, etl_log_id DESC
+        LIMIT 1;
+    """, (RUN_SOURCE,))
+    return cursor.fetchone()
+
+
+def completed_steps(cursor, run_start) -> Set[str]:
+    """Names of the steps that committed under the run started at ``run_start``."""
+    cursor.execute("""
+        SELECT DISTINCT substr(source_system, %s)
+        FROM phm_edw.etl_log
+        WHERE source_system LIKE %s AND load_start_timestamp = %s AND load_status = 'SUCCESS';
+    """, (len(STEP_SOURCE_PREFIX) + 1, STEP_SOURCE_PREFIX + '%', run_start))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def start_run(conn, restart: bool = False) -> Tuple[object, Set[str]]:
+    """Starts a checkpointed run, or resumes the latest unfinished one.
+
+    Returns (run_start, completed step names). With ``restart`` an unfinished
+    run is abandoned (marked FAILURE if it was still RUNNING) and a new run
+    starts from the first step.
+    """
+    with conn.cursor() as cursor:
+        latest = _latest_run(cursor)
+        if latest is not None and latest[1] != 'SUCCESS':
+            run_start = latest[0]
+            if not restart:
+                cursor.execute("""
+                    UPDATE phm_edw.etl_log
+                    SET load_status = 'RUNNING', load_end_timestamp = NULL, error_message = NULL
+                    WHERE source_system = %s AND load_start_timestamp = %s;
+                """, (RUN_SOURCE, run_start))
+                completed = completed_steps(cursor, run_start)
+                conn.commit()
+                return run_start, completed
+            cursor.execute("""
+                UPDATE phm_edw.etl_log
+                SET load_status = 'FAILURE', load_end_timestamp = LOCALTIMESTAMP,
+                    error_message = 'Abandoned by a restarted run'
+                WHERE source_system = %s AND load_start_timestamp = %s AND load_status = 'RUNNING';
+            """, (RUN_SOURCE, run_start))
+
+        cursor.execute("""
+            INSERT INTO phm_edw.etl_log (source_system, load_start_timestamp, load_status)
+            VALUES (%s, LOCALTIMESTAMP, 'RUNNING')
+            RETURNING load_start_timestamp;
+        """, (RUN_SOURCE,))
+        run_start = cursor.fetchone()[0]
+    conn.commit()
+    return run_start, set()
+
+
+def record_step(cursor, run_start, step_name: str, rows_inserted: int, rows_updated: int) -> None:
+    """Marks a step complete; call inside the step's transaction, before COMMIT."""
+    cursor.execute("""
+        INSERT INTO phm_edw.etl_log
+            (source_system, load_start_timestamp, load_end_timestamp, rows_inserted, rows_updated, load_status)
+        VALUES (%s, %s, LOCALTIMESTAMP, %s, %s, 'SUCCESS');
+    """, (STEP_SOURCE_PREFIX + step_name, run_start, rows_inserted, rows_updated))
+
+
+def finish_run(conn, run_start, status: str, error_message: Optional[str] = None) -> None:
+    """Closes the run row with SUCCESS or FAILURE and the run's row totals."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE phm_edw.etl_log AS run
+            SET load_status = %s,
+                load_end_timestamp = LOCALTIMESTAMP,
+                error_message = %s,
+                rows_inserted = steps.rows_inserted,
+                rows_updated = steps.rows_updated
+            FROM (
+                SELECT COALESCE(SUM(rows_inserted), 0) AS rows_inserted,
+                       COALESCE(SUM(rows_updated), 0) AS rows_updated
+                FROM phm_edw.etl_log
+                WHERE source_system LIKE %s AND load_start_timestamp = %s AND load_status = 'SUCCESS'
+            ) AS steps
+            WHERE run.source_system = %s AND run.load_start_timestamp = %s;
+        """, (status, error_message[:MAX_ERROR_LENGTH] if error_message else None,
+              STEP_SOURCE_PREFIX + '%', run_start, RUN_SOURCE, run_start))
+    conn.commit()
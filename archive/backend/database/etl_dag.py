@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Step DAG for running the star-schema ETL on several connections at once.
+
+The ETL script is cut into steps, one per target table in ``OPERATION_ORDER``
+(e.g. the close-old UPDATE and insert-new INSERT of dim_organization form one
+step). Dependencies are declared per table in etl_monitor.py. A step starts
+as soon as every step it depends on has committed, so the four Type-1
+dimensions load side by side and each fact waits only for its own dimensions.
+
+Every step runs in its own transaction on a pooled connection. Steps on
+different connections cannot see each other's uncommitted rows, so a step
+has to commit before its dependents start; the run as a whole is therefore
+published step by step rather than in one commit. A Type-1 step's committed
+``TRUNCATE ... CASCADE`` would leave readers with an empty dimension and
+facts until the rest of the run catches up, so etl_monitor.py only runs
+the DAG with those steps published by shadow swap (or for a full rebuild).
+The first failure stops new steps from being scheduled, lets running ones
+finish and reports the rest as skipped.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.pool
+
+from etl_explain import execute
+from etl_statements import Statement, classify, short_table_name
+
+# Transient errors after which a step is rolled back and run again.
+RETRYABLE_ERRORS = (psycopg2.errors.DeadlockDetected, psycopg2.errors.SerializationFailure)
+MAX_STEP_ATTEMPTS = 3
+
+# Commands the DAG runner issues itself instead of taking them from the script.
+TRANSACTION_COMMANDS = ('BEGIN', 'START', 'COMMIT', 'END', 'ROLLBACK')
+
+
+class StepError(Exception):
+    """Raised by a step executor to fail its step; the step's transaction is rolled back."""
+
+
+class EtlStep(NamedTuple):
+    name: str                        # Target table, e.g. 'dim_patient'
+    description: str                 # Last OPERATION_ORDER description for the table
+    statements: Tuple[Statement, ...]
+    depends_on: Tuple[str, ...]
+
+
+class StepResult(NamedTuple):
+    name: str
+    status: str                      # 'SUCCESS', 'FAILURE' or 'SKIPPED'
+    seconds: float
+    rowcounts: Tuple[int, ...]       # One per statement
+    statement_seconds: Tuple[float, ...]
+    error: Optional[str]
+    plans: Tuple[Optional[str], ...] = ()   # One per statement when a plan mode was set
+
+
+def build_steps(statements: Sequence[Statement],
+                operation_order: Sequence[Tuple[str, str]],
+                dependencies: Dict[str, Sequence[str]]) -> List[EtlStep]:
+    """Groups script statements into steps in OPERATION_ORDER order.
+
+    Raises ValueError when a statement's target is not in OPERATION_ORDER, a
+    dependency names an unknown or later step (so the serial order stays a
+    valid topological order and cycles are impossible), or a step depends on
+    one the script has no statements for (it could never start).
+    """
+    order: List[str] = []
+    descriptions: Dict[str, str] = {}
+    for _, description in operation_order:
+        table = description.split(" ")[0]
+        if table not in descriptions:
+            order.append(table)
+        descriptions[table] = description
+
+    grouped: Dict[str, List[Statement]] = {name: [] for name in order}
+    for statement in statements:
+        command, table = classify(statement.sql)
+        if command in TRANSACTION_COMMANDS:
+            continue
+        name = short_table_name(table)
+        if name not in grouped:
+            raise ValueError(f"line {statement.line}: {command} {table or ''} is not a step in OPERATION_ORDER")
+        grouped[name].append(statement)
+
+    unknown = sorted(set(dependencies) - set(grouped))
+    if unknown:
+        raise ValueError(f"dependencies declared for {', '.join(unknown)}, which are not steps in OPERATION_ORDER")
+    steps = []
+    for position, name in enumerate(order):
+        depends_on = tuple(dependencies.get(name, ()))
+        for dependency in depends_on:
+            if dependency not in grouped or order.index(dependency) >= position:
+                raise ValueError(f"step {name} depends on {dependency}, which is not an earlier step")
+        if grouped[name]:
+            for dependency in depends_on:
+                if not grouped[dependency]:
+                    raise ValueError(f"step {name} depends on {dependency}, which has no statements in the script")
+            steps.append(EtlStep(name, descriptions[name], tuple(grouped[name]), depends_on))
+    return steps
+
+
+def _run_step(pool, step: EtlStep, log: Callable[[str], None],
+              on_commit: Optional[Callable] = None, plan_mode: Optional[str] = None,
+              executor: Optional[Callable] = None) -> StepResult:
+    """Runs one step in its own transaction, retrying transient conflicts.
+
+    ``plan_mode`` is passed to etl_explain.execute for every statement.
+    ``executor(conn, step, log)``, when given, replaces running the statements:
+    it returns (one rowcount per statement, after_commit or None), or raises
+    StepError, and ``after_commit(cursor)`` runs in a second transaction once
+    the step has committed.
+
+    ``on_commit(cursor, step, rowcounts)`` runs in the step's transaction just
+    before COMMIT, so anything it writes commits atomically with the step.
+    """
+    start = time.perf_counter()
+    for attempt in range(1, MAX_STEP_ATTEMPTS + 1):
+        conn = pool.getconn()
+        rowcounts: List[int] = []
+        statement_seconds: List[float] = []
+        plans: List[Optional[str]] = []
+        after_commit = None
+        try:
+            conn.autocommit = False
+            if executor is not None:
+                executed_rowcounts, after_commit = executor(conn, step, log)
+                rowcounts.extend(executed_rowcounts)
+                statement_seconds.extend([0.0] * (len(rowcounts) - 1) + [time.perf_counter() - start])
+            with conn.cursor() as cursor:
+                for statement in (step.statements if executor is None else ()):
+                    statement_start = time.perf_counter()
+                    rowcount, plan = execute(cursor, statement.sql, classify(statement.sql)[0], plan_mode)
+                    rowcounts.append(rowcount)
+                    plans.append(plan)
+                    statement_seconds.append(time.perf_counter() - statement_start)
+                if on_commit is not None:
+                    on_commit(cursor, step, tuple(rowcounts))
+            conn.commit()
+            if after_commit is not None:
+                try:
+                    with conn.cursor() as cursor:
+                        after_commit(cursor)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    log(f"{step.name}: committed, but the follow-up failed: {str(e).strip()}")
+            return StepResult(step.name, 'SUCCESS', time.perf_counter() - start,
+                              tuple(rowcounts), tuple(statement_seconds), None, tuple(plans))
+        except RETRYABLE_ERRORS as e:
+            conn.rollback()
+            if attempt == MAX_STEP_ATTEMPTS:
+                return StepResult(step.name, 'FAILURE', time.perf_counter() - start,
+                                  tuple(rowcounts), tuple(statement_seconds), str(e).strip())
+            log(f"{step.name}: {type(e).__name__}, retrying (attempt {attempt + 1}/{MAX_STEP_ATTEMPTS})")
+        except (psycopg2.Error, StepError) as e:
+            conn.rollback()
+            return StepResult(step.name, 'FAILURE', time.perf_counter() - start,
+                              tuple(rowcounts), tuple(statement_seconds), str(e).strip())
+        finally:
+            pool.putconn(conn)
+    raise AssertionError("unreachable")
+
+
+def run_dag(steps: Sequence[EtlStep], connect_kwargs: Dict[str, object], workers: int,
+            on_result: Optional[Callable[[EtlStep, StepResult], None]] = None,
+            skip: Sequence[str] = (),
+            on_commit: Optional[Callable] = None,
+            plan_modes: Optional[Dict[str, str]] = None,
+            executors: Optional[Dict[str, Callable]] = None) -> List[StepResult]:
+    """Runs steps on up to ``workers`` connections, honouring dependencies.
+
+    Steps named in ``skip`` count as already complete (their dependents may
+    start at once) and are not reported. ``on_commit`` is passed to every
+    step; ``plan_modes`` and ``executors`` map step names to their plan mode
+    and custom executor (see ``_run_step``). Returns one result per remaining
+    step, in completion order, with never-started steps last as SKIPPED;
+    callers must treat any SKIPPED step as a failed run.
+    """
+    print_lock = threading.Lock()
+
+    def log(message):
+        with print_lock:
+            print(message)
+
+    done = set(skip)
+    pending = [step for step in steps if step.name not in done]
+    results: List[StepResult] = []
+    failed = False
+    pool = psycopg2.pool.ThreadedConnectionPool(1, workers, **connect_kwargs)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                if not failed:
+                    # Launch every step whose dependencies have all committed, in script order
+                    for step in [s for s in pending if all(d in done for d in s.depends_on)]:
+                        if len(running) >= workers:
+                            break
+                        pending.remove(step)
+                        log(f"Starting {step.name}" + (f" (after {', '.join(step.depends_on)})" if step.depends_on else ""))
+                        running[executor.submit(_run_step, pool, step, log, on_commit,
+                                                (plan_modes or {}).get(step.name),
+                                                (executors or {}).get(step.name))] = step
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    result = future.result()
+                    results.append(result)
+                    if result.status == 'SUCCESS':
+                        done.add(step.name)
+                    else:
+                        failed = True
+                    if on_result is not None:
+                        with print_lock:
+                            on_result(step, result)
+    finally:
+        pool.closeall()
+
+    for step in pending:
+        results.append(StepResult(step.name, 'SKIPPED', 0.0, (), (), None))
+    return results
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Execution-plan capture for the ETL runners in etl_monitor.py.
+
+Statements run in one of three plan modes:
+
+    None        executed as is
+    'estimate'  ``EXPLAIN (FORMAT JSON)`` first (planning only, milliseconds),
+                then executed; this records what a normal, fast run planned
+    'analyze'   executed *as* ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)``, so
+                the statement does its work once and the actual plan, timings
+                and buffer counts come back instead of a row count
+
+etl_monitor.py picks 'analyze' for steps that were slower than the explain
+threshold on the previous run and 'estimate' for the rest. Plans are stored
+in the run history (etl_history.py), and an analyzed plan is diffed against
+the plan of the last run in which the same statement was fast. Diffs compare
+plan shape only (node types, relations, indexes, join strategies), since
+costs and row counts differ on every run.
+"""
+
+import difflib
+import json
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+EXPLAINABLE_COMMANDS = ('INSERT', 'UPDATE', 'DELETE', 'SELECT', 'MERGE')
+# Root-node counters reported by plan_buffers (they include every child node's).
+BUFFER_COUNTERS = {
+    'shared_hit': 'Shared Hit Blocks',
+    'shared_read': 'Shared Read Blocks',
+    'temp_read': 'Temp Read Blocks',
+    'temp_written': 'Temp Written Blocks',
+}
+DEFAULT_EXPLAIN_THRESHOLD = 60.0  # Seconds
+
+
+class PlanCapture(NamedTuple):
+    step: str
+    statement_index: int     # Position of the statement within its step
+    analyzed: bool
+    seconds: float
+    plan: str                # EXPLAIN (FORMAT JSON) output
+
+
+def execute(cursor, sql: str, command: str, mode: Optional[str] = None) -> Tuple[int, Optional[str]]:
+    """Executes one statement in the given plan mode; returns (rowcount, plan JSON or None).
+
+    In 'analyze' mode the row count is read from the plan (see ``plan_rowcount``).
+    """
+    if mode is None or command not in EXPLAINABLE_COMMANDS:
+        cursor.execute(sql)
+        return max(cursor.rowcount, 0), None
+    if mode == 'estimate':
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plan = cursor.fetchone()[0]
+        cursor.execute(sql)
+        return max(cursor.rowcount, 0), json.dumps(plan)
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+    plan = cursor.fetchone()[0]
+    return plan_rowcount(plan), json.dumps(plan)
+
+
+def _root(plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def plan_rowcount(plan) -> int:
+    """Rows written (or returned) according to an analyzed plan.
+
+    A ModifyTable node reports its own ``Actual Rows`` as 0 (no RETURNING), so
+    the count comes from ``Tuples Inserted`` for ON CONFLICT inserts, and
+    otherwise from the node's outer input.
+    """
+    node = _root(plan)['Plan']
+    if node['Node Type'] != 'ModifyTable':
+        return int(node.get('Actual Rows', 0) * node.get('Actual Loops', 1))
+    if 'Tuples Inserted' in node:
+        return int(node['Tuples Inserted'])
+    for child in node.get('Plans', []):
+        if child.get('Parent Relationship') == 'Outer':
+            return int(child.get('Actual Rows', 0) * child.get('Actual Loops', 1))
+    return 0
+
+
+def plan_shape(plan) -> List[str]:
+    """One line per plan node: type, relation, index and join details, indented by depth."""
+    lines: List[str] = []
+
+    def walk(node, depth):
+        parts = [node['Node Type']]
+        if node.get('Strategy') not in (None, 'Plain'):
+            parts.append(f"({node['Strategy']})")
+        if node.get('Join Type'):
+            parts.append(f"({node['Join Type']})")
+        for key, label in (('Relation Name', 'on'), ('Index Name', 'using')):
+            if node.get(key):
+                parts.append(f"{label} {node[key]}")
+        if node.get('Parent Relationship') not in (None, 'Outer'):
+            parts.append(f"[{node['Parent Relationship']}]")
+        lines.append("  " * depth + " ".join(parts))
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(_root(plan)['Plan'], 0)
+    return lines
+
+
+def plan_summary(plan) -> str:
+    """Execution time and shared-buffer traffic of an analyzed plan."""
+    root = _root(plan)
+    node = root['Plan']
+    hit = node.get('Shared Hit Blocks', 0)
+    read = node.get('Shared Read Blocks', 0)
+    return (f"execution {root.get('Execution Time', 0.0) / 1000:.3f}s, "
+            f"shared buffers hit {hit}, read {read}")
+
+
+def plan_buffers(plan) -> Dict[str, float]:
+    """Buffer counters, planning and execution milliseconds of an analyzed plan."""
+    root = _root(plan)
+    counters: Dict[str, float] = {name: root['Plan'].get(key, 0) for name, key in BUFFER_COUNTERS.items()}
+    counters['planning_ms'] = root.get('Planning Time', 0.0)
+    counters['execution_ms'] = root.get('Execution Time', 0.0)
+    return counters
+
+
+def diff_plans(old_plan, new_plan, old_label: str, new_label: str) -> List[str]:
+    """Unified diff of two plans' shapes; empty when the shape did not change."""
+    return list(difflib.unified_diff(plan_shape(old_plan), plan_shape(new_plan),
+                                     fromfile=old_label, tofile=new_label, lineterm=''))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Full-rebuild mode for the star load (``etl_monitor.py --full-rebuild``).
+
+The incremental path in ETL_edw_to_star.sql maintains every fact index row by
+row and WAL-logs every inserted row, which is the right trade for small
+deltas and the wrong one for a first load or a disaster rebuild. In
+full-rebuild mode:
+
+1. ``prepare_tables`` drops the fact tables' nonessential indexes (those not
+   backing a PRIMARY KEY, UNIQUE or EXCLUDE constraint), truncates the facts
+   and switches them to UNLOGGED, so the facts themselves are the staging
+   tables. Each dropped definition is recorded in phm_edw.etl_pending_index
+   in the same transaction.
+2. The fact steps run unchanged: one bulk ``INSERT ... SELECT`` per step into
+   tables that write no WAL and have no secondary indexes to maintain.
+3. ``rebuild_indexes`` publishes the facts with ``ALTER TABLE ... SET
+   LOGGED``, which writes each table to WAL once, then recreates the dropped
+   indexes on ``workers`` connections, deleting each one's pending row in the
+   same transaction, and ``ANALYZE``s the facts. It also runs after a failed
+   load, so the facts are never left unlogged or without their indexes.
+
+Foreign keys between the facts (fact_diagnosis -> fact_encounter, ...) fix
+the order: a logged table cannot reference an unlogged one, so referencing
+facts go UNLOGGED first and LOGGED last.
+
+If the process dies between 1 and 3, the facts stay empty (a crash also
+empties unlogged tables) and unindexed, but the definitions survive in
+etl_pending_index: the next full rebuild recreates them
+(``pending_indexes``), and etl_monitor.py refuses to run an incremental load
+until it has (``unlogged_tables`` catches a rebuild with nothing to reindex).
+
+``report_savings`` compares the fact steps with the incremental path's
+throughput recorded in the run history (etl_history.py).
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import psycopg2
+from psycopg2 import sql
+
+from etl_statements import classify
+
+STAR_SCHEMA = 'phm_star'
+REBUILD_STEP = 'rebuild_indexes'          # Step name of the index rebuild in the run history
+REBUILD_MAINTENANCE_WORK_MEM = '256MB'    # Per connection; workers connections build at once
+DEFAULT_INDEX_WORKERS = 4                 # Connections rebuilding indexes at once (etl_monitor.py --index-workers)
+
+
+class IndexDefinition(NamedTuple):
+    table: str          # Qualified table, e.g. 'phm_star.fact_encounter'
+    name: str           # Qualified index name
+    definition: str     # pg_get_indexdef() output
+
+
+def _ident(qualified: str) -> sql.Identifier:
+    return sql.Identifier(*qualified.split('.'))
+
+
+def fact_table(step) -> str:
+    """Qualified table a fact step (etl_dag.EtlStep) writes; every statement must write the same one."""
+    tables = {classify(statement.sql)[1] for statement in step.statements}
+    if len(tables) != 1 or None in tables:
+        raise ValueError(f"step {step.name} does not write a single table")
+    return tables.pop()
+
+
+def nonessential_indexes(cursor, tables: Sequence[str]) -> List[IndexDefinition]:
+    """Indexes on ``tables`` that back no constraint, in a stable order."""
+    cursor.execute("""
+        SELECT i.indrelid::regclass::text, i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+        FROM pg_index AS i
+        WHERE i.indrelid = ANY(%s::regclass[])
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint AS c WHERE c.conindid = i.indexrelid)
+        ORDER BY 1, 2;
+    """, (list(tables),))
+    return [IndexDefinition(*row) for row in cursor.fetchall()]
+
+
+def pending_indexes(cursor) -> List[IndexDefinition]:
+    """Indexes dropped by a full rebuild and not yet recreated."""
+    cursor.execute("""
+        SELECT table_name, index_name, index_definition
+        FROM phm_edw.etl_pending_index
+        ORDER BY table_name, index_name;
+    """)
+    return [IndexDefinition(*row) for row in cursor.fetchall()]
+
+
+def unlogged_tables(cursor) -> List[str]:
+    """Tables in STAR_SCHEMA still UNLOGGED, i.e. left behind by an interrupted full rebuild."""
+    cursor.execute("""
+        SELECT c.oid::regclass::text FROM pg_class AS c
+        WHERE c.relnamespace = %s::regnamespace AND c.relkind = 'r' AND c.relpersistence = 'u'
+        ORDER BY 1;
+    """, (STAR_SCHEMA,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def reference_levels(cursor, tables: Sequence[str]) -> List[List[str]]:
+    """``tables`` in levels: each table references (by foreign key) only tables in earlier levels."""
+    cursor.execute("""
+        SELECT conrelid::regclass::text, confrelid::regclass::text FROM pg_constraint
+        WHERE contype = 'f' AND conrelid <> confrelid
+          AND conrelid = ANY(%(tables)s::regclass[]) AND confrelid = ANY(%(tables)s::regclass[]);
+    """, {'tables': list(tables)})
+    references: Dict[str, set] = {table: set() for table in tables}
+    for referencing, referenced in cursor.fetchall():
+        references[referencing].add(referenced)
+    levels: List[List[str]] = []
+    placed: set = set()
+    while len(placed) < len(tables):
+        level = [table for table in tables if table not in placed and references[table] <= placed]
+        if not level:
+            raise ValueError(f"foreign-key cycle among {', '.join(sorted(set(tables) - placed))}")
+        levels.append(level)
+        placed.update(level)
+    return levels
+
+
+def prepare_tables(conn, tables: Sequence[str]) -> List[IndexDefinition]:
+    """Drops the nonessential indexes, truncates ``tables`` and makes them UNLOGGED, in one transaction.
+
+    Returns every index the rebuild must recreate: those dropped now plus any
+    left pending by an earlier full rebuild that did not finish.
+    """
+    with conn.cursor() as cursor:
+        pending = pending_indexes(cursor)
+        indexes = nonessential_indexes(cursor, tables)
+        for index in indexes:
+            cursor.execute(sql.SQL("DROP INDEX {}").format(_ident(index.name)))
+            cursor.execute("""
+                INSERT INTO phm_edw.etl_pending_index (index_name, table_name, index_definition)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (index_name) DO NOTHING;
+            """, (index.name, index.table, index.definition))
+        cursor.execute(sql.SQL("TRUNCATE {}").format(sql.SQL(", ").join(_ident(table) for table in tables)))
+        for level in reversed(reference_levels(cursor, tables)):
+            for table in level:
+                cursor.execute(sql.SQL("ALTER TABLE {} SET UNLOGGED").format(_ident(table)))
+    conn.commit()
+    recorded = {index.name for index in pending}
+    return pending + [index for index in indexes if index.name not in recorded]
+
+
+def rebuild_indexes(connect_kwargs: Dict[str, object], indexes: Sequence[IndexDefinition],
+                    tables: Sequence[str], workers: int = DEFAULT_INDEX_WORKERS,
+                    log: Callable[[str], None] = print) -> Tuple[float, List[str]]:
+    """Makes ``tables`` LOGGED, recreates ``indexes`` concurrently, then ANALYZEs ``tables``.
+
+    Returns (wall-clock seconds, errors). A table or index that fails is
+    reported and the rest still run, so one bad definition cannot leave the
+    other facts unindexed; a failed index stays in etl_pending_index for the
+    next rebuild.
+    """
+    start = time.perf_counter()
+    errors: List[str] = []
+
+    def run(label, statement, index_name=None):
+        conn = psycopg2.connect(**connect_kwargs)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET maintenance_work_mem = %s", (REBUILD_MAINTENANCE_WORK_MEM,))
+                step_start = time.perf_counter()
+                cursor.execute(statement)
+                if index_name is not None:
+                    cursor.execute("DELETE FROM phm_edw.etl_pending_index WHERE index_name = %s;", (index_name,))
+            conn.commit()
+            log(f"[{time.perf_counter() - step_start:.3f}s] {label}")
+        except psycopg2.Error as e:
+            conn.rollback()
+            errors.append(f"{label}: {str(e).strip()}")
+            log(f"ERROR: {label}: {str(e).strip()}")
+        finally:
+            conn.close()
+
+    conn = psycopg2.connect(**connect_kwargs)
+    try:
+        with conn.cursor() as cursor:
+            levels = reference_levels(cursor, tables)
+    finally:
+        conn.close()
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="etl-index") as pool:
+        # Referenced facts first: a logged table cannot reference an unlogged one
+        for level in levels:
+            list(pool.map(lambda table: run(f"SET LOGGED {table}",
+                                            sql.SQL("ALTER TABLE {} SET LOGGED").format(_ident(table))),
+                          level))
+        list(pool.map(lambda index: run(f"CREATE INDEX {index.name}", index.definition, index.name), indexes))
+        list(pool.map(lambda table: run(f"ANALYZE {table}", sql.SQL("ANALYZE {}").format(_ident(table))),
+                      tables))
+    return time.perf_counter() - start, errors
+
+
+def report_savings(baseline: Dict[str, Tuple[int, float]], timings: Sequence, fact_steps: Sequence[str]) -> None:
+    """Prints each fact step's time against the incremental path's throughput for the same rows.
+
+    ``baseline`` maps step -> (rows inserted, seconds) from an incremental-path
+    run (etl_history.step_throughput); ``timings`` are this run's
+    etl_history.StepTiming, including the REBUILD_STEP entry.
+    """
+    rebuild = sum(t.seconds for t in timings if t.step == REBUILD_STEP)
+    projected = actual = 0.0
+    compared = []
+    print("Full rebuild vs. incremental path (projected from the incremental path's rows/second):")
+    for timing in timings:
+        if timing.step not in fact_steps or timing.status != 'SUCCESS' or timing.step not in baseline:
+            continue
+        rows, seconds = baseline[timing.step]
+        estimate = timing.rows_inserted * seconds / rows
+        projected += estimate
+        actual += timing.seconds
+        compared.append(timing.step)
+        print(f"  {timing.step:<24} {timing.rows_inserted:>10} rows  {timing.seconds:>9.3f}s "
+              f"(incremental path ~{estimate:.3f}s, from {rows} rows in {seconds:.3f}s)")
+    if not compared:
+        print("  No incremental-path run with inserted rows in the history to compare against.")
+        return
+    total = actual + rebuild
+    print(f"  {'index rebuild + ANALYZE':<24} {'':>15}  {rebuild:>9.3f}s")
+    print(f"  Total {total:.3f}s vs. ~{projected:.3f}s: "
+          f"{'saved' if projected >= total else 'lost'} ~{abs(projected - total):.3f}s "
+          f"({len(compared)} fact steps compared)")
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Run history for etl_monitor.py, kept in a local SQLite file.
+
+Every native run (serial or DAG) stores one ``runs`` row and one ``steps`` row
+per step: wall time, rows inserted/updated and status. Steps are named by
+their target table, as in etl_dag.py, so serial and parallel runs compare
+directly.
+
+The report shows p50/p95 step durations over the last N successful runs and
+flags steps whose latest duration exceeds their baseline (the median of the
+earlier runs in the window) by a factor, so a dropped index or a bloated
+table shows up the morning it happens:
+
+    python etl_history.py --runs 30 --threshold 1.5
+
+Execution plans captured by the runner (etl_explain.py) are kept in the same
+file; ``--plan-diff STEP`` shows the step's latest analyzed plan against the
+last run in which the step was fast.
+
+Full-rebuild runs (etl_full_load.py) are stored too, but their steps do
+different work, so they are left out of the step statistics and instead
+compared against the incremental path's throughput (``step_throughput``).
+"""
+
+import argparse
+import datetime
+import math
+import os
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from etl_explain import DEFAULT_EXPLAIN_THRESHOLD, PlanCapture, diff_plans, plan_summary
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "etl_history.sqlite")
+DEFAULT_REPORT_RUNS = 30
+DEFAULT_THRESHOLD = 1.5
+# Steps faster than this are never flagged; their timing is mostly noise.
+MIN_REGRESSION_SECONDS = 1.0
+FULL_REBUILD_RUNNER = "full"   # Runs of etl_monitor.py --full-rebuild; kept out of the step statistics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       INTEGER PRIMARY KEY,
+    started_at   TEXT    NOT NULL,
+    runner       TEXT    NOT NULL,
+    script       TEXT    NOT NULL,
+    workers      INTEGER NOT NULL,
+    status       TEXT    NOT NULL,
+    seconds      REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id        INTEGER NOT NULL REFERENCES runs (run_id),
+    step          TEXT    NOT NULL,
+    status        TEXT    NOT NULL,
+    seconds       REAL    NOT NULL,
+    rows_inserted INTEGER NOT NULL,
+    rows_updated  INTEGER NOT NULL,
+    PRIMARY KEY (run_id, step)
+);
+CREATE TABLE IF NOT EXISTS plans (
+    run_id          INTEGER NOT NULL REFERENCES runs (run_id),
+    step            TEXT    NOT NULL,
+    statement_index INTEGER NOT NULL,
+    analyzed        INTEGER NOT NULL,
+    seconds         REAL    NOT NULL,
+    plan            TEXT    NOT NULL,
+    PRIMARY KEY (run_id, step, statement_index)
+);
+"""
+
+
+class StepTiming(NamedTuple):
+    step: str
+    status: str          # 'SUCCESS', 'FAILURE' or 'ROLLED_BACK' (serial run that failed later)
+    seconds: float
+    rows_inserted: int
+    rows_updated: int
+
+
+class StepStats(NamedTuple):
+    step: str
+    runs: int
+    p50: float
+    p95: float
+    latest: Optional[float]
+    baseline: Optional[float]   # Median of the earlier runs in the window
+    regressed: bool
+
+
+def open_history(path: str = DEFAULT_HISTORY_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_run(conn: sqlite3.Connection, started_at: datetime.datetime, runner: str, script: str,
+               workers: int, status: str, seconds: float, steps: Sequence[StepTiming],
+               plans: Sequence[PlanCapture] = ()) -> int:
+    """Stores one run with its steps and captured plans; returns the new run_id."""
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO runs (started_at, runner, script, workers, status, seconds) VALUES (?, ?, ?, ?, ?, ?)",
+            (started_at.isoformat(timespec='seconds'), runner, os.path.basename(script), workers, status, seconds),
+        )
+        run_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO steps (run_id, step, status, seconds, rows_inserted, rows_updated) VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, s.step, s.status, s.seconds, s.rows_inserted, s.rows_updated) for s in steps],
+        )
+        conn.executemany(
+            "INSERT INTO plans (run_id, step, statement_index, analyzed, seconds, plan) VALUES (?, ?, ?, ?, ?, ?)",
+            [(run_id, p.step, p.statement_index, int(p.analyzed), p.seconds, p.plan) for p in plans],
+        )
+    return run_id
+
+
+def latest_step_seconds(conn: sqlite3.Connection) -> Dict[str, float]:
+    """Duration of each step in the newest run where it succeeded."""
+    rows = conn.execute("""
+        SELECT s.step, s.seconds
+        FROM steps AS s
+        JOIN runs AS r ON r.run_id = s.run_id
+        WHERE s.status = 'SUCCESS' AND r.runner <> ?
+        ORDER BY s.run_id
+    """, (FULL_REBUILD_RUNNER,)).fetchall()
+    return dict(rows)
+
+
+def step_throughput(conn: sqlite3.Connection) -> Dict[str, Tuple[int, float]]:
+    """(rows inserted, seconds) per step from the incremental-path run where it inserted the most rows."""
+    rows = conn.execute("""
+        SELECT s.step, s.rows_inserted, s.seconds
+        FROM steps AS s
+        JOIN runs AS r ON r.run_id = s.run_id
+        WHERE s.status = 'SUCCESS' AND r.runner <> ? AND s.rows_inserted > 0 AND s.seconds > 0
+        ORDER BY s.rows_inserted, s.run_id
+    """, (FULL_REBUILD_RUNNER,)).fetchall()
+    return {step: (rows_inserted, seconds) for step, rows_inserted, seconds in rows}
+
+
+def last_fast_plan(conn: sqlite3.Connection, step: str, statement_index: int, threshold: float,
+                   before_run_id: int) -> Optional[Tuple[int, str]]:
+    """(run_id, plan) from the newest earlier run in which ``step`` succeeded within ``threshold`` seconds."""
+    return conn.execute("""
+        SELECT p.run_id, p.plan
+        FROM plans AS p
+        JOIN steps AS s ON s.run_id = p.run_id AND s.step = p.step
+        WHERE p.step = ? AND p.statement_index = ? AND p.run_id < ?
+          AND s.status = 'SUCCESS' AND s.seconds <= ?
+        ORDER BY p.run_id DESC
+        LIMIT 1
+    """, (step, statement_index, before_run_id, threshold)).fetchone()
+
+
+def print_plan_diffs(conn: sqlite3.Connection, run_id: int, threshold: float = DEFAULT_EXPLAIN_THRESHOLD,
+                     step: Optional[str] = None) -> int:
+    """Diffs the analyzed plans of ``run_id`` against each statement's last fast run; returns how many were shown."""
+    query = "SELECT step, statement_index, seconds, plan FROM plans WHERE run_id = ? AND analyzed = 1"
+    params: List[object] = [run_id]
+    if step is not None:
+        query += " AND step = ?"
+        params.append(step)
+    shown = 0
+    for plan_step, statement_index, seconds, plan in conn.execute(query + " ORDER BY rowid", params).fetchall():
+        label = f"{plan_step} statement {statement_index + 1}"
+        print(f"--- Plan for {label} in run #{run_id}: {seconds:.3f}s, {plan_summary(plan)} ---")
+        fast = last_fast_plan(conn, plan_step, statement_index, threshold, run_id)
+        if fast is None:
+            print(f"No earlier run of {plan_step} within {threshold}s to compare against.")
+        else:
+            diff = diff_plans(fast[1], plan, f"run #{fast[0]} (fast)", f"run #{run_id}")
+            print("\n".join(diff) if diff else f"Same plan shape as run #{fast[0]} (fast); "
+                                               "look at row counts and buffers instead.")
+        shown += 1
+    return shown
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def step_stats(conn: sqlite3.Connection, runs: int = DEFAULT_REPORT_RUNS,
+               threshold: float = DEFAULT_THRESHOLD) -> List[StepStats]:
+    """Per-step duration statistics over the last ``runs`` runs.
+
+    Only successful steps count. ``latest`` is the step's duration in the
+    newest run that has it; it is flagged when it is more than ``threshold``
+    times the baseline and at least MIN_REGRESSION_SECONDS slower.
+    """
+    rows = conn.execute("""
+        SELECT s.step, s.seconds
+        FROM steps AS s
+        JOIN (SELECT run_id FROM runs WHERE runner <> ? ORDER BY run_id DESC LIMIT ?) AS recent
+            ON recent.run_id = s.run_id
+        WHERE s.status = 'SUCCESS'
+        ORDER BY s.run_id, s.rowid
+    """, (FULL_REBUILD_RUNNER, runs)).fetchall()
+    by_step: Dict[str, List[float]] = {}
+    for step, seconds in rows:
+        by_step.setdefault(step, []).append(seconds)
+
+    stats = []
+    for step, durations in by_step.items():
+        latest = durations[-1]
+        earlier = durations[:-1]
+        baseline = percentile(earlier, 0.5) if earlier else None
+        regressed = (baseline is not None and latest > baseline * threshold
+                     and latest - baseline >= MIN_REGRESSION_SECONDS)
+        stats.append(StepStats(step, len(durations), percentile(durations, 0.5), percentile(durations, 0.95),
+                               latest, baseline, regressed))
+    return stats
+
+
+def print_regressions(stats: Sequence[StepStats], threshold: float = DEFAULT_THRESHOLD) -> None:
+    for s in stats:
+        if s.regressed:
+            print(f"REGRESSION: {s.step} took {s.latest:.3f}s, {s.latest / s.baseline:.1f}x its "
+                  f"baseline of {s.baseline:.3f}s (threshold {threshold}x).")
+
+
+def print_report(conn: sqlite3.Connection, runs: int = DEFAULT_REPORT_RUNS,
+                 threshold: float = DEFAULT_THRESHOLD) -> bool:
+    """Prints the step report; returns True if any step regressed."""
+    recent = conn.execute("""
+        SELECT run_id, started_at, runner, workers, status, seconds FROM runs ORDER BY run_id DESC LIMIT ?
+    """, (runs,)).fetchall()
+    if not recent:
+        print("No ETL runs recorded yet.")
+        return False
+
+    print(f"--- Last {len(recent)} runs ---")
+    for run_id, started_at, runner, workers, status, seconds in recent[:5]:
+        print(f"#{run_id:<5} {started_at}  {runner:<6} {workers} worker(s)  {status:<8} "
+              f"{datetime.timedelta(seconds=round(seconds))}")
+    if len(recent) > 5:
+        print(f"... and {len(recent) - 5} earlier")
+
+    stats = step_stats(conn, runs, threshold)
+    print("\n--- Step Durations (successful runs, full rebuilds excluded) ---")
+    print(f"{'Step':<24}{'Runs':>6}{'p50 (s)':>10}{'p95 (s)':>10}{'Latest (s)':>12}{'Baseline (s)':>14}")
+    for s in stats:
+        baseline = f"{s.baseline:.3f}" if s.baseline is not None else '-'
+        flag = "  SLOW" if s.regressed else ""
+        print(f"{s.step:<24}{s.runs:>6}{s.p50:>10.3f}{s.p95:>10.3f}{s.latest:>12.3f}{baseline:>14}{flag}")
+    print()
+    print_regressions(stats, threshold)
+    regressed = any(s.regressed for s in stats)
+    if not regressed:
+        print(f"No step is more than {threshold}x slower than its baseline.")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report ETL step durations and regressions from the run history.")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH,
+                        help=f"SQLite run history (default {DEFAULT_HISTORY_PATH}).")
+    parser.add_argument("--runs", type=int, default=DEFAULT_REPORT_RUNS,
+                        help=f"Number of most recent runs to include (default {DEFAULT_REPORT_RUNS}).")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Flag steps slower than this multiple of their baseline (default {DEFAULT_THRESHOLD}).")
+    parser.add_argument("--plan-diff", metavar="STEP",
+                        help="Instead of the report, diff STEP's latest analyzed plan against its last fast run.")
+    parser.add_argument("--explain-threshold", type=float, default=DEFAULT_EXPLAIN_THRESHOLD,
+                        help=f"With --plan-diff, a run is 'fast' if the step took at most this many seconds "
+                             f"(default {DEFAULT_EXPLAIN_THRESHOLD:g}).")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    if args.threshold <= 1.0:
+        parser.error("--threshold must be greater than 1")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not os.path.exists(args.history):
+        print(f"No run history at {args.history}.")
+        raise SystemExit(0)
+    history = open_history(args.history)
+    try:
+        if args.plan_diff:
+            latest = history.execute("SELECT MAX(run_id) FROM plans WHERE step = ? AND analyzed = 1",
+                                     (args.plan_diff,)).fetchone()[0]
+            if latest is None:
+                print(f"No analyzed plan captured for {args.plan_diff} yet.")
+            else:
+                print_plan_diffs(history, latest, args.explain_threshold, args.plan_diff)
+            regressed = False
+        else:
+            regressed = print_report(history, args.runs, args.threshold)
+    finally:
+        history.close()
+    raise SystemExit(1 if regressed else 0)
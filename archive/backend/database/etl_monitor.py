@@ -1,3 +1,4 @@
+import argparse
 import subprocess
 import sys
 import re
@@ -5,13 +6,38 @@ import signal
 import os
 import time
 import datetime
-from typing import List, Tuple, Optional
+import sqlite3
+from typing import Dict, List, NamedTuple, Tuple, Optional
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import etl_checkpoint
+    import etl_full_load
+    import etl_swap
+    import etl_watermarks
+    from etl_dag import StepError, build_steps, run_dag
+    from etl_full_load import DEFAULT_INDEX_WORKERS
+    from etl_progress import DEFAULT_PROGRESS_INTERVAL, start_monitor
+except ImportError:  # Only the native and DAG runners and the progress monitor need psycopg2
+    psycopg2 = None
+    DEFAULT_INDEX_WORKERS = 4
+    DEFAULT_PROGRESS_INTERVAL = 10.0
+
+import etl_history
+from etl_explain import DEFAULT_EXPLAIN_THRESHOLD, PlanCapture, execute, plan_summary
+from etl_history import DEFAULT_HISTORY_PATH, StepTiming
+from etl_statements import Statement, classify, short_table_name, split_sql
 
 # --- Configuration ---
 DB_NAME = "medgnosis"
 DB_USER = "postgres"
 DB_PASSWORD = "acumenus"  # Be cautious about hardcoding passwords
 SQL_SCRIPT_PATH = "backend/database/ETL_Refresh_Full.sql" # Updated script path
+RUNNERS = ("native", "psql")
+PUBLISH_MODES = ("truncate", "swap")
+# Every ETL connection (psql, native, DAG workers) uses this, so the progress monitor can find them
+ETL_APPLICATION_NAME = f"etl_monitor:{os.getpid()}"
 
 # Expected order of DML/DDL operations based on ETL_Refresh_Full.sql
 # Format: (Operation Type, Target Table/Step Description)
@@ -50,16 +76,61 @@ OPERATION_ORDER: List[Tuple[str, str]] = [
     # Step 13: FactObservation
     ("INSERT", "fact_observation (Incremental Load)"),
     # Step 14: FactCareGap
+    ("UPDATE", "fact_care_gap (Refresh Existing Gaps)"),
     ("INSERT", "fact_care_gap (Incremental Load)"),
 ]
+
+# Which steps (target tables above) must commit before a step may start when
+# running with --workers > 1. Steps not listed depend on nothing. A dependency
+# must appear earlier in OPERATION_ORDER. The Type-1 dimensions truncate with
+# CASCADE, which also empties the facts that reference them, so each fact has
+# to wait for its dimensions.
+STEP_DEPENDENCIES: Dict[str, List[str]] = {
+    "dim_provider": ["dim_organization"],
+    "dim_patient": ["dim_provider"],
+    "fact_encounter": ["dim_organization", "dim_provider", "dim_patient"],
+    "fact_diagnosis": ["fact_encounter", "dim_condition"],
+    "fact_procedure": ["fact_encounter", "dim_procedure"],
+    "fact_medication_order": ["fact_encounter", "dim_medication"],
+    "fact_observation": ["fact_encounter"],
+    "fact_care_gap": ["dim_patient", "dim_measure"],
+}
+
+# Natural key of each Type-1 dimension. With --publish swap, members whose
+# natural key already exists keep their surrogate key (see etl_swap.py).
+TYPE1_NATURAL_KEYS: Dict[str, str] = {
+    "dim_condition": "condition_id",
+    "dim_procedure": "procedure_id",
+    "dim_medication": "medication_id",
+    "dim_measure": "measure_id",
+}
+
+# EDW source table read by each incremental fact step. The step only scans
+# rows changed since that table's watermark (see etl_watermarks.py).
+FACT_SOURCES: Dict[str, str] = {
+    "fact_encounter": "phm_edw.encounter",
+    "fact_diagnosis": "phm_edw.condition_diagnosis",
+    "fact_procedure": "phm_edw.procedure_performed",
+    "fact_medication_order": "phm_edw.medication_order",
+    "fact_observation": "phm_edw.observation",
+    "fact_care_gap": "phm_edw.care_gap",
+}
 # --- End Configuration ---
 
 # Global variable to hold the subprocess
 psql_process: Optional[subprocess.Popen] = None
+# Connection used by the native runner, so Ctrl+C can cancel the running statement
+native_conn = None
 
 def signal_handler(sig, frame):
     """Handles Ctrl+C interruption."""
     print("\nStopping ETL process...")
+    if native_conn is not None:
+        try:
+            print("Cancelling the running statement...")
+            native_conn.cancel()
+        except Exception as e:
+            print(f"Error cancelling statement: {e}")
     if psql_process:
         try:
             print("Attempting to terminate psql...")
@@ -80,6 +151,7 @@ def run_etl():
     # Set environment variable for password
     env = os.environ.copy()
     env["PGPASSWORD"] = DB_PASSWORD
+    env["PGAPPNAME"] = ETL_APPLICATION_NAME
 
     command = [
         "psql",
@@ -231,7 +303,685 @@ def run_etl():
             print("Cleaning up lingering psql process...")
             psql_process.kill()
 
+# --- Native Runner ---
+class StatementResult(NamedTuple):
+    statement: Statement
+    command: str
+    table: Optional[str]
+    description: str          # OPERATION_ORDER description, or the target table
+    operation_number: Optional[int]  # 1-based position in OPERATION_ORDER, if matched
+    rowcount: int
+    seconds: float
+    plan: Optional[str] = None       # EXPLAIN JSON, when a plan mode applied
+    analyzed: bool = False
+
+def prepare_watermarks(conn, steps, swapped=(),
+                       full_rebuild: bool = False) -> Tuple[datetime.datetime, Dict[str, Optional[datetime.datetime]]]:
+    """Reads the stored watermarks and decides how each fact step loads.
+
+    Returns (run start, read-from time per source table), where None means a
+    full load. The run start becomes the new watermark of every fact step
+    that commits. ``swapped`` names the steps published by shadow swap;
+    with ``full_rebuild`` every fact step loads in full.
+    """
+    emptied = etl_watermarks.emptied_by_truncate(steps, STEP_DEPENDENCIES, swapped)
+    names = {step.name for step in steps}
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT LOCALTIMESTAMP;")
+        run_start = cursor.fetchone()[0]
+        stored = etl_watermarks.get_watermarks(cursor, FACT_SOURCES.values())
+    conn.commit()
+
+    since: Dict[str, Optional[datetime.datetime]] = {}
+    for step, table in FACT_SOURCES.items():
+        if step not in names:
+            continue
+        if full_rebuild:
+            since[table] = None
+            print(f"Watermark: {step} loads in full (full rebuild).")
+        elif step in emptied:
+            since[table] = None
+            print(f"Watermark: {step} loads in full (emptied by a TRUNCATE ... CASCADE this run).")
+        elif table not in stored:
+            since[table] = None
+            print(f"Watermark: {step} loads in full (no watermark for {table} yet).")
+        else:
+            since[table] = stored[table] - etl_watermarks.WATERMARK_OVERLAP
+            print(f"Watermark: {step} reads {table} rows changed since {since[table]}.")
+    return run_start, since
+
+def interrupted_rebuild(cursor) -> bool:
+    """True, after saying so, when a --full-rebuild stopped before restoring the fact tables.
+
+    Its facts were truncated, and may still be UNLOGGED or lack the indexes
+    it dropped, so an incremental load would only fill in the rows changed
+    since each watermark.
+    """
+    pending = [index.name for index in etl_full_load.pending_indexes(cursor)]
+    unlogged = etl_full_load.unlogged_tables(cursor)
+    if pending or unlogged:
+        missing = [f"without {', '.join(pending)}"] if pending else []
+        missing += [f"with {', '.join(unlogged)} UNLOGGED"] if unlogged else []
+        print(f"Error: an interrupted --full-rebuild left the facts truncated, {' and '.join(missing)}. "
+              f"Rerun with --full-rebuild to finish it.")
+    return bool(pending or unlogged)
+
+def connect_native():
+    """Opens an autocommit psycopg2 connection; the script's own BEGIN/COMMIT delimit the transaction."""
+    conn = psycopg2.connect(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+                            application_name=ETL_APPLICATION_NAME)
+    conn.autocommit = True
+    return conn
+
+def match_operations(statements: List[Statement]) -> List[Tuple[Optional[int], str]]:
+    """Pairs each statement with its OPERATION_ORDER entry by command and target table.
+
+    Returns one (operation_number, description) per statement. Statements that
+    are not in OPERATION_ORDER get (None, target table or command).
+    """
+    used = set()
+    matched = []
+    for statement in statements:
+        command, table = classify(statement.sql)
+        short_name = short_table_name(table)
+        found = None
+        for index, (expected_op, expected_desc) in enumerate(OPERATION_ORDER):
+            if index not in used and expected_op == command and expected_desc.split(" ")[0] == short_name:
+                found = index
+                break
+        if found is None:
+            matched.append((None, table or command))
+        else:
+            used.add(found)
+            matched.append((found + 1, OPERATION_ORDER[found][1]))
+    return matched
+
+def count_rows(commands: List[str], rowcounts) -> Tuple[int, int]:
+    """Returns (rows inserted, rows updated) for parallel lists of commands and row counts."""
+    inserted = sum(count for command, count in zip(commands, rowcounts) if command == "INSERT")
+    updated = sum(count for command, count in zip(commands, rowcounts) if command == "UPDATE")
+    return inserted, updated
+
+def native_step_timings(results: List[StatementResult], success: bool) -> List[StepTiming]:
+    """Folds per-statement results into per-step (target table) timings for the run history.
+
+    A failed serial run is rolled back as a whole, so its steps are recorded as
+    ROLLED_BACK and left out of the duration statistics.
+    """
+    steps: Dict[str, List[StatementResult]] = {}
+    for result in results:
+        steps.setdefault(short_table_name(result.table) or result.command, []).append(result)
+    timings = []
+    for name, step_results in steps.items():
+        inserted, updated = count_rows([r.command for r in step_results], [r.rowcount for r in step_results])
+        timings.append(StepTiming(name, "SUCCESS" if success else "ROLLED_BACK",
+                                  sum(r.seconds for r in step_results), inserted, updated))
+    return timings
+
+def native_plan_captures(results: List[StatementResult]) -> List[PlanCapture]:
+    """Collects the plans captured by the serial runner, numbered within each step like etl_dag steps."""
+    captures = []
+    positions: Dict[str, int] = {}
+    for result in results:
+        name = short_table_name(result.table) or result.command
+        index = positions.get(name, 0)
+        positions[name] = index + 1
+        if result.plan is not None:
+            captures.append(PlanCapture(name, index, result.analyzed, result.seconds, result.plan))
+    return captures
+
+def format_elapsed(seconds: float) -> datetime.timedelta:
+    return datetime.timedelta(seconds=round(seconds, 6))
+
+def run_etl_native(script_path: str = SQL_SCRIPT_PATH, plan_modes: Optional[Dict[str, str]] = None,
+                   watermarks: bool = True) -> Tuple[bool, List[StatementResult]]:
+    """Runs the ETL script statement by statement over one psycopg2 connection.
+
+    Row counts come from cursor.rowcount and timings from the client clock, so
+    nothing is inferred from psql output. Like ``psql -v ON_ERROR_STOP=1``,
+    the first error stops the run and rolls back the open transaction.
+    ``plan_modes`` maps step names (target tables) to an etl_explain plan mode.
+    With ``watermarks`` the fact steps read only rows changed since their
+    watermark, and the watermarks advance once the script has committed.
+    Returns (success, per-statement results).
+    """
+    global native_conn
+
+    if psycopg2 is None:
+        print("Error: psycopg2 is required for the native runner (pip install psycopg2-binary).")
+        return False, []
+    try:
+        with open(script_path, encoding='utf-8') as f:
+            statements = split_sql(f.read())
+    except OSError as e:
+        print(f"Error reading ETL script {script_path}: {e}")
+        return False, []
+
+    print(f"Starting ETL script (native): {script_path}")
+    print(f"{len(statements)} statements, database {DB_NAME} as {DB_USER}")
+    print("-" * 40)
+
+    results: List[StatementResult] = []
+    overall_start = time.perf_counter()
+    success = False
+    try:
+        native_conn = connect_native()
+        cursor = native_conn.cursor()
+        if interrupted_rebuild(cursor):
+            return False, []
+        run_start, since = None, {}
+        if watermarks:
+            try:
+                steps = build_steps(statements, OPERATION_ORDER, STEP_DEPENDENCIES)
+            except ValueError as e:
+                print(f"Watermarks disabled, the script does not split into known steps: {e}")
+            else:
+                run_start, since = prepare_watermarks(native_conn, steps)
+                etl_watermarks.apply_settings(cursor, since)
+        for statement, (operation_number, description) in zip(statements, match_operations(statements)):
+            command, table = classify(statement.sql)
+            plan_mode = (plan_modes or {}).get(short_table_name(table))
+            start = time.perf_counter()
+            try:
+                rowcount, plan = execute(cursor, statement.sql, command, plan_mode)
+            except psycopg2.Error as e:
+                elapsed = format_elapsed(time.perf_counter() - start)
+                print(f"[{elapsed}] ERROR:   line {statement.line} ({command} {table or ''}): {str(e).strip()}")
+                if native_conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    cursor.execute("ROLLBACK")
+                    print(f"[{elapsed}] ROLLBACK: Transaction rolled back due to error.")
+                break
+            seconds = time.perf_counter() - start
+            elapsed = format_elapsed(seconds)
+
+            if command == "BEGIN":
+                print(f"[{elapsed}] BEGIN: Transaction started.")
+            elif command == "COMMIT":
+                print(f"[{elapsed}] COMMIT: Transaction committed successfully.")
+            else:
+                analyzed = plan is not None and plan_mode == "analyze"
+                results.append(StatementResult(statement, command, table, description,
+                                               operation_number, rowcount, seconds, plan, analyzed))
+                label = f"STEP {operation_number}" if operation_number else f"LINE {statement.line}"
+                if command == "TRUNCATE":
+                    print(f"[{elapsed}] {label}: TRUNCATE {table} ({description})")
+                else:
+                    print(f"[{elapsed}] {label}: {command} {rowcount:>9} rows ({description})")
+                if analyzed:
+                    print(f"[{elapsed}] {label}: EXPLAIN ANALYZE captured: {plan_summary(plan)}")
+        else:
+            success = True
+            if since:
+                for step, table in FACT_SOURCES.items():
+                    step_results = [r for r in results if short_table_name(r.table) == step]
+                    if table in since and step_results:
+                        etl_watermarks.record_watermark(cursor, table, run_start,
+                                                        sum(r.rowcount for r in step_results))
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+    finally:
+        if native_conn is not None:
+            native_conn.close()
+            native_conn = None
+
+    overall_elapsed = format_elapsed(time.perf_counter() - overall_start)
+    print("-" * 40)
+    if success:
+        total_rows = sum(result.rowcount for result in results)
+        print(f"ETL script completed successfully in {overall_elapsed} ({total_rows} rows affected).")
+        slowest = sorted(results, key=lambda result: result.seconds, reverse=True)[:5]
+        if slowest:
+            print("Slowest statements:")
+            for result in slowest:
+                print(f"  {format_elapsed(result.seconds)}  {result.command} {result.description}")
+    else:
+        print(f"ETL script failed after {overall_elapsed} (see output above).")
+    return success, results
+
+# --- Parallel DAG Runner ---
+def swap_executor(conn, step, log):
+    """etl_dag executor that publishes a Type-1 dimension by shadow swap."""
+    try:
+        result = etl_swap.publish_by_swap(conn, step.statements, TYPE1_NATURAL_KEYS[step.name], log)
+    except etl_swap.SwapNotPossible as e:
+        # Reloading in place would commit the TRUNCATE ... CASCADE where readers see it
+        raise StepError(f"cannot swap {step.name}: {e}") from e
+    log(f"{step.name}: shadow swapped in ({result.retired_members} retired members, "
+        f"{result.fact_rows_removed} fact rows removed).")
+
+    def after_commit(cursor):
+        # The swap's locks are released by the step's commit, which has just happened
+        log(f"{step.name}: swap committed, locks held {(time.perf_counter() - result.lock_acquired) * 1000:.0f} ms.")
+        result.validate(cursor)
+    return result.rowcounts, after_commit
+
+def swap_blockers(cursor, steps) -> List[str]:
+    """Why each TRUNCATE step cannot be published by swap; empty when all of them can."""
+    blockers = []
+    for step in steps:
+        if not any(classify(statement.sql)[0] == 'TRUNCATE' for statement in step.statements):
+            continue
+        if step.name not in TYPE1_NATURAL_KEYS:
+            blockers.append(f"{step.name}: no natural key in TYPE1_NATURAL_KEYS")
+            continue
+        try:
+            etl_swap.check_swappable(cursor, step.statements)
+        except etl_swap.SwapNotPossible as e:
+            blockers.append(f"{step.name}: {e}")
+    return blockers
+
+def run_etl_dag(script_path: str = SQL_SCRIPT_PATH, workers: int = 2,
+                checkpoint: bool = False, restart: bool = False,
+                plan_modes: Optional[Dict[str, str]] = None, watermarks: bool = True,
+                publish: str = "truncate",
+                full_rebuild: bool = False,
+                index_workers: int = DEFAULT_INDEX_WORKERS) -> Tuple[bool, List[StepTiming], List[PlanCapture]]:
+    """Runs the ETL steps concurrently on ``workers`` connections (see etl_dag.py).
+
+    Each step commits on its own as soon as it finishes, so unlike the serial
+    runners a failure leaves the steps that already committed in place. Only
+    a full rebuild may truncate Type-1 dimensions in place; any other run
+    needs ``publish`` 'swap' and refuses to start when a TRUNCATE step cannot
+    be swapped. With ``checkpoint`` each commit is recorded in phm_edw.etl_log and a rerun
+    resumes the unfinished run from its first incomplete step (see
+    etl_checkpoint.py); ``restart`` starts over instead. ``plan_modes`` is as
+    for ``run_etl_native``; with ``watermarks`` each fact step's watermark
+    advances in the same transaction as the step. With ``publish`` 'swap' the
+    Type-1 dimensions are loaded into shadow tables and swapped in (see
+    etl_swap.py) instead of being truncated and reloaded in place. With
+    ``full_rebuild`` the facts are emptied, loaded UNLOGGED without their
+    nonessential indexes, then made LOGGED and reindexed on ``index_workers``
+    connections (see etl_full_load.py); the rebuild is timed as step
+    'rebuild_indexes'. Without it, the run refuses to start while an
+    interrupted full rebuild still has tables or indexes to restore.
+    Returns (success, timings of the steps that ran, captured plans).
+    """
+    if psycopg2 is None:
+        print("Error: psycopg2 is required for the DAG runner (pip install psycopg2-binary).")
+        return False, [], []
+    try:
+        with open(script_path, encoding='utf-8') as f:
+            steps = build_steps(split_sql(f.read()), OPERATION_ORDER, STEP_DEPENDENCIES)
+    except (OSError, ValueError) as e:
+        print(f"Error preparing ETL steps from {script_path}: {e}")
+        return False, [], []
+    steps_by_name = {step.name: step for step in steps}
+
+    def step_rows(step, rowcounts):
+        return count_rows([classify(statement.sql)[0] for statement in step.statements], rowcounts)
+
+    executors = {}
+    if publish == "swap":
+        executors = {step.name: swap_executor for step in steps
+                     if step.name in TYPE1_NATURAL_KEYS and etl_swap.type1_table(step.statements)}
+    fact_tables = []
+    if full_rebuild:
+        try:
+            fact_tables = [etl_full_load.fact_table(step) for step in steps if step.name in FACT_SOURCES]
+        except ValueError as e:
+            print(f"Error preparing full rebuild: {e}")
+            return False, [], []
+
+    connect_kwargs = dict(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+                          application_name=ETL_APPLICATION_NAME)
+    run_start = None
+    completed = set()
+    watermark_start, since = None, {}
+    control_conn = None
+    dropped_indexes = []
+    try:
+        control_conn = psycopg2.connect(**connect_kwargs)
+        if not full_rebuild:
+            with control_conn.cursor() as cursor:
+                interrupted = interrupted_rebuild(cursor)
+            control_conn.commit()
+            if interrupted:
+                control_conn.close()
+                return False, [], []
+        if publish == "swap":
+            with control_conn.cursor() as cursor:
+                blockers = swap_blockers(cursor, steps)
+            control_conn.commit()
+            if blockers:
+                print("Error: --publish swap cannot publish every Type-1 step, and committing a "
+                      "TRUNCATE step by step would expose the emptied tables:")
+                for blocker in blockers:
+                    print(f"  {blocker}")
+                control_conn.close()
+                return False, [], []
+        if checkpoint:
+            run_start, completed = etl_checkpoint.start_run(control_conn, restart)
+        if watermarks:
+            swapped = [name for name in executors if name in TYPE1_NATURAL_KEYS]
+            watermark_start, since = prepare_watermarks(control_conn, steps, swapped, full_rebuild)
+            connect_kwargs["options"] = etl_watermarks.connection_options(since)
+        if full_rebuild:
+            dropped_indexes = etl_full_load.prepare_tables(control_conn, fact_tables)
+            print(f"Full rebuild: truncated {', '.join(fact_tables)}; dropped "
+                  f"{', '.join(index.name for index in dropped_indexes) or 'no indexes'}.")
+    except psycopg2.Error as e:
+        print(f"Error starting run: {e}")
+        if control_conn is not None:
+            control_conn.close()
+        return False, [], []
+    if not checkpoint:
+        control_conn.close()
+        control_conn = None
+
+    print(f"Starting ETL script (DAG, {workers} workers): {script_path}")
+    print(f"{len(steps)} steps, database {DB_NAME} as {DB_USER}")
+    if checkpoint:
+        done = [step.name for step in steps if step.name in completed]
+        if done:
+            print(f"Resuming run started {run_start}; already committed: {', '.join(done)}")
+        else:
+            print(f"Checkpointed run started {run_start}")
+    print("-" * 40)
+    overall_start = time.perf_counter()
+
+    def record(cursor, step, rowcounts):
+        inserted, updated = step_rows(step, rowcounts)
+        if checkpoint:
+            etl_checkpoint.record_step(cursor, run_start, step.name, inserted, updated)
+        if FACT_SOURCES.get(step.name) in since:
+            etl_watermarks.record_watermark(cursor, FACT_SOURCES[step.name], watermark_start, inserted)
+
+    def report(step, result):
+        elapsed = format_elapsed(result.seconds)
+        if result.status == 'SUCCESS':
+            rows = ", ".join(f"{classify(st.sql)[0]} {count}" for st, count in zip(step.statements, result.rowcounts))
+            print(f"[{elapsed}] COMMIT {step.name}: {rows} ({step.description})")
+            if (plan_modes or {}).get(step.name) == "analyze":
+                for plan in filter(None, result.plans):
+                    print(f"[{elapsed}] {step.name}: EXPLAIN ANALYZE captured: {plan_summary(plan)}")
+        else:
+            print(f"[{elapsed}] ERROR:   {step.name}: {result.error}")
+            print(f"[{elapsed}] ROLLBACK {step.name}: remaining steps will not be started.")
+
+    try:
+        results = run_dag(steps, connect_kwargs, workers, report, skip=completed,
+                          on_commit=record if checkpoint or since else None, plan_modes=plan_modes,
+                          executors=executors)
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        results = None
+
+    rebuild_timing = None
+    if full_rebuild:
+        print("-" * 40)
+        print(f"Logging {len(fact_tables)} tables, rebuilding {len(dropped_indexes)} indexes and analyzing "
+              f"on {index_workers} connections")
+        rebuild_seconds, rebuild_errors = etl_full_load.rebuild_indexes(connect_kwargs, dropped_indexes,
+                                                                        fact_tables, index_workers)
+        rebuild_timing = StepTiming(etl_full_load.REBUILD_STEP, "FAILURE" if rebuild_errors else "SUCCESS",
+                                    rebuild_seconds, 0, 0)
+        if rebuild_errors:
+            print("Failed indexes stay in phm_edw.etl_pending_index; rerun with --full-rebuild to finish the rebuild.")
+
+    overall_elapsed = format_elapsed(time.perf_counter() - overall_start)
+    failed = [result.name for result in results or () if result.status == 'FAILURE']
+    skipped = [result.name for result in results or () if result.status == 'SKIPPED']
+    if control_conn is not None:
+        try:
+            if results is None or failed or skipped:
+                errors = [f"{result.name}: {result.error}" for result in results or () if result.error]
+                if skipped and not failed:
+                    errors.append(f"never started: {', '.join(skipped)}")
+                etl_checkpoint.finish_run(control_conn, run_start, 'FAILURE',
+                                          "; ".join(errors) or "Could not connect")
+            else:
+                etl_checkpoint.finish_run(control_conn, run_start, 'SUCCESS')
+        except psycopg2.Error as e:
+            print(f"Error recording run in phm_edw.etl_log: {e}")
+        finally:
+            control_conn.close()
+    if results is None:
+        return False, [rebuild_timing] if rebuild_timing else [], []
+    timings = [StepTiming(result.name, result.status, result.seconds,
+                          *step_rows(steps_by_name[result.name], result.rowcounts))
+               for result in results if result.status != 'SKIPPED']
+    if rebuild_timing:
+        timings.append(rebuild_timing)
+    plans = [PlanCapture(result.name, index, (plan_modes or {}).get(result.name) == "analyze", seconds, plan)
+             for result in results if result.status == 'SUCCESS'
+             for index, (seconds, plan) in enumerate(zip(result.statement_seconds, result.plans)) if plan]
+
+    serial_seconds = sum(result.seconds for result in results)
+    print("-" * 40)
+    if failed:
+        print(f"ETL failed after {overall_elapsed}: {', '.join(failed)} rolled back.")
+        if skipped:
+            print(f"Not started: {', '.join(skipped)}")
+        if checkpoint:
+            print("Rerun with --checkpoint to resume from the first incomplete step.")
+        return False, timings, plans
+    if skipped:
+        # No step failed, yet these never became runnable: a dependency never committed
+        print(f"ETL stopped after {overall_elapsed}: {', '.join(skipped)} never started.")
+        if checkpoint:
+            print("Rerun with --checkpoint to resume from the first incomplete step.")
+        return False, timings, plans
+    if rebuild_timing and rebuild_timing.status == "FAILURE":
+        print(f"ETL loaded every step but the index rebuild failed after {overall_elapsed}.")
+        return False, timings, plans
+    print(f"ETL completed successfully in {overall_elapsed} "
+          f"({format_elapsed(serial_seconds)} of step time across {workers} workers).")
+    return True, timings, plans
+
+# --- Run History ---
+def choose_plan_modes(path: str, threshold: float, forced: List[str]) -> Dict[str, str]:
+    """Plan mode per step: 'analyze' for steps slower than ``threshold`` last time or named in ``forced``."""
+    latest: Dict[str, float] = {}
+    if os.path.exists(path):
+        try:
+            history = etl_history.open_history(path)
+            try:
+                latest = etl_history.latest_step_seconds(history)
+            finally:
+                history.close()
+        except sqlite3.Error as e:
+            print(f"Error reading run history from {path}: {e}")
+    modes = {}
+    for _, description in OPERATION_ORDER:
+        step = description.split(" ")[0]
+        slow = latest.get(step, 0.0) > threshold
+        modes[step] = "analyze" if slow or step in forced else "estimate"
+        if slow:
+            print(f"Capturing EXPLAIN ANALYZE for {step} (took {latest[step]:.1f}s last run, "
+                  f"threshold {threshold:g}s).")
+    return modes
+
+def save_history(path: str, started_at: datetime.datetime, runner: str, script_path: str, workers: int,
+                 success: bool, seconds: float, timings: List[StepTiming],
+                 plans: List[PlanCapture] = (), explain_threshold: float = DEFAULT_EXPLAIN_THRESHOLD) -> None:
+    """Appends the run to the SQLite history, warns about steps slower than their baseline
+    and diffs newly analyzed plans against the last fast run."""
+    try:
+        history = etl_history.open_history(path)
+        try:
+            run_id = etl_history.record_run(history, started_at, runner, script_path, workers,
+                                            "SUCCESS" if success else "FAILURE", seconds, timings, plans)
+            print(f"Run #{run_id} saved to {path}.")
+            if success:
+                etl_history.print_regressions(etl_history.step_stats(history))
+            etl_history.print_plan_diffs(history, run_id, explain_threshold)
+        finally:
+            history.close()
+    except sqlite3.Error as e:
+        print(f"Error saving run history to {path}: {e}")
+
+def report_full_rebuild(path: str, timings: List[StepTiming]) -> None:
+    """Compares a full rebuild with the incremental path's throughput in the run history."""
+    baseline: Dict[str, Tuple[int, float]] = {}
+    if os.path.exists(path):
+        try:
+            history = etl_history.open_history(path)
+            try:
+                baseline = etl_history.step_throughput(history)
+            finally:
+                history.close()
+        except sqlite3.Error as e:
+            print(f"Error reading run history from {path}: {e}")
+    etl_full_load.report_savings(baseline, timings, list(FACT_SOURCES))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run and monitor the EDW-to-star ETL script.")
+    parser.add_argument(
+        "--runner",
+        choices=RUNNERS,
+        default="native",
+        help="'native' executes statements over psycopg2 with exact row counts (default); "
+             "'psql' runs psql -f and parses its output."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="With the native runner, run independent steps concurrently on this many "
+             "connections (default 1: the script runs serially in its own transaction). Steps "
+             "commit one by one, so above 1 this requires --publish swap or --full-rebuild."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Commit each step separately and record it in phm_edw.etl_log; if the last "
+             "checkpointed run did not finish, resume it from its first incomplete step. "
+             "Requires --publish swap."
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="With --checkpoint, abandon an unfinished run and start again from the first step."
+    )
+    parser.add_argument(
+        "--history",
+        default=DEFAULT_HISTORY_PATH,
+        help=f"SQLite file that native runs append their step timings to (default {DEFAULT_HISTORY_PATH}); "
+             "see etl_history.py for the report."
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Do not record this run in the history file."
+    )
+    parser.add_argument(
+        "--explain-threshold",
+        type=float,
+        default=DEFAULT_EXPLAIN_THRESHOLD,
+        metavar="SECONDS",
+        help="Run steps that took longer than this on the previous run under EXPLAIN (ANALYZE, BUFFERS) "
+             f"and keep the plan in the history (default {DEFAULT_EXPLAIN_THRESHOLD:g})."
+    )
+    parser.add_argument(
+        "--explain",
+        action="append",
+        default=[],
+        metavar="STEP",
+        help="Capture EXPLAIN ANALYZE for this step (target table) regardless of its last duration; repeatable."
+    )
+    parser.add_argument(
+        "--no-plans",
+        action="store_true",
+        help="Do not capture execution plans."
+    )
+    parser.add_argument(
+        "--no-watermarks",
+        action="store_true",
+        help="Load the fact steps from every source row instead of only rows changed since the "
+             "last run; watermarks are neither used nor advanced."
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=DEFAULT_PROGRESS_INTERVAL,
+        metavar="SECONDS",
+        help="Report statements running longer than this, with wait events, lock waits, blocking "
+             f"sessions and pg_stat_progress_* phases, every SECONDS (default {DEFAULT_PROGRESS_INTERVAL:g}; 0 disables)."
+    )
+    parser.add_argument(
+        "--publish",
+        choices=PUBLISH_MODES,
+        default="truncate",
+        help="How Type-1 dimensions are reloaded: 'truncate' runs the script's TRUNCATE ... CASCADE "
+             "and INSERT (default); 'swap' loads a shadow table and renames it into place, so "
+             "readers are blocked for milliseconds and referencing facts are kept."
+    )
+    parser.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        help="Initial load or disaster rebuild: empty the facts, drop their nonessential indexes, "
+             "load them in full as UNLOGGED tables, then SET LOGGED, rebuild the indexes in parallel "
+             "and ANALYZE. Rerun it to finish a full rebuild that was interrupted."
+    )
+    parser.add_argument(
+        "--index-workers",
+        type=int,
+        default=DEFAULT_INDEX_WORKERS,
+        help=f"With --full-rebuild, connections that rebuild indexes at once (default {DEFAULT_INDEX_WORKERS})."
+    )
+    parser.add_argument(
+        "--script",
+        default=SQL_SCRIPT_PATH,
+        help=f"ETL SQL script to run (default {SQL_SCRIPT_PATH})."
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.index_workers < 1:
+        parser.error("--index-workers must be at least 1")
+    if args.progress_interval < 0:
+        parser.error("--progress-interval cannot be negative")
+    if (args.workers > 1 or args.checkpoint or args.publish != "truncate" or args.full_rebuild) \
+            and args.runner != "native":
+        parser.error("--workers, --checkpoint, --publish and --full-rebuild require --runner native")
+    if args.full_rebuild and (args.checkpoint or args.publish != "truncate"):
+        parser.error("--full-rebuild reloads everything; it cannot be combined with --checkpoint or --publish")
+    if (args.workers > 1 or args.checkpoint) and args.publish != "swap" and not args.full_rebuild:
+        parser.error("--workers above 1 and --checkpoint commit step by step, which would publish each "
+                     "Type-1 TRUNCATE ... CASCADE before its reload; add --publish swap")
+    steps = {description.split(" ")[0] for _, description in OPERATION_ORDER}
+    for step in args.explain:
+        if step not in steps:
+            parser.error(f"--explain: unknown step {step} (choose from {', '.join(sorted(steps))})")
+    if args.restart and not args.checkpoint:
+        parser.error("--restart requires --checkpoint")
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
     # Register the signal handler for Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
-    run_etl()
+    monitor = None
+    if psycopg2 is not None:
+        monitor = start_monitor(dict(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD),
+                                ETL_APPLICATION_NAME, args.progress_interval)
+    try:
+        if args.runner == "native":
+            started_at = datetime.datetime.now()
+            start = time.perf_counter()
+            plan_modes = None
+            if not (args.no_history or args.no_plans):
+                plan_modes = choose_plan_modes(args.history, args.explain_threshold, args.explain)
+            step_runner = args.workers > 1 or args.checkpoint or args.publish != "truncate" or args.full_rebuild
+            if step_runner:
+                ok, timings, plans = run_etl_dag(args.script, args.workers, args.checkpoint, args.restart,
+                                                 plan_modes, not args.no_watermarks, args.publish,
+                                                 args.full_rebuild, args.index_workers)
+            else:
+                ok, results = run_etl_native(args.script, plan_modes, not args.no_watermarks)
+                timings, plans = native_step_timings(results, ok), native_plan_captures(results)
+            if monitor is not None:
+                monitor.stop()
+            if args.full_rebuild and ok:
+                report_full_rebuild(args.history, timings)
+            if timings and not args.no_history:
+                runner = etl_history.FULL_REBUILD_RUNNER if args.full_rebuild else "dag" if step_runner else "native"
+                save_history(args.history, started_at, runner,
+                             args.script, args.workers, ok, time.perf_counter() - start, timings,
+                             plans, args.explain_threshold)
+            sys.exit(0 if ok else 1)
+        SQL_SCRIPT_PATH = args.script
+        run_etl()
+    finally:
+        if monitor is not None:
+            monitor.stop()
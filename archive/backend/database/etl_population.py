@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+Parallel, chunked loader for the population -> phm_edw refresh.
+
+ETL_population_to_phm_edw.sql truncates every phm_edw table and pulls the
+source through dblink in one transaction, so the EDW is empty for the whole
+load and every remote fetch runs on one backend. This loader runs the same
+INSERT mappings (the SQL file stays the single definition of them) in three
+phases, while the live tables stay queryable:
+
+1. Stream: every ``population.*`` table the script's dblink calls read is
+   copied from the source database into an UNLOGGED table of RAW_SCHEMA in
+   the target, one table per worker. Rows are fetched in chunks of
+   ``--chunk-rows`` from a server-side cursor (all columns cast to text, as
+   the dblink column lists declare them) and written with binary COPY, so
+   values such as the literal ``\\N`` strings arrive unchanged.
+2. Transform: each INSERT is rewritten to read the raw tables instead of
+   dblink and to write, and join against, ``<table>_stage`` copies of the
+   phm_edw tables. Tables load in waves in foreign key order (parents before
+   children; a wave's tables in parallel); each stage table then gets the
+   live table's indexes, constraints and foreign keys (to the other stage
+   tables) and is ANALYZEd, before the next wave joins against it.
+3. Swap: in one short transaction, under ``lock_timeout`` and with retries,
+   the live tables are renamed away and the stage tables into place, their
+   key sequences move over and the indexes get their original names. Tables
+   outside the load that reference a loaded table (care_gap, measure_cohort,
+   condition_value_set ...) are emptied, as the script's TRUNCATE ... CASCADE
+   did, and their foreign keys re-pointed at the new tables.
+
+A failure before the swap leaves the live tables untouched. Surrogate keys
+continue from the live sequences instead of restarting at 1.
+
+The source connection uses SOURCE_DB_DATABASE (default ohdsi),
+SOURCE_DB_HOST, SOURCE_DB_PORT, SOURCE_DB_USERNAME and SOURCE_DB_PASSWORD
+from backend/.env, each falling back to the target's DB_* setting.
+
+    python etl_population.py [--workers 4] [--chunk-rows 50000] [--keep-raw]
+"""
+
+import argparse
+import io
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Sequence, Set, Tuple
+
+try:
+    import psycopg2
+    import psycopg2.errors
+    from psycopg2 import sql
+except ImportError:
+    psycopg2 = None
+
+from etl_statements import classify, split_sql
+
+# --- Configuration ---
+SQL_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ETL_population_to_phm_edw.sql")
+SOURCE_SCHEMA = 'population'
+SOURCE_DATABASE = 'ohdsi'
+RAW_SCHEMA = 'population_raw'      # UNLOGGED copies of the source tables, dropped after the load
+STAGE_SUFFIX = '_stage'
+RETIRED_SUFFIX = '_retired'
+MAX_IDENTIFIER_LENGTH = 63
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_ROWS = 50000
+SWAP_LOCK_TIMEOUT = '5s'
+SWAP_ATTEMPTS = 5
+APPLICATION_NAME = 'etl_population'
+
+# phm_edw.dblink('<connstr>'::text, $$<query>$$::text) AS alias(column type, ...)
+DBLINK_CALL = re.compile(
+    r"phm_edw\.dblink\(\s*'[^']*'(?:::text)?\s*,\s*\$\$(.*?)\$\$(?:::text)?\s*\)\s*AS\s+(\w+)\s*\(([^)]*)\)",
+    re.IGNORECASE | re.DOTALL)
+SOURCE_TABLE = re.compile(r'\b' + SOURCE_SCHEMA + r'\.("?)(\w+)\1', re.IGNORECASE)
+
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('!h', -1)
+COPY_BINARY_NULL = struct.pack('!i', -1)
+
+
+class LoadNotPossible(Exception):
+    """The live tables cannot be replaced by swapping (e.g. a view depends on them)."""
+
+
+class LoadStep(NamedTuple):
+    table: str                   # Qualified live table, e.g. 'phm_edw.patient'
+    sql: str                     # The INSERT, rewritten to read RAW_SCHEMA and write the stage tables
+    parents: Tuple[str, ...]     # Loaded tables it reads or references by foreign key
+
+
+class TableResult(NamedTuple):
+    table: str
+    rows: int
+    seconds: float
+
+
+# --- Script rewriting ---
+def column_names(definitions: str) -> List[str]:
+    """Column names of a dblink column definition list: 'id text, "start" text' -> ['id', '"start"']."""
+    return [definition.strip().rsplit(None, 1)[0] for definition in definitions.split(',') if definition.strip()]
+
+
+def rewrite_dblink(statement: str) -> Tuple[str, Set[str]]:
+    """Replaces each dblink call with a subquery over RAW_SCHEMA; returns (statement, source tables read)."""
+    sources: Set[str] = set()
+
+    def replace(match):
+        query, alias, definitions = match.groups()
+        sources.update(name for _, name in SOURCE_TABLE.findall(query))
+        query = SOURCE_TABLE.sub(lambda m: f"{RAW_SCHEMA}.{m.group(1)}{m.group(2)}{m.group(1)}", query)
+        return f"({query.strip()}) AS {alias}({', '.join(column_names(definitions))})"
+
+    return DBLINK_CALL.sub(replace, statement), sources
+
+
+def _suffixed(name: str, suffix: str) -> str:
+    return name[:MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+def stage_table(table: str) -> str:
+    schema, name = table.split('.')
+    return f"{schema}.{_suffixed(name, STAGE_SUFFIX)}"
+
+
+def _reference(table: str) -> re.Pattern:
+    """References to ``table`` (schema-qualified, the name optionally quoted)."""
+    schema, name = table.split('.')
+    return re.compile(r'\b' + re.escape(schema) + r'\.("?)' + re.escape(name) + r'\1(?![\w"])', re.IGNORECASE)
+
+
+def retarget_tables(text: str, tables: Sequence[str]) -> str:
+    """Points every reference to one of ``tables`` at its stage table."""
+    for table in tables:
+        text = _reference(table).sub(stage_table(table), text)
+    return text
+
+
+def build_steps(script_path: str = SQL_SCRIPT_PATH) -> Tuple[List[LoadStep], Set[str]]:
+    """One LoadStep per INSERT of the script (parents from the statement only), and the source tables read."""
+    with open(script_path, encoding='utf-8') as f:
+        statements = split_sql(f.read())
+    inserts = []
+    sources: Set[str] = set()
+    for statement in statements:
+        command, table = classify(statement.sql)
+        if command == 'INSERT' and table:
+            inserts.append((table, statement.sql))
+    tables = [table for table, _ in inserts]
+    if len(set(tables)) != len(tables):
+        raise ValueError(f"{script_path} inserts into the same table twice")
+    steps = []
+    for table, text in inserts:
+        text, read = rewrite_dblink(text)
+        sources.update(read)
+        parents = tuple(other for other in tables if other != table and _reference(other).search(text))
+        # Also points the INSERT itself at the stage table
+        steps.append(LoadStep(table, retarget_tables(text, tables), parents))
+    return steps, sources
+
+
+def load_waves(steps: Sequence[LoadStep]) -> List[List[LoadStep]]:
+    """Groups steps into waves; every step's parents are in earlier waves."""
+    remaining = {step.table: step for step in steps}
+    done: Set[str] = set()
+    waves = []
+    while remaining:
+        wave = [step for step in remaining.values() if set(step.parents) - {step.table} <= done]
+        if not wave:
+            raise ValueError(f"circular dependencies between {', '.join(sorted(remaining))}")
+        waves.append(wave)
+        for step in wave:
+            done.add(step.table)
+            del remaining[step.table]
+    return waves
+
+
+def add_foreign_key_parents(cursor, steps: Sequence[LoadStep]) -> List[LoadStep]:
+    """Adds the loaded tables each step's live table references by foreign key to its parents."""
+    tables = [step.table for step in steps]
+    cursor.execute("""
+        SELECT conrelid::regclass::text, confrelid::regclass::text FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = ANY(%s::regclass[]) AND confrelid = ANY(%s::regclass[]);
+    """, (tables, tables))
+    referenced: Dict[str, Set[str]] = {}
+    for child, parent in cursor.fetchall():
+        referenced.setdefault(_qualified(child), set()).add(_qualified(parent))
+    return [step._replace(parents=tuple(sorted(set(step.parents) | (referenced.get(step.table, set()) - {step.table}))))
+            for step in steps]
+
+
+def _qualified(regclass: str) -> str:
+    """'phm_edw."condition"' -> 'phm_edw.condition'."""
+    return regclass.replace('"', '')
+
+
+def _ident(qualified: str) -> sql.Identifier:
+    return sql.Identifier(*qualified.split('.'))
+
+
+# --- Phase 1: stream the source ---
+def binary_copy_payload(rows: Sequence[tuple], n_columns: int) -> io.BytesIO:
+    """PostgreSQL binary COPY data for rows of text values (None is NULL)."""
+    out = io.BytesIO()
+    out.write(COPY_BINARY_HEADER)
+    field_count = struct.pack('!h', n_columns)
+    for row in rows:
+        out.write(field_count)
+        for value in row:
+            if value is None:
+                out.write(COPY_BINARY_NULL)
+            else:
+                data = value.encode('utf-8')
+                out.write(struct.pack('!i', len(data)))
+                out.write(data)
+    out.write(COPY_BINARY_TRAILER)
+    out.seek(0)
+    return out
+
+
+def stream_table(source_kwargs: Dict[str, object], target_kwargs: Dict[str, object], name: str,
+                 chunk_rows: int, log: Callable[[str], None]) -> TableResult:
+    """Copies population.<name> into RAW_SCHEMA.<name>, chunk by chunk, and commits."""
+    start = time.perf_counter()
+    source = psycopg2.connect(**source_kwargs)
+    target = psycopg2.connect(**target_kwargs)
+    target.set_client_encoding('UTF8')
+    rows = 0
+    try:
+        with source.cursor() as cursor:
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position;
+            """, (SOURCE_SCHEMA, name))
+            columns = [row[0] for row in cursor.fetchall()]
+        if not columns:
+            raise ValueError(f"{SOURCE_SCHEMA}.{name} does not exist in the source database")
+        raw = sql.Identifier(RAW_SCHEMA, name)
+        with target.cursor() as out:
+            out.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(raw))
+            out.execute(sql.SQL("CREATE UNLOGGED TABLE {} ({})").format(
+                raw, sql.SQL(", ").join(sql.SQL("{} TEXT").format(sql.Identifier(c)) for c in columns)))
+            copy = sql.SQL("COPY {} FROM STDIN (FORMAT binary)").format(raw).as_string(out)
+            # Named cursor: the source keeps the result set and hands it over chunk_rows at a time
+            with source.cursor(name=f"{APPLICATION_NAME}_{name}") as cursor:
+                cursor.itersize = chunk_rows
+                cursor.execute(sql.SQL("SELECT {} FROM {}").format(
+                    sql.SQL(", ").join(sql.SQL("{}::text").format(sql.Identifier(c)) for c in columns),
+                    sql.Identifier(SOURCE_SCHEMA, name)))
+                while True:
+                    chunk = cursor.fetchmany(chunk_rows)
+                    if not chunk:
+                        break
+                    out.copy_expert(copy, binary_copy_payload(chunk, len(columns)))
+                    rows += len(chunk)
+            out.execute(sql.SQL("ANALYZE {}").format(raw))
+        target.commit()
+        source.rollback()
+    finally:
+        source.close()
+        target.close()
+    result = TableResult(f"{SOURCE_SCHEMA}.{name}", rows, time.perf_counter() - start)
+    log(f"[{result.seconds:9.3f}s] streamed {result.table}: {rows} rows")
+    return result
+
+
+# --- Phase 2: load the stage tables ---
+def check_swappable(cursor, tables: Sequence[str]) -> None:
+    cursor.execute("""
+        SELECT DISTINCT d.refobjid::regclass::text, v.ev_class::regclass::text
+        FROM pg_depend d JOIN pg_rewrite v ON v.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = ANY(%s::regclass[]) AND v.ev_class <> d.refobjid;
+    """, (list(tables),))
+    views = cursor.fetchall()
+    if views:
+        raise LoadNotPossible("views depend on the loaded tables: "
+                              + ", ".join(f"{view} on {table}" for table, view in views))
+
+
+def drop_stage_tables(conn, tables: Sequence[str]) -> None:
+    with conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(_ident(stage_table(table))))
+    conn.commit()
+
+
+def create_stage_tables(conn, tables: Sequence[str]) -> None:
+    """(Re)creates an empty, index-less ``<table>_stage`` for every table and commits."""
+    drop_stage_tables(conn, tables)
+    with conn.cursor() as cursor:
+        for table in tables:
+            # Defaults come along, so surrogate keys are drawn from the live table's sequence
+            cursor.execute(sql.SQL(
+                "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)"
+            ).format(_ident(stage_table(table)), _ident(table)))
+    conn.commit()
+
+
+def _copy_structure(cursor, table: str, loaded: Sequence[str]) -> None:
+    """Gives the stage table the live table's indexes, key constraints, foreign keys and grants."""
+    stage = stage_table(table)
+    cursor.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid), con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        LEFT JOIN pg_constraint con
+          ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid AND con.contype IN ('p', 'u', 'x')
+        WHERE i.indrelid = %s::regclass
+        ORDER BY i.indisprimary DESC, c.relname;
+    """, (table,))
+    for index_name, index_def, constraint_name, constraint_def in cursor.fetchall():
+        stage_index = _suffixed(index_name, STAGE_SUFFIX)
+        if constraint_name:
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + constraint_def)
+                           .format(_ident(stage), sql.Identifier(stage_index)))
+        else:
+            cursor.execute(re.sub(r'^(CREATE (?:UNIQUE )?INDEX )\S+ ON (?:ONLY )?\S+',
+                                  lambda m: f"{m.group(1)}{stage_index} ON {stage}", index_def))
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' ORDER BY conname;
+    """, (table,))
+    for constraint_name, constraint_def in cursor.fetchall():
+        cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + retarget_tables(constraint_def, loaded))
+                       .format(_ident(stage), sql.Identifier(constraint_name)))
+    cursor.execute("""
+        SELECT r.rolname, acl.privilege_type  -- rolname is NULL for PUBLIC
+        FROM pg_class c
+        CROSS JOIN LATERAL aclexplode(c.relacl) AS acl
+        LEFT JOIN pg_roles r ON r.oid = acl.grantee
+        WHERE c.oid = %s::regclass;
+    """, (table,))
+    for grantee, privilege in cursor.fetchall():
+        cursor.execute(sql.SQL("GRANT {} ON {} TO {}").format(
+            sql.SQL(privilege), _ident(stage), sql.SQL("PUBLIC") if grantee is None else sql.Identifier(grantee)))
+
+
+def load_stage(target_kwargs: Dict[str, object], step: LoadStep, loaded: Sequence[str],
+               log: Callable[[str], None]) -> TableResult:
+    """Runs one step's INSERT into its stage table, adds indexes and keys, ANALYZEs and commits."""
+    start = time.perf_counter()
+    conn = psycopg2.connect(**target_kwargs)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(step.sql)
+            rows = max(cursor.rowcount, 0)
+            _copy_structure(cursor, step.table, loaded)
+            cursor.execute(sql.SQL("ANALYZE {}").format(_ident(stage_table(step.table))))
+        conn.commit()
+    finally:
+        conn.close()
+    result = TableResult(step.table, rows, time.perf_counter() - start)
+    log(f"[{result.seconds:9.3f}s] loaded {stage_table(step.table)}: {rows} rows")
+    return result
+
+
+# --- Phase 3: swap ---
+def swap_in(conn, tables: Sequence[str], log: Callable[[str], None] = print) -> Tuple[float, List[str]]:
+    """Replaces every live table with its stage table in one transaction and commits.
+
+    Returns (seconds the tables were locked, tables emptied because they
+    reference a loaded table).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT con.conrelid::regclass::text, con.conname, con.confrelid::regclass::text,
+                   pg_get_constraintdef(con.oid)
+            FROM pg_constraint con
+            WHERE con.contype = 'f' AND con.confrelid = ANY(%s::regclass[]) AND con.conrelid <> ALL(%s::regclass[])
+              AND con.conrelid <> ALL(%s::regclass[])
+            ORDER BY 1, 2;
+        """, (list(tables), list(tables), [stage_table(table) for table in tables]))
+        external_keys = cursor.fetchall()
+        dependents = sorted({_qualified(row[0]) for row in external_keys})
+
+        cursor.execute("""
+            SELECT d.refobjid::regclass::text, s.oid::regclass::text, a.attname
+            FROM pg_depend d
+            JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+            JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+            WHERE d.refobjid = ANY(%s::regclass[]) AND d.deptype = 'a';
+        """, (list(tables),))
+        sequences = [(_qualified(table), sequence, column) for table, sequence, column in cursor.fetchall()]
+
+        # Stage indexes were named after the live ones (_copy_structure)
+        cursor.execute("""
+            SELECT c.relnamespace::regnamespace::text, c.relname
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = ANY(%s::regclass[]);
+        """, (list(tables),))
+        renames = [(schema, _suffixed(name, STAGE_SUFFIX), name) for schema, name in cursor.fetchall()]
+
+        cursor.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+        for attempt in range(1, SWAP_ATTEMPTS + 1):
+            cursor.execute("SAVEPOINT etl_population_swap")
+            lock_start = time.perf_counter()
+            try:
+                cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(
+                    sql.SQL(", ").join(_ident(table) for table in list(tables) + dependents)))
+                for referencing, constraint_name, _, _ in external_keys:
+                    cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}")
+                                   .format(_ident(_qualified(referencing)), sql.Identifier(constraint_name)))
+                if dependents:
+                    cursor.execute(sql.SQL("TRUNCATE {}").format(
+                        sql.SQL(", ").join(_ident(table) for table in dependents)))
+                for table in tables:
+                    schema, name = table.split('.')
+                    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}")
+                                   .format(_ident(table), sql.Identifier(_suffixed(name, RETIRED_SUFFIX))))
+                    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}")
+                                   .format(_ident(stage_table(table)), sql.Identifier(name)))
+                for table, sequence, column in sequences:
+                    cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}")
+                                   .format(sql.SQL(sequence), _ident(table), sql.Identifier(column)))
+                cursor.execute(sql.SQL("DROP TABLE {}").format(sql.SQL(", ").join(
+                    sql.Identifier(table.split('.')[0], _suffixed(table.split('.')[1], RETIRED_SUFFIX))
+                    for table in tables)))
+                for schema, stage_index, index_name in renames:
+                    cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}")
+                                   .format(sql.Identifier(schema, stage_index), sql.Identifier(index_name)))
+                # The referencing tables are empty, so the keys validate at once
+                for referencing, constraint_name, _, constraint_def in external_keys:
+                    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + constraint_def)
+                                   .format(_ident(_qualified(referencing)), sql.Identifier(constraint_name)))
+                cursor.execute("RELEASE SAVEPOINT etl_population_swap")
+                lock_seconds = time.perf_counter() - lock_start
+                break
+            except psycopg2.errors.LockNotAvailable:
+                cursor.execute("ROLLBACK TO SAVEPOINT etl_population_swap")
+                if attempt == SWAP_ATTEMPTS:
+                    raise
+                log(f"swap lock not granted within {SWAP_LOCK_TIMEOUT}, retrying (attempt {attempt + 1}/{SWAP_ATTEMPTS})")
+                time.sleep(attempt)
+    conn.commit()
+    return lock_seconds, dependents
+
+
+# --- Runner ---
+def source_kwargs(target_kwargs: Dict[str, object], database: str = None) -> Dict[str, object]:
+    """Source connection settings: SOURCE_DB_* from the environment, else the target's (see module docstring)."""
+    return dict(dbname=database or os.getenv("SOURCE_DB_DATABASE", SOURCE_DATABASE),
+                user=os.getenv("SOURCE_DB_USERNAME", target_kwargs['user']),
+                password=os.getenv("SOURCE_DB_PASSWORD", target_kwargs['password']),
+                host=os.getenv("SOURCE_DB_HOST", target_kwargs['host']),
+                port=os.getenv("SOURCE_DB_PORT", target_kwargs['port']),
+                application_name=APPLICATION_NAME)
+
+
+def run_load(target_kwargs: Dict[str, object], source: Dict[str, object], workers: int = DEFAULT_WORKERS,
+             chunk_rows: int = DEFAULT_CHUNK_ROWS, script_path: str = SQL_SCRIPT_PATH,
+             keep_raw: bool = False) -> List[TableResult]:
+    """Runs the three phases of the module docstring; returns the loaded tables' results."""
+    print_lock = threading.Lock()
+
+    def log(message):
+        with print_lock:
+            print(message, flush=True)
+
+    steps, sources = build_steps(script_path)
+    tables = [step.table for step in steps]
+    conn = psycopg2.connect(**target_kwargs)
+    try:
+        with conn.cursor() as cursor:
+            check_swappable(cursor, tables)
+            steps = add_foreign_key_parents(cursor, steps)
+            cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(RAW_SCHEMA)))
+        conn.commit()
+        waves = load_waves(steps)
+
+        start = time.perf_counter()
+        log(f"--- Streaming {len(sources)} source tables on {workers} workers ---")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl-stream") as pool:
+            streamed = list(pool.map(lambda name: stream_table(source, target_kwargs, name, chunk_rows, log),
+                                     sorted(sources)))
+        log(f"Streamed {sum(r.rows for r in streamed)} rows in {time.perf_counter() - start:.3f}s")
+
+        create_stage_tables(conn, tables)
+        results: List[TableResult] = []
+        for number, wave in enumerate(waves, start=1):
+            log(f"--- Wave {number}/{len(waves)}: {', '.join(step.table for step in wave)} ---")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="etl-load") as pool:
+                results.extend(pool.map(lambda step: load_stage(target_kwargs, step, tables, log), wave))
+
+        lock_seconds, emptied = swap_in(conn, tables, log)
+        log(f"Swapped in {len(tables)} tables (locked {lock_seconds:.3f}s)")
+        if emptied:
+            log(f"Emptied tables that referenced the old rows: {', '.join(emptied)}")
+        log(f"Loaded {sum(r.rows for r in results)} rows in {time.perf_counter() - start:.3f}s")
+    except Exception:
+        conn.close()
+        clean_up(target_kwargs, tables, keep_raw, log)
+        raise
+    conn.close()
+    clean_up(target_kwargs, (), keep_raw, log)
+    return results
+
+
+def clean_up(target_kwargs: Dict[str, object], tables: Sequence[str], keep_raw: bool,
+             log: Callable[[str], None]) -> None:
+    """Drops the stage tables of ``tables`` and, unless ``keep_raw``, RAW_SCHEMA.
+
+    Uses a connection of its own, since the load's connection may be aborted
+    or broken after a failure. A cleanup error is logged, not raised, so it
+    cannot hide the error that stopped the load.
+    """
+    if not tables and keep_raw:
+        return
+    try:
+        conn = psycopg2.connect(**target_kwargs)
+        try:
+            drop_stage_tables(conn, tables)
+            if not keep_raw:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(RAW_SCHEMA)))
+                conn.commit()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        log(f"Warning: cleanup failed, drop {RAW_SCHEMA} and any *{STAGE_SUFFIX} tables by hand: {str(e).strip()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load the population source into phm_edw through staging tables, in parallel."
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Tables streamed or loaded at once (default {DEFAULT_WORKERS}).")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Rows per fetch and binary COPY (default {DEFAULT_CHUNK_ROWS}).")
+    parser.add_argument("--source-database",
+                        help=f"Source database (default SOURCE_DB_DATABASE from .env, else {SOURCE_DATABASE}).")
+    parser.add_argument("--script", default=SQL_SCRIPT_PATH, help="SQL file whose INSERT mappings are run.")
+    parser.add_argument("--keep-raw", action="store_true",
+                        help=f"Keep the streamed source tables in schema {RAW_SCHEMA} after the load.")
+    args = parser.parse_args(argv)
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    if args.chunk_rows <= 0:
+        parser.error("--chunk-rows must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    from measure_runner import connect_kwargs  # Loads backend/.env
+    target = dict(connect_kwargs(), application_name=APPLICATION_NAME)
+    try:
+        run_load(target, source_kwargs(target, args.source_database), args.workers, args.chunk_rows,
+                 args.script, args.keep_raw)
+    except (OSError, ValueError, LoadNotPossible) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except psycopg2.Error as e:
+        print(f"Error loading phm_edw: {str(e).strip()} (the live tables are unchanged unless the swap completed)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Live progress for long ETL statements.
+
+``ProgressMonitor`` is a daemon thread with its own connection. Every
+``interval`` seconds it looks up the ETL's backends in pg_stat_activity (by
+application_name, which the runners set, so psql, the serial runner and
+every DAG worker are all found) and prints, for each statement that has been
+running at least one interval:
+
+    elapsed time, target table, state and wait event
+    any lock the backend is waiting for (pg_locks) and the PIDs blocking it,
+    with what those sessions are running
+    phase and percentage from pg_stat_progress_create_index / _copy /
+    _analyze / _vacuum, when the statement is one of those
+
+Progress views missing from older servers are skipped. A failing monitor
+query stops the monitor, never the ETL.
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+import psycopg2
+import psycopg2.errors
+
+from etl_statements import classify
+
+DEFAULT_PROGRESS_INTERVAL = 10.0  # Seconds
+
+ACTIVITY_QUERY = """
+SELECT pid,
+       EXTRACT(EPOCH FROM now() - query_start),
+       state,
+       wait_event_type,
+       wait_event,
+       query,
+       pg_blocking_pids(pid)
+FROM pg_stat_activity
+WHERE application_name = %s
+  AND state <> 'idle'
+  AND pid <> pg_backend_pid()
+  AND now() - query_start >= make_interval(secs => %s)
+ORDER BY query_start;
+"""
+
+WAITING_LOCKS_QUERY = """
+SELECT pid, mode, locktype, relation::regclass::text
+FROM pg_locks
+WHERE NOT granted AND pid = ANY(%s);
+"""
+
+BLOCKERS_QUERY = """
+SELECT pid, application_name, state, EXTRACT(EPOCH FROM now() - xact_start), left(query, 80)
+FROM pg_stat_activity
+WHERE pid = ANY(%s);
+"""
+
+# view -> query returning (pid, relation, phase, done, total, unit) for the given pids
+PROGRESS_QUERIES = {
+    'pg_stat_progress_create_index': """
+        SELECT pid, relid::regclass::text, phase,
+               CASE WHEN blocks_total > 0 THEN blocks_done ELSE tuples_done END,
+               CASE WHEN blocks_total > 0 THEN blocks_total ELSE tuples_total END,
+               CASE WHEN blocks_total > 0 THEN 'blocks' ELSE 'tuples' END
+        FROM pg_stat_progress_create_index WHERE pid = ANY(%s);
+    """,
+    'pg_stat_progress_copy': """
+        SELECT pid, relid::regclass::text, command || ' ' || type,
+               CASE WHEN bytes_total > 0 THEN bytes_processed ELSE tuples_processed END,
+               CASE WHEN bytes_total > 0 THEN bytes_total ELSE 0 END,
+               CASE WHEN bytes_total > 0 THEN 'bytes' ELSE 'tuples' END
+        FROM pg_stat_progress_copy WHERE pid = ANY(%s);
+    """,
+    'pg_stat_progress_analyze': """
+        SELECT pid, relid::regclass::text, phase, sample_blks_scanned, sample_blks_total, 'blocks'
+        FROM pg_stat_progress_analyze WHERE pid = ANY(%s);
+    """,
+    'pg_stat_progress_vacuum': """
+        SELECT pid, relid::regclass::text, phase, heap_blks_scanned, heap_blks_total, 'blocks'
+        FROM pg_stat_progress_vacuum WHERE pid = ANY(%s);
+    """,
+}
+
+
+def format_seconds(seconds) -> str:
+    seconds = int(seconds or 0)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressMonitor(threading.Thread):
+    """Polls the server for the ETL's running statements until ``stop`` is called."""
+
+    def __init__(self, connect_kwargs: Dict[str, object], application_name: str,
+                 interval: float = DEFAULT_PROGRESS_INTERVAL):
+        super().__init__(name="etl-progress", daemon=True)
+        self.connect_kwargs = dict(connect_kwargs, application_name=application_name + ":progress")
+        self.application_name = application_name
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._progress_views = dict(PROGRESS_QUERIES)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self) -> None:
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except psycopg2.Error as e:
+            print(f"Progress monitor disabled, cannot connect: {str(e).strip()}")
+            return
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                while not self._stop_event.wait(self.interval):
+                    self.poll(cursor)
+        except psycopg2.Error as e:
+            print(f"Progress monitor stopped: {str(e).strip()}")
+        finally:
+            conn.close()
+
+    def poll(self, cursor) -> None:
+        cursor.execute(ACTIVITY_QUERY, (self.application_name, self.interval))
+        activity = cursor.fetchall()
+        if not activity:
+            return
+        pids = [row[0] for row in activity]
+        blocking_pids = sorted({blocker for row in activity for blocker in row[6] or ()})
+
+        cursor.execute(WAITING_LOCKS_QUERY, (pids,))
+        waiting: Dict[int, List[str]] = {}
+        for pid, mode, locktype, relation in cursor.fetchall():
+            waiting.setdefault(pid, []).append(f"{mode} on {relation or locktype}")
+
+        blockers = {}
+        if blocking_pids:
+            cursor.execute(BLOCKERS_QUERY, (blocking_pids,))
+            for pid, application, state, xact_seconds, query in cursor.fetchall():
+                blockers[pid] = (f"pid {pid} ({application or 'no application_name'}, {state}, "
+                                 f"transaction open {format_seconds(xact_seconds)}): {' '.join(query.split())}")
+
+        progress = self._progress(cursor, pids)
+
+        for pid, seconds, state, wait_type, wait_event, query, blocked_by in activity:
+            command, table = classify(query)
+            wait = f"waiting on {wait_type}/{wait_event}" if wait_event else "on CPU"
+            print(f"[progress {format_seconds(seconds)}] pid {pid}: {command} {table or ''} "
+                  f"({state}, {wait})")
+            for lock in waiting.get(pid, ()):
+                print(f"    waiting for lock {lock}")
+            for blocker in blocked_by or ():
+                print(f"    blocked by {blockers.get(blocker, f'pid {blocker}')}")
+            for line in progress.get(pid, ()):
+                print(f"    {line}")
+
+    def _progress(self, cursor, pids: List[int]) -> Dict[int, List[str]]:
+        lines: Dict[int, List[str]] = {}
+        for view, query in list(self._progress_views.items()):
+            try:
+                cursor.execute(query, (pids,))
+            except psycopg2.errors.UndefinedTable:
+                del self._progress_views[view]  # Not on this server version
+                continue
+            for pid, relation, phase, done, total, unit in cursor.fetchall():
+                percent = f" ({100.0 * done / total:.0f}%)" if total else ""
+                lines.setdefault(pid, []).append(
+                    f"{view.replace('pg_stat_progress_', '')} {relation}: {phase}, {done}/{total or '?'} {unit}{percent}")
+        return lines
+
+
+def start_monitor(connect_kwargs: Dict[str, object], application_name: str,
+                  interval: float) -> Optional[ProgressMonitor]:
+    """Starts a monitor, or returns None when ``interval`` is 0."""
+    if interval <= 0:
+        return None
+    monitor = ProgressMonitor(connect_kwargs, application_name, interval)
+    monitor.start()
+    return monitor
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Splits an ETL SQL script into statements for the native runner in etl_monitor.py.
+
+The splitter understands just enough PostgreSQL lexical structure to find
+statement-ending semicolons: ``--`` and ``/* */`` comments, single-quoted
+strings (including ``E''`` escapes), double-quoted identifiers and
+dollar-quoted bodies. Each statement remembers the ``-- STEP n: Title``
+banner it appeared under, and ``classify`` reports its command and target
+table so statements can be matched against ``OPERATION_ORDER``.
+
+``with_clause``, ``chain_ctes`` and ``restrict_tables`` let the measure
+runner derive per-patient queries from the Measures/ scripts (care_gaps.py).
+"""
+
+import re
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+_STEP_HEADER = re.compile(r'--\s*STEP\s+(\d+)\s*:\s*(.*)', re.IGNORECASE)
+_DOLLAR_TAG = re.compile(r'\$([A-Za-z_][A-Za-z_0-9]*)?\$')
+_TABLE_NAME = re.compile(r'\s*(?:ONLY\s+)?((?:"[^"]+"|[A-Za-z_][A-Za-z_0-9$]*)(?:\.(?:"[^"]+"|[A-Za-z_][A-Za-z_0-9$]*))?)',
+                         re.IGNORECASE)
+
+
+class Statement(NamedTuple):
+    sql: str                   # Statement text without the trailing semicolon
+    line: int                  # 1-based line where the statement starts
+    step: Optional[int]        # Number from the nearest preceding "-- STEP n:" banner
+    step_title: Optional[str]  # Title from that banner
+
+
+def split_sql(text: str) -> List[Statement]:
+    """Splits a script into statements, skipping empty ones and pure comments."""
+    statements: List[Statement] = []
+    step: Optional[int] = None
+    step_title: Optional[str] = None
+    i = 0
+    n = len(text)
+    has_code = False       # Current statement has something besides comments/whitespace
+    code_start = 0
+
+    while i < n:
+        ch = text[i]
+        if ch == '-' and text.startswith('--', i):
+            end = text.find('\n', i)
+            end = n if end < 0 else end
+            header = _STEP_HEADER.match(text, i, end)
+            if header and not has_code:
+                step = int(header.group(1))
+                step_title = header.group(2).strip()
+            i = end
+            continue
+        if ch == '/' and text.startswith('/*', i):
+            # Block comments nest in PostgreSQL
+            depth = 0
+            while i < n:
+                if text.startswith('/*', i):
+                    depth += 1
+                    i += 2
+                elif text.startswith('*/', i):
+                    depth -= 1
+                    i += 2
+                    if depth == 0:
+                        break
+                else:
+                    i += 1
+            continue
+        if ch.isspace():
+            i += 1
+            continue
+
+        if not has_code:
+            has_code = True
+            code_start = i
+        if ch == "'":
+            escaped = i > 0 and text[i - 1] in 'eE' and (i < 2 or not (text[i - 2].isalnum() or text[i - 2] == '_'))
+            i += 1
+            while i < n:
+                if escaped and text[i] == '\\':
+                    i += 2
+                    continue
+                if text[i] == "'":
+                    if text.startswith("''", i):
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+        elif ch == '"':
+            end = text.find('"', i + 1)
+            i = n if end < 0 else end + 1
+        elif ch == '$':
+            tag = _DOLLAR_TAG.match(text, i)
+            if tag and (i == 0 or not (text[i - 1].isalnum() or text[i - 1] == '_')):
+                end = text.find(tag.group(0), tag.end())
+                i = n if end < 0 else end + len(tag.group(0))
+            else:
+                i += 1
+        elif ch == ';':
+            sql = text[code_start:i].strip()
+            if sql:
+                statements.append(Statement(sql, text.count('\n', 0, code_start) + 1, step, step_title))
+            has_code = False
+            i += 1
+        else:
+            i += 1
+
+    if has_code:
+        sql = text[code_start:].strip()
+        statements.append(Statement(sql, text.count('\n', 0, code_start) + 1, step, step_title))
+    return statements
+
+
+def _strip_comments(sql: str) -> str:
+    """Blanks out comments and string literals so keyword scans only see code.
+
+    The result has the same length as ``sql``, so offsets found in it apply
+    to the original text.
+    """
+    out = []
+    i = 0
+    n = len(sql)
+    while i < n:
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end < 0 else end
+            out.append(' ' * (end - i))
+            i = end
+        elif sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            out.append(' ' * (end - i))
+            i = end
+        elif sql[i] == "'":
+            end = i + 1
+            while end < n:
+                if sql[end] == "'" and not sql.startswith("''", end):
+                    break
+                end += 2 if sql.startswith("''", end) else 1
+            end = min(end + 1, n)
+            out.append("'" + ' ' * (end - i - 2) + "'" if end - i >= 2 else "'")
+            i = end
+        else:
+            out.append(sql[i])
+            i += 1
+    return ''.join(out)
+
+
+def _main_command(code: str) -> Tuple[str, Optional[re.Match]]:
+    """The statement's command word and its match in ``code`` (comments stripped), skipping WITH's CTEs."""
+    depth = 0
+    first = None
+    for match in re.finditer(r'[()]|[A-Za-z_][A-Za-z_0-9$]*', code):
+        token = match.group(0)
+        if token == '(':
+            depth += 1
+            continue
+        if token == ')':
+            depth -= 1
+            continue
+        if depth:
+            continue
+        word = token.upper()
+        if first is None:
+            first = word
+            if word != 'WITH':
+                return word, match
+            continue
+        if word in ('INSERT', 'UPDATE', 'DELETE', 'SELECT', 'MERGE'):
+            return word, match
+    return (first or ''), None
+
+
+def classify(sql: str) -> Tuple[str, Optional[str]]:
+    """Returns (command, target table) for a statement, e.g. ('INSERT', 'phm_star.dim_patient').
+
+    For ``WITH ... UPDATE`` the command is the top-level statement after the
+    CTEs. The table is None for commands without a single target.
+    """
+    code = _strip_comments(sql)
+    command, match = _main_command(code)
+    if match is None:
+        return command, None
+    return command, _target_table(command, code, match.end())
+
+
+def with_clause(sql: str) -> str:
+    """The ``WITH ...`` CTE list of a statement, up to its top-level command; '' without one."""
+    code = _strip_comments(sql)
+    command, match = _main_command(code)
+    if match is None or not re.match(r'\s*WITH\b', code, re.IGNORECASE):
+        return ''
+    return sql[:match.start()]
+
+
+def _target_table(command: str, code: str, pos: int) -> Optional[str]:
+    keyword = {'INSERT': 'INTO', 'DELETE': 'FROM', 'MERGE': 'INTO', 'TRUNCATE': None, 'UPDATE': None}
+    if command not in keyword:
+        return None
+    rest = code[pos:]
+    if command == 'TRUNCATE':
+        rest = re.sub(r'^\s*TABLE\b', '', rest, flags=re.IGNORECASE)
+    elif keyword[command]:
+        rest = re.sub(r'^\s*' + keyword[command] + r'\b', '', rest, flags=re.IGNORECASE)
+    table = _TABLE_NAME.match(rest)
+    return table.group(1).replace('"', '') if table else None
+
+
+def short_table_name(table: Optional[str]) -> Optional[str]:
+    """'phm_star.dim_patient' -> 'dim_patient'."""
+    return table.rsplit('.', 1)[-1] if table else None
+
+
+def retarget_insert(sql: str, table: str, new_table: str) -> str:
+    """Rewrites the first ``INTO <table>`` so the statement inserts into ``new_table`` instead."""
+    target = re.compile(r'(\bINTO\s+)' + re.escape(table) + r'\b', re.IGNORECASE)
+    return target.sub(lambda m: m.group(1) + new_table, sql, count=1)
+
+
+# Words that can follow a table reference in FROM/JOIN; anything else there is an alias.
+_CLAUSE_WORDS = frozenset((
+    'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'NATURAL', 'ON', 'USING', 'GROUP',
+    'ORDER', 'HAVING', 'WINDOW', 'LIMIT', 'OFFSET', 'FETCH', 'FOR', 'UNION', 'INTERSECT', 'EXCEPT',
+    'LATERAL', 'TABLESAMPLE', 'RETURNING',
+))
+
+
+def restrict_tables(sql: str, tables: Iterable[str], predicate: str) -> str:
+    """Replaces each FROM/JOIN reference to one of ``tables`` with a subquery filtered by ``predicate``.
+
+    ``FROM phm_edw.encounter e`` becomes
+    ``FROM (SELECT * FROM phm_edw.encounter WHERE <predicate>) e``; a
+    reference without an alias keeps the table's name as its alias, so
+    qualified column references still resolve.
+    """
+    names = sorted({table.lower() for table in tables}, key=len, reverse=True)
+    if not names:
+        return sql
+    code = _strip_comments(sql)
+    reference = re.compile(r'(?:\bFROM|\bJOIN|,)\s+(' + '|'.join(re.escape(name) for name in names)
+                           + r')\b(?!\s*[.(])\s*([A-Za-z_][A-Za-z_0-9$]*)?', re.IGNORECASE)
+    parts = []
+    last = 0
+    for match in reference.finditer(code):
+        table = match.group(1)
+        follower = match.group(2)
+        alias = '' if follower and follower.upper() not in _CLAUSE_WORDS else f" AS {short_table_name(table)}"
+        parts.append(sql[last:match.start(1)])
+        parts.append(f"(SELECT * FROM {sql[match.start(1):match.end(1)]} WHERE {predicate}){alias}")
+        last = match.end(1)
+    parts.append(sql[last:])
+    return ''.join(parts)
+
+
+def chain_ctes(first: str, second: str) -> str:
+    """``second`` with the CTEs of ``first`` in scope, e.g. a script's detail query after its summary query.
+
+    A ``second`` with its own WITH clause is taken to be self-contained and returned as is.
+    """
+    ctes = with_clause(first).rstrip()
+    if not ctes or re.match(r'\s*WITH\b', _strip_comments(second), re.IGNORECASE):
+        return second
+    return f"{ctes}\n{second}"
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Shadow-table publishing for the Type-1 dimension reloads.
+
+In ETL_edw_to_star.sql a Type-1 dimension is reloaded with ``TRUNCATE ...
+CASCADE`` followed by an ``INSERT``; the TRUNCATE holds an ACCESS EXCLUSIVE
+lock until the transaction commits and empties every fact that references
+the dimension. ``publish_by_swap`` runs the same INSERTs against a shadow
+copy instead and swaps it in:
+
+1. ``CREATE TABLE <dim>_shadow (LIKE <dim> ...)`` and run the step's INSERTs
+   into it. Rows whose natural key already exists get their old surrogate key
+   back, so facts keep pointing at the right members.
+2. Build the dimension's indexes and constraints on the shadow, copy grants
+   and the table comment, ``ANALYZE`` it, and delete the (usually zero) fact
+   rows that reference members no longer present.
+3. Swap, under ``lock_timeout``: drop the referencing foreign keys, rename
+   the live table away and the shadow into place, move the key sequence,
+   drop the old table, give indexes their original names and re-add the
+   foreign keys ``NOT VALID``. Readers wait only for these catalog updates.
+4. After the commit, ``VALIDATE`` the foreign keys, which does not block
+   readers or writers.
+
+Steps 1-3 run in the caller's transaction, so a failure leaves the live
+table untouched. Dimensions with dependent views, multi-column or
+self-referencing foreign keys are not swapped (SwapNotPossible).
+"""
+
+import re
+import time
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+
+from etl_statements import classify, retarget_insert
+
+SHADOW_SUFFIX = '_shadow'
+RETIRED_SUFFIX = '_retired'
+SWAP_LOCK_TIMEOUT = '5s'
+SWAP_ATTEMPTS = 5
+MAX_IDENTIFIER_LENGTH = 63
+
+
+class SwapNotPossible(Exception):
+    """The dimension cannot be published by swapping."""
+
+
+class SwapResult(NamedTuple):
+    rowcounts: Tuple[int, ...]     # One per step statement (the TRUNCATE counts 0)
+    retired_members: int           # Members in the old table but not the new one
+    fact_rows_removed: int         # Fact rows that referenced retired members
+    lock_acquired: float           # perf_counter() when the swap's locks were granted; held until the caller commits
+    validate: Callable             # validate(cursor): VALIDATE the re-added foreign keys
+
+
+def type1_table(statements: Sequence) -> Optional[str]:
+    """Qualified table of a TRUNCATE-then-INSERT step, or None for any other step."""
+    commands = [classify(statement.sql) for statement in statements]
+    if len(commands) < 2 or commands[0][0] != 'TRUNCATE' or not commands[0][1]:
+        return None
+    table = commands[0][1]
+    if all(command == 'INSERT' and target == table for command, target in commands[1:]):
+        return table
+    return None
+
+
+def _ident(qualified: str) -> sql.Identifier:
+    return sql.Identifier(*qualified.split('.'))
+
+
+def _suffixed(name: str, suffix: str) -> str:
+    return name[:MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+def _fetch_catalog(cursor, table: str):
+    cursor.execute("""
+        SELECT 1 FROM pg_depend d
+        WHERE d.refobjid = %s::regclass AND d.classid = 'pg_rewrite'::regclass
+        LIMIT 1;
+    """, (table,))
+    if cursor.fetchone():
+        raise SwapNotPossible(f"{table} has dependent views")
+
+    cursor.execute("""
+        SELECT a.attname
+        FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary;
+    """, (table,))
+    key_columns = [row[0] for row in cursor.fetchall()]
+    if len(key_columns) != 1:
+        raise SwapNotPossible(f"{table} needs a single-column primary key")
+
+    cursor.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid), con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid AND con.conrelid = i.indrelid
+        WHERE i.indrelid = %s::regclass
+        ORDER BY i.indisprimary DESC, c.relname;
+    """, (table,))
+    indexes = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT con.conrelid::regclass::text, con.conname, pg_get_constraintdef(con.oid),
+               array_length(con.conkey, 1), a.attname
+        FROM pg_constraint con
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = con.conkey[1]
+        WHERE con.confrelid = %s::regclass AND con.contype = 'f';
+    """, (table,))
+    foreign_keys = cursor.fetchall()
+    for referencing, name, _, columns, _ in foreign_keys:
+        if columns != 1 or referencing == table:
+            raise SwapNotPossible(f"{table} is referenced by {referencing}.{name}, which cannot be re-pointed")
+
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f';
+    """, (table,))
+    outgoing_keys = cursor.fetchall()
+
+    cursor.execute("SELECT pg_get_serial_sequence(%s, %s), obj_description(%s::regclass, 'pg_class');",
+                   (table, key_columns[0], table))
+    sequence, comment = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT r.rolname, acl.privilege_type  -- rolname is NULL for PUBLIC
+        FROM pg_class c
+        CROSS JOIN LATERAL aclexplode(c.relacl) AS acl
+        LEFT JOIN pg_roles r ON r.oid = acl.grantee
+        WHERE c.oid = %s::regclass;
+    """, (table,))
+    grants = cursor.fetchall()
+    return key_columns[0], indexes, foreign_keys, outgoing_keys, sequence, comment, grants
+
+
+def check_swappable(cursor, statements: Sequence) -> None:
+    """Raises SwapNotPossible unless publish_by_swap can publish this step; only reads the catalog."""
+    table = type1_table(statements)
+    if table is None:
+        raise SwapNotPossible("not a TRUNCATE-then-INSERT step")
+    _fetch_catalog(cursor, table)
+
+
+def publish_by_swap(conn, statements: Sequence, natural_key: str,
+                    log: Callable[[str], None] = print) -> SwapResult:
+    """Loads a Type-1 step into a shadow table and swaps it in; see the module docstring.
+
+    Runs in ``conn``'s current transaction and leaves it uncommitted: the
+    caller commits, then calls ``result.validate(cursor)`` and commits again.
+    The swap's ACCESS EXCLUSIVE locks on the dimension and its referencing
+    facts last until that first commit, so the caller should commit promptly
+    and time the window from ``result.lock_acquired``.
+    """
+    table = type1_table(statements)
+    if table is None:
+        raise SwapNotPossible("not a TRUNCATE-then-INSERT step")
+    schema, name = table.split('.')
+    shadow = f"{schema}.{_suffixed(name, SHADOW_SUFFIX)}"
+    retired = f"{schema}.{_suffixed(name, RETIRED_SUFFIX)}"
+
+    with conn.cursor() as cursor:
+        key, indexes, foreign_keys, outgoing_keys, sequence, comment, grants = _fetch_catalog(cursor, table)
+
+        # --- Load the shadow ---
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(_ident(shadow)))
+        cursor.execute(sql.SQL(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS)"
+        ).format(_ident(shadow), _ident(table)))
+        rowcounts = [0]
+        for statement in statements[1:]:
+            cursor.execute(retarget_insert(statement.sql, table, shadow))
+            rowcounts.append(max(cursor.rowcount, 0))
+        cursor.execute(sql.SQL("""
+            UPDATE {shadow} AS s SET {key} = live.{key}
+            FROM {table} AS live
+            WHERE live.{natural} = s.{natural}
+        """).format(shadow=_ident(shadow), table=_ident(table), key=sql.Identifier(key),
+                    natural=sql.Identifier(natural_key)))
+
+        # --- Indexes, constraints, grants, statistics ---
+        renames = []
+        for index_name, index_def, constraint_name, constraint_def in indexes:
+            shadow_index = _suffixed(index_name, SHADOW_SUFFIX)
+            if constraint_name:
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + constraint_def)
+                               .format(_ident(shadow), sql.Identifier(shadow_index)))
+            else:
+                index_def = re.sub(r'^(CREATE (?:UNIQUE )?INDEX )\S+ ON (?:ONLY )?\S+',
+                                   lambda m: f"{m.group(1)}{shadow_index} ON {shadow}", index_def)
+                cursor.execute(index_def)
+            renames.append((shadow_index, index_name))
+        for constraint_name, constraint_def in outgoing_keys:
+            cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + constraint_def)
+                           .format(_ident(shadow), sql.Identifier(constraint_name)))
+        for grantee, privilege in grants:
+            cursor.execute(sql.SQL("GRANT {} ON {} TO {}").format(
+                sql.SQL(privilege), _ident(shadow), sql.SQL("PUBLIC") if grantee is None else sql.Identifier(grantee)))
+        if comment is not None:
+            cursor.execute(sql.SQL("COMMENT ON TABLE {} IS %s").format(_ident(shadow)), (comment,))
+        cursor.execute(sql.SQL("ANALYZE {}").format(_ident(shadow)))
+
+        cursor.execute(sql.SQL("""
+            SELECT COUNT(*) FROM {table} AS live
+            WHERE NOT EXISTS (SELECT 1 FROM {shadow} AS s WHERE s.{key} = live.{key})
+        """).format(table=_ident(table), shadow=_ident(shadow), key=sql.Identifier(key)))
+        retired_members = cursor.fetchone()[0]
+        fact_rows_removed = 0
+        if retired_members:
+            for referencing, _, _, _, column in foreign_keys:
+                cursor.execute(sql.SQL("""
+                    DELETE FROM {fact} AS f
+                    WHERE f.{column} IN (
+                        SELECT live.{key} FROM {table} AS live
+                        WHERE NOT EXISTS (SELECT 1 FROM {shadow} AS s WHERE s.{key} = live.{key})
+                    )
+                """).format(fact=_ident(referencing), column=sql.Identifier(column), key=sql.Identifier(key),
+                            table=_ident(table), shadow=_ident(shadow)))
+                fact_rows_removed += max(cursor.rowcount, 0)
+
+        # --- Swap ---
+        cursor.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+        for attempt in range(1, SWAP_ATTEMPTS + 1):
+            cursor.execute("SAVEPOINT etl_swap")
+            lock_acquired = time.perf_counter()
+            try:
+                cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(_ident(table)))
+                for referencing, constraint_name, _, _, _ in foreign_keys:
+                    cursor.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}")
+                                   .format(_ident(referencing), sql.Identifier(constraint_name)))
+                cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}")
+                               .format(_ident(table), sql.Identifier(retired.split('.')[1])))
+                cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(_ident(shadow), sql.Identifier(name)))
+                if sequence:
+                    cursor.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}")
+                                   .format(sql.SQL(sequence), _ident(table), sql.Identifier(key)))
+                cursor.execute(sql.SQL("DROP TABLE {}").format(_ident(retired)))
+                for shadow_index, index_name in renames:
+                    cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}")
+                                   .format(sql.Identifier(schema, shadow_index), sql.Identifier(index_name)))
+                for referencing, constraint_name, constraint_def, _, _ in foreign_keys:
+                    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} " + constraint_def + " NOT VALID")
+                                   .format(_ident(referencing), sql.Identifier(constraint_name)))
+                cursor.execute("RELEASE SAVEPOINT etl_swap")
+                break
+            except psycopg2.errors.LockNotAvailable:
+                cursor.execute("ROLLBACK TO SAVEPOINT etl_swap")
+                if attempt == SWAP_ATTEMPTS:
+                    raise
+                log(f"{table}: swap lock not granted within {SWAP_LOCK_TIMEOUT}, retrying "
+                    f"(attempt {attempt + 1}/{SWAP_ATTEMPTS})")
+                time.sleep(attempt)
+
+    def validate(cursor):
+        for referencing, constraint_name, _, _, _ in foreign_keys:
+            cursor.execute(sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}")
+                           .format(_ident(referencing), sql.Identifier(constraint_name)))
+
+    return SwapResult(tuple(rowcounts), retired_members, fact_rows_removed, lock_acquired, validate)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Watermarks for the incremental fact loads in ETL_edw_to_star.sql.
+
+Each fact step reads one EDW source table and only scans rows whose
+``COALESCE(updated_date, created_date)`` is at or after the session setting
+``etl.since_<table>``; when the setting is unset (e.g. under psql) the step
+scans everything, as before. The runner passes the settings as connection
+options, so the same script serves both.
+
+A watermark is the database time at which a run started, stored in
+phm_edw.etl_log as a SUCCESS row with ``source_system = 'etl_watermark:<table>'``
+(the same high-water-mark pattern as assign_providers_by_geo.py). It only
+advances when the step that used it commits. Runs read from the watermark
+minus WATERMARK_OVERLAP, so rows written by transactions that were still open
+when the previous run started are not missed; the steps' NOT EXISTS checks
+make re-reading them harmless.
+
+A fact that depends, directly or through other steps, on a step that
+TRUNCATEs (the Type-1 dimensions, truncated with CASCADE) is emptied on every
+run, so it is always loaded in full; with ``--publish swap`` the dimensions
+are not truncated and those facts load incrementally too. Source rows skipped because a dimension
+row was missing are only picked up again once they change, or by a run with
+``--no-watermarks``.
+"""
+
+import datetime
+from typing import Dict, Iterable, Optional, Sequence, Set
+
+from etl_statements import classify
+
+WATERMARK_SOURCE_PREFIX = 'etl_watermark:'
+WATERMARK_OVERLAP = datetime.timedelta(minutes=15)
+
+
+def setting_name(source_table: str) -> str:
+    """'phm_edw.encounter' -> 'etl.since_encounter'."""
+    return 'etl.since_' + source_table.rsplit('.', 1)[-1]
+
+
+def emptied_by_truncate(steps: Sequence, dependencies: Dict[str, Sequence[str]],
+                        not_truncated: Iterable[str] = ()) -> Set[str]:
+    """Steps whose table is emptied by a TRUNCATE ... CASCADE earlier in the same run.
+
+    ``steps`` are etl_dag.EtlStep; a step counts when any step it depends on,
+    transitively, contains a TRUNCATE. Steps in ``not_truncated`` (published
+    by shadow swap, see etl_swap.py) do not truncate.
+    """
+    skipped = set(not_truncated)
+    truncating = {step.name for step in steps if step.name not in skipped
+                  and any(classify(statement.sql)[0] == 'TRUNCATE' for statement in step.statements)}
+    emptied: Set[str] = set()
+
+    def reaches_truncate(name, seen):
+        for dependency in dependencies.get(name, ()):
+            if dependency in truncating or dependency in emptied:
+                return True
+            if dependency not in seen:
+                seen.add(dependency)
+                if reaches_truncate(dependency, seen):
+                    return True
+        return False
+
+    for step in steps:
+        if reaches_truncate(step.name, set()):
+            emptied.add(step.name)
+    return emptied
+
+
+def get_watermarks(cursor, source_tables: Iterable[str]) -> Dict[str, datetime.datetime]:
+    """Latest watermark per source table; tables never loaded incrementally are absent."""
+    tables = list(source_tables)
+    cursor.execute("""
+        SELECT substr(source_system, %s), MAX(load_start_timestamp)
+        FROM phm_edw.etl_log
+        WHERE source_system = ANY(%s) AND load_status = 'SUCCESS'
+        GROUP BY source_system;
+    """, (len(WATERMARK_SOURCE_PREFIX) + 1, [WATERMARK_SOURCE_PREFIX + table for table in tables]))
+    return dict(cursor.fetchall())
+
+
+def apply_settings(cursor, since: Dict[str, Optional[datetime.datetime]]) -> None:
+    """Sets etl.since_<table> for the rest of the session; a None value clears it (full load)."""
+    for table, value in sorted(since.items()):
+        cursor.execute("SELECT set_config(%s, %s, false);", (setting_name(table), value.isoformat() if value else ''))
+
+
+def connection_options(since: Dict[str, Optional[datetime.datetime]]) -> str:
+    """libpq ``options`` that set etl.since_<table> for every table with a watermark."""
+    return " ".join(f"-c {setting_name(table)}={value.isoformat()}"
+                    for table, value in sorted(since.items()) if value is not None)
+
+
+def record_watermark(cursor, source_table: str, run_start: datetime.datetime, rows_inserted: int) -> None:
+    """Advances a table's watermark; call inside the step's transaction, or after it committed."""
+    cursor.execute("""
+        INSERT INTO phm_edw.etl_log
+            (source_system, load_start_timestamp, load_end_timestamp, rows_inserted, load_status)
+        VALUES (%s, %s, LOCALTIMESTAMP, %s, 'SUCCESS');
+    """, (WATERMARK_SOURCE_PREFIX + source_table, run_start, rows_inserted))
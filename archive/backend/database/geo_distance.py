@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Batched NumPy haversine kernel for patient-to-organization distances.
+
+``nearest_orgs_numpy`` evaluates the same formula as ``haversine(...,
+unit=Unit.MILES)`` over a (patients x orgs) grid, one cache-sized block at a
+time, and keeps a running argmin per patient instead of materializing the full
+distance matrix. Ties resolve to the lowest org position, as the stable sort in
+the pure-Python reference path (``geo_index.nearest_orgs_brute``) does.
+
+Run this module directly to check the kernel against the reference path on
+random coordinates:
+
+    python geo_distance.py --patients 2000 --orgs 500
+"""
+
+import argparse
+import math
+import random
+import sys
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; callers check HAVE_NUMPY
+    np = None
+
+from geo_index import EARTH_RADIUS_MILES, nearest_orgs_brute
+
+HAVE_NUMPY = np is not None
+
+# Block shape for the distance grid. 256 x 512 float64 values is 1 MiB per
+# temporary, small enough for the working set of one block to stay in L2.
+DEFAULT_PATIENT_BLOCK = 256
+DEFAULT_ORG_BLOCK = 512
+
+# Relative tolerance used when comparing the kernel with the reference path.
+VERIFY_RTOL = 1e-9
+
+
+def nearest_orgs_numpy(patient_lat, patient_lon, org_lat, org_lon,
+                       patient_block=DEFAULT_PATIENT_BLOCK, org_block=DEFAULT_ORG_BLOCK):
+    """Finds the nearest org for every patient.
+
+    Takes four 1-D sequences of coordinates in degrees and returns
+    ``(positions, distances)``: an int64 array of org positions and a float64
+    array of distances in miles, one entry per patient.
+    """
+    if not HAVE_NUMPY:
+        raise RuntimeError("numpy is required for the vectorized haversine engine")
+
+    p_lat = np.radians(np.asarray(patient_lat, dtype=np.float64))
+    p_lon = np.radians(np.asarray(patient_lon, dtype=np.float64))
+    o_lat = np.radians(np.asarray(org_lat, dtype=np.float64))
+    o_lon = np.radians(np.asarray(org_lon, dtype=np.float64))
+    o_cos = np.cos(o_lat)
+
+    n_patients = p_lat.shape[0]
+    n_orgs = o_lat.shape[0]
+    positions = np.full(n_patients, -1, dtype=np.int64)
+    distances = np.full(n_patients, np.inf, dtype=np.float64)
+    if n_patients == 0 or n_orgs == 0:
+        return positions, distances
+
+    for p_start in range(0, n_patients, patient_block):
+        p_end = min(p_start + patient_block, n_patients)
+        lat1 = p_lat[p_start:p_end, None]
+        lon1 = p_lon[p_start:p_end, None]
+        cos1 = np.cos(lat1)
+        best_pos = positions[p_start:p_end]
+        best_dist = distances[p_start:p_end]
+
+        for o_start in range(0, n_orgs, org_block):
+            o_end = min(o_start + org_block, n_orgs)
+            d = np.sin((o_lat[None, o_start:o_end] - lat1) * 0.5) ** 2
+            d += cos1 * o_cos[None, o_start:o_end] * np.sin((o_lon[None, o_start:o_end] - lon1) * 0.5) ** 2
+            block_pos = np.argmin(d, axis=1)
+            block_dist = 2.0 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(d[np.arange(p_end - p_start), block_pos]))
+            # Strict comparison keeps the earlier block on ties.
+            better = block_dist < best_dist
+            best_pos[better] = block_pos[better] + o_start
+            best_dist[better] = block_dist[better]
+
+    return positions, distances
+
+
+# --- Verification ---
+def verify_against_reference(n_patients, n_orgs, seed=0, rtol=VERIFY_RTOL):
+    """Compares the NumPy kernel with the pure-Python reference on random points.
+
+    Returns the number of patients whose nearest org or distance disagrees.
+    A different org counts as agreement only when both orgs are equidistant
+    within ``rtol``.
+    """
+    rng = random.Random(seed)
+    orgs = [{'id': i, 'lat': rng.uniform(-60.0, 70.0), 'lon': rng.uniform(-180.0, 180.0)}
+            for i in range(n_orgs)]
+    # Duplicate a few sites so exact ties are exercised as well.
+    orgs += [dict(org, id=n_orgs + i) for i, org in enumerate(orgs[:max(1, n_orgs // 50)])]
+    patients = [(rng.uniform(-60.0, 70.0), rng.uniform(-180.0, 180.0)) for _ in range(n_patients)]
+    patients += [(org['lat'], org['lon']) for org in orgs[:10]]
+
+    positions, distances = nearest_orgs_numpy(
+        [p[0] for p in patients], [p[1] for p in patients],
+        [o['lat'] for o in orgs], [o['lon'] for o in orgs],
+    )
+
+    mismatches = 0
+    for i, patient_loc in enumerate(patients):
+        ref_distance, ref_position = nearest_orgs_brute(patient_loc, orgs)[0]
+        distance, position = float(distances[i]), int(positions[i])
+        if not math.isclose(distance, ref_distance, rel_tol=rtol, abs_tol=1e-9):
+            mismatches += 1
+            print(f"  Patient {i}: distance {distance} != reference {ref_distance}")
+        elif position != ref_position:
+            # Only acceptable when the two orgs are tied to within rounding.
+            alt_distance = nearest_orgs_brute(patient_loc, [orgs[position]])[0][0]
+            if not math.isclose(alt_distance, ref_distance, rel_tol=rtol, abs_tol=1e-9):
+                mismatches += 1
+                print(f"  Patient {i}: org position {position} != reference {ref_position}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the NumPy haversine kernel against the pure-Python reference."
+    )
+    parser.add_argument("--patients", type=int, default=2000, help="Random patients to test.")
+    parser.add_argument("--orgs", type=int, default=500, help="Random organizations to test.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    if not HAVE_NUMPY:
+        print("Error: numpy is not installed.")
+        sys.exit(1)
+
+    print(f"Comparing NumPy kernel with reference: {args.patients} patients x {args.orgs} orgs...")
+    failures = verify_against_reference(args.patients, args.orgs, seed=args.seed)
+    if failures:
+        print(f"FAILED: {failures} patients disagree with the reference path.")
+        sys.exit(1)
+    print("OK: NumPy kernel matches the reference path.")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Spatial index over organization coordinates for nearest-site lookup.
+
+Organizations are projected onto unit-sphere vectors and arranged in a ball
+tree. The straight-line (chord) distance between two unit vectors grows
+monotonically with great-circle distance, so a node's chord bound can be turned
+into a great-circle lower bound and used to prune whole subtrees.
+
+Candidate distances are still computed with the same ``haversine`` call the
+brute-force path uses, and ties are broken by each org's position in the input
+list (the order a stable sort would keep). That keeps ``OrgBallTree.nearest``
+result-for-result identical to ``nearest_orgs_brute``.
+"""
+
+import heapq
+import math
+
+from haversine import haversine, Unit
+
+# Mean earth radius in miles, matching haversine's Unit.MILES conversion.
+EARTH_RADIUS_MILES = haversine((0.0, 0.0), (0.0, 1.0), unit=Unit.MILES) / math.radians(1.0)
+
+# Slack (miles) applied before pruning a subtree, so floating point drift
+# between the chord bound and the haversine formula never drops a tie.
+_PRUNE_SLACK_MILES = 1e-6
+
+
+def to_unit_vector(lat, lon):
+    """Converts a latitude/longitude pair in degrees to an (x, y, z) unit vector."""
+    lat_r = math.radians(float(lat))
+    lon_r = math.radians(float(lon))
+    cos_lat = math.cos(lat_r)
+    return (cos_lat * math.cos(lon_r), cos_lat * math.sin(lon_r), math.sin(lat_r))
+
+
+def chord_to_miles(chord):
+    """Converts a unit-sphere chord length to a great-circle distance in miles."""
+    if chord <= 0.0:
+        return 0.0
+    return 2.0 * EARTH_RADIUS_MILES * math.asin(min(1.0, chord / 2.0))
+
+
+def nearest_orgs_brute(patient_loc, orgs_with_latlon, k=1):
+    """Reference nearest-org search: scores every org and sorts the full list.
+
+    Returns up to ``k`` ``(distance_miles, position)`` tuples, where ``position``
+    indexes into ``orgs_with_latlon``.
+    """
+    distances = []
+    for position, org in enumerate(orgs_with_latlon):
+        org_loc = (org['lat'], org['lon'])
+        distance = haversine(patient_loc, org_loc, unit=Unit.MILES)
+        distances.append((distance, position))
+    distances.sort(key=lambda x: x[0])
+    return distances[:k]
+
+
+class OrgBallTree:
+    """Ball tree over organization coordinates.
+
+    ``orgs`` is the same list of ``{'id', 'lat', 'lon', ...}`` dicts the
+    brute-force path scans; every org must have a latitude and longitude.
+    Nodes are stored in flat parallel lists rather than objects to keep the
+    index small and the search loop cheap. ``distance_evaluations`` counts the
+    haversine calls made by all searches so far.
+    """
+
+    def __init__(self, orgs, leaf_size=16):
+        self.orgs = orgs
+        self.leaf_size = max(1, leaf_size)
+        self._locs = [(org['lat'], org['lon']) for org in orgs]
+        self._vecs = [to_unit_vector(lat, lon) for lat, lon in self._locs]
+        self._order = list(range(len(orgs)))
+        self.distance_evaluations = 0
+
+        # Flat node storage: [start, end) slice of _order, bounding ball, children.
+        self._start = []
+        self._end = []
+        self._center = []
+        self._radius = []
+        self._left = []
+        self._right = []
+        if orgs:
+            self._build(0, len(orgs))
+
+    def __len__(self):
+        return len(self.orgs)
+
+    def _build(self, start, end):
+        """Recursively builds the node covering ``_order[start:end]``; returns its id."""
+        members = self._order[start:end]
+        count = end - start
+        cx = sum(self._vecs[i][0] for i in members) / count
+        cy = sum(self._vecs[i][1] for i in members) / count
+        cz = sum(self._vecs[i][2] for i in members) / count
+        radius = 0.0
+        for i in members:
+            vx, vy, vz = self._vecs[i]
+            radius = max(radius, math.sqrt((vx - cx) ** 2 + (vy - cy) ** 2 + (vz - cz) ** 2))
+
+        node_id = len(self._start)
+        self._start.append(start)
+        self._end.append(end)
+        self._center.append((cx, cy, cz))
+        self._radius.append(radius)
+        self._left.append(-1)
+        self._right.append(-1)
+
+        if count > self.leaf_size:
+            # Split on the axis with the widest spread, at the median.
+            spreads = []
+            for axis in range(3):
+                values = [self._vecs[i][axis] for i in members]
+                spreads.append(max(values) - min(values))
+            axis = spreads.index(max(spreads))
+            members.sort(key=lambda i: (self._vecs[i][axis], i))
+            self._order[start:end] = members
+            mid = start + count // 2
+            self._left[node_id] = self._build(start, mid)
+            self._right[node_id] = self._build(mid, end)
+        return node_id
+
+    def _lower_bound_miles(self, node_id, qvec):
+        """Smallest possible great-circle distance from the query to any org in a node."""
+        cx, cy, cz = self._center[node_id]
+        gap = math.sqrt((qvec[0] - cx) ** 2 + (qvec[1] - cy) ** 2 + (qvec[2] - cz) ** 2)
+        return chord_to_miles(gap - self._radius[node_id])
+
+    def nearest(self, patient_loc, k=1, exclude=None):
+        """Returns the ``k`` nearest orgs as ``(distance_miles, position)`` tuples.
+
+        Results are ordered by distance, then by position in ``orgs``, exactly
+        like a stable sort of the brute-force distance list. Positions listed
+        in ``exclude`` (any container supporting ``in``) are skipped.
+        """
+        if not self.orgs or k <= 0:
+            return []
+        qvec = to_unit_vector(patient_loc[0], patient_loc[1])
+
+        # Max-heap of the best k candidates, keyed on (-distance, -position).
+        best = []
+        frontier = [(self._lower_bound_miles(0, qvec), 0)]
+        while frontier:
+            bound, node_id = heapq.heappop(frontier)
+            if len(best) == k and bound > -best[0][0] + _PRUNE_SLACK_MILES:
+                break
+            left = self._left[node_id]
+            if left >= 0:
+                right = self._right[node_id]
+                heapq.heappush(frontier, (self._lower_bound_miles(left, qvec), left))
+                heapq.heappush(frontier, (self._lower_bound_miles(right, qvec), right))
+                continue
+            for position in self._order[self._start[node_id]:self._end[node_id]]:
+                if exclude is not None and position in exclude:
+                    continue
+                distance = haversine(patient_loc, self._locs[position], unit=Unit.MILES)
+                self.distance_evaluations += 1
+                entry = (-distance, -position)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        return sorted(((-d, -p) for d, p in best))
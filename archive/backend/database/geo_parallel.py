@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Sharded multiprocess nearest-site search for assign_providers_by_geo.py.
+
+Geocoded patients are partitioned by ZIP3 (the first three digits of their
+ZIP code) or by a one-degree latitude/longitude tile, and the shards are
+scored in a ``ProcessPoolExecutor``. Organization coordinates are copied once
+into a ``multiprocessing.shared_memory`` block that every worker maps, rather
+than being pickled into each task; only the patient coordinates of a shard
+travel with it.
+
+Nearest-site search is a pure per-patient function, so the merged result is
+identical for any worker count. Provider capacity is not touched here: the
+caller runs the capacity engine over the merged arrays in one process, in a
+fixed (distance, patient) order, which keeps assignments independent of how
+the search was split.
+"""
+
+import math
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from geo_distance import HAVE_NUMPY, nearest_orgs_numpy
+from geo_index import OrgBallTree, nearest_orgs_brute
+
+if HAVE_NUMPY:
+    import numpy as np
+
+SHARD_KEYS = ('zip3', 'tile')
+
+# Shards smaller than this are merged with their neighbours (in key order) so
+# that sparse ZIP3s do not each pay a task round trip.
+MIN_SHARD_PATIENTS = 5000
+
+# Per-worker state, set up once by _init_worker.
+_worker_state = {}
+
+
+# --- Sharding ---
+def shard_key(patients, i, shard_by):
+    """Returns the shard key of a geocoded patient."""
+    if shard_by == 'zip3':
+        patient_zip = patients.zip_at(i)
+        if patient_zip and len(patient_zip) >= 3:
+            return ('zip3', patient_zip[:3])
+    # Tiles also catch patients whose ZIP is missing or malformed.
+    return ('tile', '%d,%d' % (math.floor(patients.lat[i]), math.floor(patients.lon[i])))
+
+
+def build_shards(patients, shard_by, min_shard_patients=MIN_SHARD_PATIENTS):
+    """Groups geocoded patient indices into shards, ordered by shard key.
+
+    Returns a list of int64 index arrays. Adjacent small shards are combined
+    until each holds at least ``min_shard_patients`` patients.
+    """
+    by_key = defaultdict(lambda: array('q'))
+    for i in range(len(patients)):
+        if patients.has_location(i):
+            by_key[shard_key(patients, i, shard_by)].append(i)
+
+    shards = []
+    current = array('q')
+    for key in sorted(by_key):
+        current.extend(by_key[key])
+        if len(current) >= min_shard_patients:
+            shards.append(current)
+            current = array('q')
+    if current:
+        shards.append(current)
+    return shards
+
+
+# --- Shared org coordinates ---
+def share_org_coordinates(orgs_with_latlon):
+    """Copies org latitudes then longitudes into a new shared memory block."""
+    coords = array('d', (float(org['lat']) for org in orgs_with_latlon))
+    coords.extend(float(org['lon']) for org in orgs_with_latlon)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, coords.itemsize * len(coords)))
+    shm.buf[:coords.itemsize * len(coords)] = coords.tobytes()
+    return shm
+
+
+def _init_worker(shm_name, n_orgs, engine):
+    """Maps the shared org coordinates and builds the engine's per-worker state."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    coords = shm.buf.cast('d')
+    _worker_state['shm'] = shm
+    _worker_state['engine'] = engine
+    if engine == 'numpy':
+        flat = np.frombuffer(shm.buf, dtype=np.float64, count=2 * n_orgs)
+        _worker_state['org_lat'] = flat[:n_orgs]
+        _worker_state['org_lon'] = flat[n_orgs:]
+    else:
+        orgs = [{'id': p, 'lat': coords[p], 'lon': coords[n_orgs + p]} for p in range(n_orgs)]
+        _worker_state['orgs'] = orgs
+        if engine == 'balltree':
+            _worker_state['index'] = OrgBallTree(orgs)
+    coords.release()
+
+
+def _search_shard(shard_lat, shard_lon):
+    """Scores one shard in a worker.
+
+    Returns (positions, distances, evaluations): two arrays and the number of
+    patient-org distances computed.
+    """
+    engine = _worker_state['engine']
+    if engine == 'numpy':
+        n_orgs = len(_worker_state['org_lat'])
+        positions, distances = nearest_orgs_numpy(
+            shard_lat, shard_lon, _worker_state['org_lat'], _worker_state['org_lon']
+        )
+        return array('q', positions.tolist()), array('d', distances.tolist()), len(shard_lat) * n_orgs
+
+    positions = array('q')
+    distances = array('d')
+    evaluations_before = _worker_state['index'].distance_evaluations if engine == 'balltree' else 0
+    for loc in zip(shard_lat, shard_lon):
+        if engine == 'brute':
+            distance, position = nearest_orgs_brute(loc, _worker_state['orgs'])[0]
+        else:
+            distance, position = _worker_state['index'].nearest(loc)[0]
+        positions.append(position)
+        distances.append(distance)
+    if engine == 'brute':
+        evaluations = len(shard_lat) * len(_worker_state['orgs'])
+    else:
+        evaluations = _worker_state['index'].distance_evaluations - evaluations_before
+    return positions, distances, evaluations
+
+
+# --- Driver ---
+def compute_nearest_orgs_parallel(patients, orgs_with_latlon, engine, workers, shard_by='zip3', metrics=None):
+    """Parallel counterpart of ``compute_nearest_orgs``; same return value."""
+    nearest = array('q', [-1]) * len(patients)
+    distances = array('d', [math.inf]) * len(patients)
+    if not orgs_with_latlon:
+        return nearest, distances
+
+    shards = build_shards(patients, shard_by)
+    print(f"  {len(shards)} shards by {shard_by} across {workers} workers.")
+    shm = share_org_coordinates(orgs_with_latlon)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, len(orgs_with_latlon), engine)) as pool:
+            futures = [
+                pool.submit(_search_shard,
+                            array('d', (patients.lat[i] for i in shard)),
+                            array('d', (patients.lon[i] for i in shard)))
+                for shard in shards
+            ]
+            # Results are merged by patient index, so completion order does not matter.
+            for shard, future in zip(shards, futures):
+                positions, shard_distances, evaluations = future.result()
+                if metrics is not None:
+                    metrics.count('haversine_evaluations', evaluations)
+                for i, position, distance in zip(shard, positions, shard_distances):
+                    nearest[i] = position
+                    distances[i] = distance
+    finally:
+        shm.close()
+        shm.unlink()
+    return nearest, distances
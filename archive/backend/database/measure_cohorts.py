@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Shared cohort cache for the eCQM scripts in Measures/.
+
+Most measure scripts rebuild the same blocks inline: the measurement period,
+age at the end (or start) of the period, "had an active encounter during the
+period" and hospice status, each one another scan of patient, encounter and
+condition_diagnosis. This module computes them once per measurement period
+into phm_edw.measure_cohort (one row per patient and period, see SECTION E
+of phm-edw-ddl.sql), and scripts read them from there:
+
+    WITH measurement_period AS (
+        SELECT period_id, start_date, end_date
+        FROM phm_edw.cohort_period('2025-01-01', '2025-12-31')
+    ),
+    ...
+    FROM phm_edw.measure_cohort mc
+    JOIN measurement_period mp ON mp.period_id = mc.period_id
+    WHERE mc.age_at_end BETWEEN 18 AND 75 AND mc.encounter_count > 0
+
+Scripts that count encounters of any active_ind use mc.any_encounter_count.
+Filters on encounter_type or status, or on encounter_datetime::DATE rather
+than the timestamp, go through phm_edw.measure_cohort_encounter, which
+counts each patient's encounters in the period per type, status and
+active_ind:
+
+    AND (SELECT SUM(ce.encounter_day_count)
+         FROM phm_edw.measure_cohort_encounter ce
+         WHERE ce.period_id = mc.period_id AND ce.patient_id = mc.patient_id
+           AND ce.encounter_type IN ('OUTPATIENT', 'OFFICE_VISIT')) >= 2
+
+The first refresh of a period computes every patient. Later refreshes only
+recompute patients whose patient, encounter or condition_diagnosis rows,
+or the condition rows their diagnoses point at, changed since the previous
+refresh started (less WATERMARK_OVERLAP, as for the star ETL's watermarks),
+and drop patients that no longer exist.
+phm_edw.cohort_period raises when the period was never refreshed or those
+rows changed after the last refresh, so a script run on its own fails
+rather than reading an empty or stale cohort. measure_runner.py refreshes
+every period its scripts reference before it runs them; run this module
+directly to refresh by hand:
+
+    python measure_cohorts.py --period 2025-01-01:2025-12-31 [--full]
+"""
+
+import argparse
+import datetime
+import re
+import sys
+import time
+from typing import Iterable, List, NamedTuple, Set, Tuple
+
+try:
+    import psycopg2
+    from psycopg2 import sql
+except ImportError:
+    psycopg2 = None
+
+from etl_watermarks import WATERMARK_OVERLAP
+
+# A script's reference to a cached period, as in the module docstring.
+PERIOD_REFERENCE = re.compile(
+    r"phm_edw\.cohort_period\(\s*'(\d{4}-\d{2}-\d{2})'\s*,\s*'(\d{4}-\d{2}-\d{2})'\s*\)", re.IGNORECASE)
+
+# Patients whose cohort rows may have changed since %(since)s.
+CHANGED_PATIENTS_SQL = """
+CREATE TEMP TABLE cohort_changed ON COMMIT DROP AS
+SELECT patient_id FROM phm_edw.patient
+WHERE COALESCE(updated_date, created_date) >= %(since)s
+UNION
+SELECT patient_id FROM phm_edw.encounter
+WHERE COALESCE(updated_date, created_date) >= %(since)s
+UNION
+SELECT patient_id FROM phm_edw.condition_diagnosis
+WHERE COALESCE(updated_date, created_date) >= %(since)s
+UNION
+-- hospice_diagnosis matches on condition.condition_code
+SELECT cd.patient_id
+FROM phm_edw.condition_diagnosis cd
+JOIN phm_edw.condition c ON c.condition_id = cd.condition_id
+WHERE COALESCE(c.updated_date, c.created_date) >= %(since)s;
+"""
+
+# {patients} restricts each source to the patients being refreshed.
+COHORT_INSERT_SQL = """
+WITH mp AS (
+    SELECT period_id, start_date, end_date FROM phm_edw.measure_period WHERE period_id = %(period_id)s
+),
+encounters AS (
+    SELECT e.patient_id,
+           COUNT(*) FILTER (WHERE e.active_ind = 'Y') AS encounter_count,
+           COUNT(*) AS any_encounter_count,
+           MIN(e.encounter_datetime) FILTER (WHERE e.active_ind = 'Y') AS first_encounter,
+           MAX(e.encounter_datetime) FILTER (WHERE e.active_ind = 'Y') AS last_encounter
+    FROM phm_edw.encounter e
+    CROSS JOIN mp
+    WHERE e.encounter_datetime BETWEEN mp.start_date AND mp.end_date
+      AND {encounter_patients}
+    GROUP BY e.patient_id
+),
+hospice_diagnosis AS (
+    SELECT DISTINCT cd.patient_id
+    FROM phm_edw.condition_diagnosis cd
+    JOIN phm_edw.condition c ON cd.condition_id = c.condition_id
+    CROSS JOIN mp
+    WHERE c.condition_code = 'Z51.5'  -- Encounter for palliative care
+      AND cd.onset_date <= mp.end_date
+      AND (cd.resolution_date IS NULL OR cd.resolution_date >= mp.start_date)
+      AND {diagnosis_patients}
+),
+hospice_encounter AS (
+    SELECT DISTINCT e.patient_id
+    FROM phm_edw.encounter e
+    CROSS JOIN mp
+    WHERE e.encounter_type = 'HOSPICE'
+      AND e.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
+      AND {encounter_patients}
+)
+INSERT INTO phm_edw.measure_cohort (
+    period_id, patient_id, gender, date_of_birth, active_ind, age_at_start, age_at_end,
+    encounter_count, any_encounter_count, first_encounter, last_encounter,
+    hospice_diagnosis, hospice_encounter
+)
+SELECT mp.period_id,
+       p.patient_id,
+       p.gender,
+       p.date_of_birth,
+       p.active_ind,
+       DATE_PART('year', AGE(mp.start_date, p.date_of_birth)),
+       DATE_PART('year', AGE(mp.end_date, p.date_of_birth)),
+       COALESCE(enc.encounter_count, 0),
+       COALESCE(enc.any_encounter_count, 0),
+       enc.first_encounter,
+       enc.last_encounter,
+       hd.patient_id IS NOT NULL,
+       he.patient_id IS NOT NULL
+FROM phm_edw.patient p
+CROSS JOIN mp
+LEFT JOIN encounters enc ON enc.patient_id = p.patient_id
+LEFT JOIN hospice_diagnosis hd ON hd.patient_id = p.patient_id
+LEFT JOIN hospice_encounter he ON he.patient_id = p.patient_id
+WHERE {patients};
+"""
+
+# Runs after COHORT_INSERT_SQL, whose rows these reference. Stores every
+# combination seen on a day of the period (encounter_day_count > 0).
+COHORT_ENCOUNTER_INSERT_SQL = """
+WITH mp AS (
+    SELECT period_id, start_date, end_date FROM phm_edw.measure_period WHERE period_id = %(period_id)s
+)
+INSERT INTO phm_edw.measure_cohort_encounter (
+    period_id, patient_id, encounter_type, status, active_ind, encounter_count, encounter_day_count
+)
+SELECT mp.period_id,
+       e.patient_id,
+       e.encounter_type,
+       e.status,
+       e.active_ind,
+       COUNT(*) FILTER (WHERE e.encounter_datetime BETWEEN mp.start_date AND mp.end_date),
+       COUNT(*)
+FROM phm_edw.encounter e
+CROSS JOIN mp
+WHERE e.encounter_datetime::DATE BETWEEN mp.start_date AND mp.end_date
+  AND {encounter_patients}
+GROUP BY mp.period_id, e.patient_id, e.encounter_type, e.status, e.active_ind;
+"""
+
+
+class RefreshResult(NamedTuple):
+    period_id: int
+    start_date: datetime.date
+    end_date: datetime.date
+    full: bool
+    patients_refreshed: int      # Patients whose rows were recomputed
+    rows_removed: int            # Rows deleted for patients that no longer exist
+    seconds: float
+
+
+def periods_used(sql_texts: Iterable[str]) -> List[Tuple[datetime.date, datetime.date]]:
+    """Distinct measurement periods referenced through phm_edw.cohort_period, sorted."""
+    found: Set[Tuple[datetime.date, datetime.date]] = set()
+    for text in sql_texts:
+        for start, end in PERIOD_REFERENCE.findall(text):
+            found.add((datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)))
+    return sorted(found)
+
+
+def _patient_filter(column: str, full: bool):
+    if full:
+        return sql.SQL("TRUE")
+    return sql.SQL("{} IN (SELECT patient_id FROM cohort_changed)").format(sql.SQL(column))
+
+
+def refresh_period(conn, start_date: datetime.date, end_date: datetime.date,
+                   full: bool = False) -> RefreshResult:
+    """Brings the cohort of one period up to date in a single transaction and commits.
+
+    The period row is created on first use and locked for the refresh, so
+    concurrent refreshes of the same period run one after the other.
+    """
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO phm_edw.measure_period (start_date, end_date) VALUES (%s, %s)
+            ON CONFLICT (start_date, end_date) DO NOTHING;
+        """, (start_date, end_date))
+        cursor.execute("""
+            SELECT period_id, refreshed_through, LOCALTIMESTAMP
+            FROM phm_edw.measure_period
+            WHERE start_date = %s AND end_date = %s
+            FOR UPDATE;
+        """, (start_date, end_date))
+        period_id, refreshed_through, run_start = cursor.fetchone()
+        full = full or refreshed_through is None
+
+        rows_removed = 0
+        if full:
+            cursor.execute("DELETE FROM phm_edw.measure_cohort WHERE period_id = %s;", (period_id,))
+        else:
+            cursor.execute(CHANGED_PATIENTS_SQL, {'since': refreshed_through - WATERMARK_OVERLAP})
+            cursor.execute("ANALYZE cohort_changed;")
+            cursor.execute("""
+                DELETE FROM phm_edw.measure_cohort mc
+                USING cohort_changed ch
+                WHERE mc.period_id = %s AND mc.patient_id = ch.patient_id;
+            """, (period_id,))
+            cursor.execute("""
+                DELETE FROM phm_edw.measure_cohort mc
+                WHERE mc.period_id = %s
+                  AND NOT EXISTS (SELECT 1 FROM phm_edw.patient p WHERE p.patient_id = mc.patient_id);
+            """, (period_id,))
+            rows_removed = max(cursor.rowcount, 0)
+
+        cursor.execute(sql.SQL(COHORT_INSERT_SQL).format(
+            patients=_patient_filter('p.patient_id', full),
+            encounter_patients=_patient_filter('e.patient_id', full),
+            diagnosis_patients=_patient_filter('cd.patient_id', full),
+        ), {'period_id': period_id})
+        patients_refreshed = max(cursor.rowcount, 0)
+        cursor.execute(sql.SQL(COHORT_ENCOUNTER_INSERT_SQL).format(
+            encounter_patients=_patient_filter('e.patient_id', full),
+        ), {'period_id': period_id})
+        seconds = time.perf_counter() - started
+        cursor.execute("""
+            UPDATE phm_edw.measure_period
+            SET refreshed_through = %s, refresh_seconds = %s
+            WHERE period_id = %s;
+        """, (run_start, round(seconds, 3), period_id))
+        if full:
+            cursor.execute("ANALYZE phm_edw.measure_cohort;")
+            cursor.execute("ANALYZE phm_edw.measure_cohort_encounter;")
+    conn.commit()
+    return RefreshResult(period_id, start_date, end_date, full, patients_refreshed, rows_removed, seconds)
+
+
+def print_refresh(result: RefreshResult) -> None:
+    kind = "full" if result.full else "incremental"
+    removed = f", {result.rows_removed} removed" if result.rows_removed else ""
+    print(f"Cohort {result.start_date}..{result.end_date} (period {result.period_id}): {kind} refresh, "
+          f"{result.patients_refreshed} patients{removed} in {result.seconds:.3f}s")
+
+
+def parse_period(text: str) -> Tuple[datetime.date, datetime.date]:
+    """'2025-01-01:2025-12-31' -> (start, end)."""
+    try:
+        start, end = (datetime.date.fromisoformat(part) for part in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END as YYYY-MM-DD:YYYY-MM-DD, got {text!r}")
+    if end < start:
+        raise argparse.ArgumentTypeError(f"period {text} ends before it starts")
+    return start, end
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh the shared measure cohort cache (phm_edw.measure_cohort).")
+    parser.add_argument(
+        "--period",
+        type=parse_period,
+        action="append",
+        default=[],
+        metavar="START:END",
+        help="Measurement period to refresh, e.g. 2025-01-01:2025-12-31; repeatable. "
+             "Default: every period referenced by the Measures/ scripts."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Recompute every patient instead of only those changed since the last refresh."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    from measure_runner import connect_kwargs, discover_measures  # measure_runner imports this module
+    periods = args.period or periods_used(script.sql for script in discover_measures())
+    if not periods:
+        print("No measurement periods to refresh.")
+        return
+    try:
+        conn = psycopg2.connect(**connect_kwargs())
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+    try:
+        for start_date, end_date in periods:
+            print_refresh(refresh_period(conn, start_date, end_date, args.full))
+    except psycopg2.Error as e:
+        print(f"Error refreshing the cohort cache: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
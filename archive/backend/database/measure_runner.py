@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Runs the eCQM SQL library in Measures/ concurrently and stores the results.
+
+Each ``Measures/<code>.sql`` script starts with a summary query (a chain of
+CTEs ending in counts such as initial_population, denominator and
+numerator); statements after it are patient-detail or star-schema variants,
+some of which reference the first statement's CTEs, so only the summary
+runs. Measures run side by side on a connection pool, one transaction each,
+and their summary rows replace the measure's previous rows in
+phm_star.fact_measure_summary in the same transaction.
+
+The scripts name their counts differently (``numerator_count``,
+``denominator_after_exclusions``, ``excluded_count`` ...); ``normalize``
+maps them onto one set of columns. Scripts are matched to
+phm_star.dim_measure by measure_code, with or without the version suffix
+(CMS122v12 or CMS122), and their rows are stored under that
+measure_code, so they survive the star ETL reloading dim_measure.
+
+Scripts that read the shared cohort cache (measure_cohorts.py) name their
+measurement period; every such period is refreshed, incrementally, before
+the measures run. When any script tests value set membership
+(value_sets.py), the condition index is rebuilt first as well.
+
+With --care-gaps the scripts that have a patient-level statement are
+evaluated per patient instead, and only for the patients whose clinical
+rows changed since the measure's last run; their statuses open and close
+rows in phm_edw.care_gap (see care_gaps.py).
+
+    python measure_runner.py --workers 8
+    python measure_runner.py --measure CMS122v12 --measure CMS165v12 --dry-run
+    python measure_runner.py --care-gaps [--full]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    from dotenv import load_dotenv
+except ImportError:
+    psycopg2 = None
+
+import care_gaps
+import measure_cohorts
+import value_sets
+from etl_statements import split_sql
+
+# --- Configuration ---
+MEASURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Measures")
+DEFAULT_WORKERS = 4
+DEFAULT_STATEMENT_TIMEOUT = 600  # Seconds per measure; 0 disables
+APPLICATION_NAME = "measure_runner"
+
+Key = TypeVar('Key')
+
+# Normalized column -> script column names, in order of preference.
+COUNT_COLUMNS = {
+    'initial_population': ('initial_population', 'denominator_size'),
+    'denominator': ('denominator_after_exclusions', 'denominator_count', 'denominator'),
+    'numerator': ('numerator_after_exclusions', 'numerator_count', 'numerator'),
+    'exclusions': ('denominator_exclusions', 'excluded_count', 'exclusions'),
+    'exceptions': ('denominator_exceptions', 'exceptions'),
+    'performance_rate': ('performance_rate', 'percentage'),
+}
+
+
+class MeasureScript(NamedTuple):
+    code: str                    # File name without extension, e.g. 'CMS122v12'
+    path: str
+    sql: str                     # The summary statement
+    patient_sql: Optional[str]   # Per-patient query for care gaps (care_gaps.patient_query), if any
+
+
+class MeasureRow(NamedTuple):
+    population_group: str
+    initial_population: Optional[int]
+    denominator: Optional[int]
+    numerator: Optional[int]
+    exclusions: Optional[int]
+    exceptions: Optional[int]
+    performance_rate: Optional[Decimal]
+
+
+class MeasureResult(NamedTuple):
+    code: str
+    status: str                  # 'SUCCESS', 'FAILURE' or 'UNMATCHED' (no dim_measure row; not stored)
+    seconds: float
+    rows: Tuple[MeasureRow, ...]
+    error: Optional[str]
+
+
+# --- Database Connection ---
+def connect_kwargs() -> Dict[str, object]:
+    """Loads DB credentials from backend/.env, as assign_providers_by_geo.py does."""
+    dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+    if not os.path.exists(dotenv_path):
+        print(f"Error: .env file not found at expected location: {dotenv_path}")
+        sys.exit(1)
+    load_dotenv(dotenv_path=dotenv_path)
+    kwargs = dict(dbname=os.getenv("DB_DATABASE"), user=os.getenv("DB_USERNAME"),
+                  password=os.getenv("DB_PASSWORD"), host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"))
+    if not all(kwargs.values()):
+        print("Error: Database credentials missing in .env file.")
+        sys.exit(1)
+    return dict(kwargs, application_name=APPLICATION_NAME)
+
+# --- Measure Library ---
+def discover_measures(directory: str = MEASURES_DIR, only: Sequence[str] = ()) -> List[MeasureScript]:
+    """Reads every ``*.sql`` in ``directory`` (or just the codes in ``only``), sorted by code."""
+    scripts = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.sql"))):
+        code = os.path.splitext(os.path.basename(path))[0].strip()
+        if only and code not in only:
+            continue
+        with open(path, encoding='utf-8') as f:
+            statements = split_sql(f.read())
+        if statements:
+            scripts.append(MeasureScript(code, path, statements[0].sql, care_gaps.patient_query(statements)))
+    missing = set(only) - {script.code for script in scripts}
+    if missing:
+        raise ValueError(f"no measure script for {', '.join(sorted(missing))} in {directory}")
+    return scripts
+
+
+def _as_int(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def normalize(columns: Sequence[str], rows: Sequence[tuple]) -> List[MeasureRow]:
+    """Maps a summary query's result onto MeasureRow.
+
+    The population group is the first text column (e.g. population_group,
+    age_strata), 'Overall' when there is none. A script that reports
+    ``excluded_count`` and ``denominator_only_count`` instead of a
+    denominator gets initial_population - excluded_count.
+    """
+    index = {name: i for i, name in enumerate(columns)}
+    picked = {}
+    for field, candidates in COUNT_COLUMNS.items():
+        picked[field] = next((index[name] for name in candidates if name in index), None)
+    measures = []
+    for row in rows:
+        labels = [str(value) for value in row if isinstance(value, str)]
+        values = {field: (row[i] if i is not None else None) for field, i in picked.items()}
+        denominator = values['denominator']
+        if denominator is None and values['initial_population'] is not None and values['exclusions'] is not None:
+            denominator = values['initial_population'] - values['exclusions']
+        rate = values['performance_rate']
+        measures.append(MeasureRow(
+            " / ".join(labels) or 'Overall',
+            _as_int(values['initial_population']), _as_int(denominator), _as_int(values['numerator']),
+            _as_int(values['exclusions']), _as_int(values['exceptions']),
+            None if rate is None else Decimal(str(rate)),
+        ))
+    return measures
+
+
+def measure_codes(cursor) -> Dict[str, str]:
+    """dim_measure codes, each mapped to itself for match_measure."""
+    cursor.execute("SELECT measure_code, measure_code FROM phm_star.dim_measure;")
+    return dict(cursor.fetchall())
+
+
+def match_measure(code: str, keys: Dict[str, Key]) -> Optional[Key]:
+    """'CMS122v12' matches dim_measure code 'CMS122v12', else 'CMS122'."""
+    return keys.get(code, keys.get(code.split('v')[0]))
+
+# --- Runner ---
+def refresh_shared_caches(conn, sql_texts: Sequence[str]) -> None:
+    """Refreshes the cohort cache periods and the value set membership the given queries read."""
+    for start_date, end_date in measure_cohorts.periods_used(sql_texts):
+        measure_cohorts.print_refresh(measure_cohorts.refresh_period(conn, start_date, end_date))
+    if any(value_sets.MEMBERSHIP_TABLE in text for text in sql_texts):
+        value_sets.print_membership(*value_sets.rebuild_membership(conn))
+
+
+def run_measure(pool, script: MeasureScript, measure_code: Optional[str], write: bool,
+                statement_timeout: float) -> MeasureResult:
+    """Evaluates one measure on a pooled connection and, with ``write``, replaces its stored rows."""
+    start = time.perf_counter()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(statement_timeout * 1000),))
+            cursor.execute(script.sql)
+            if cursor.description is None:
+                raise ValueError("the first statement returns no rows")
+            rows = normalize([column[0] for column in cursor.description], cursor.fetchall())
+            seconds = time.perf_counter() - start
+            if write and measure_code is not None:
+                cursor.execute("DELETE FROM phm_star.fact_measure_summary WHERE measure_code = %s;", (measure_code,))
+                cursor.executemany("""
+                    INSERT INTO phm_star.fact_measure_summary
+                        (measure_code, population_group, initial_population, denominator, numerator,
+                         exclusions, exceptions, performance_rate, run_seconds)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+                """, [(measure_code,) + tuple(row) + (round(seconds, 3),) for row in rows])
+        conn.commit()
+        status = 'SUCCESS' if measure_code is not None else 'UNMATCHED'
+        return MeasureResult(script.code, status, time.perf_counter() - start, tuple(rows), None)
+    except (psycopg2.Error, ValueError) as e:
+        conn.rollback()
+        return MeasureResult(script.code, 'FAILURE', time.perf_counter() - start, (), care_gaps.error_summary(e))
+    finally:
+        pool.putconn(conn)
+
+
+def run_measures(kwargs: Dict[str, object], scripts: Sequence[MeasureScript], workers: int,
+                 write: bool = True, statement_timeout: float = DEFAULT_STATEMENT_TIMEOUT,
+                 refresh_caches: bool = True) -> List[MeasureResult]:
+    """Runs ``scripts`` on up to ``workers`` connections; returns results in completion order.
+
+    With ``refresh_caches`` the cohort cache of every period the scripts
+    reference, and the value set membership index if they use it, are
+    brought up to date first. A failing measure is rolled back and
+    reported; the others still run.
+    """
+    print_lock = threading.Lock()
+    pool = psycopg2.pool.ThreadedConnectionPool(1, workers, **kwargs)
+    try:
+        conn = pool.getconn()
+        try:
+            if refresh_caches:
+                refresh_shared_caches(conn, [script.sql for script in scripts])
+            with conn.cursor() as cursor:
+                codes = measure_codes(cursor)
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_measure, pool, script, match_measure(script.code, codes), write,
+                                       statement_timeout)
+                       for script in scripts]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                with print_lock:
+                    print_result(result)
+    finally:
+        pool.closeall()
+    return results
+
+def run_care_gap_measure(pool, script: MeasureScript, measure_id: Optional[int], tables: Sequence[str],
+                         full: bool, statement_timeout: float) -> care_gaps.CareGapResult:
+    """Re-evaluates one measure's changed patients on a pooled connection and updates their care gaps."""
+    if measure_id is None:
+        return care_gaps.CareGapResult(script.code, 'UNMATCHED', 0.0, full, None, 0, 0, 0, None)
+    conn = pool.getconn()
+    try:
+        return care_gaps.evaluate(conn, script.code, script.patient_sql, measure_id, tables, full, statement_timeout)
+    finally:
+        pool.putconn(conn)
+
+
+def run_care_gaps(kwargs: Dict[str, object], scripts: Sequence[MeasureScript], workers: int, full: bool = False,
+                  statement_timeout: float = DEFAULT_STATEMENT_TIMEOUT,
+                  refresh_caches: bool = True) -> List[care_gaps.CareGapResult]:
+    """Runs the per-patient queries of ``scripts`` (those with one) on up to ``workers`` connections."""
+    print_lock = threading.Lock()
+    pool = psycopg2.pool.ThreadedConnectionPool(1, workers, **kwargs)
+    try:
+        conn = pool.getconn()
+        try:
+            if refresh_caches:
+                refresh_shared_caches(conn, [script.patient_sql for script in scripts])
+            with conn.cursor() as cursor:
+                ids = care_gaps.measure_ids(cursor)
+                tables = care_gaps.patient_tables(cursor)
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_care_gap_measure, pool, script, match_measure(script.code, ids), tables,
+                                       full, statement_timeout)
+                       for script in scripts]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                with print_lock:
+                    care_gaps.print_care_gap_result(result)
+    finally:
+        pool.closeall()
+    return results
+
+# --- Reporting ---
+def print_result(result: MeasureResult) -> None:
+    if result.status == 'FAILURE':
+        print(f"[{result.seconds:8.3f}s] ERROR {result.code}: {result.error}")
+        return
+    note = "  (no dim_measure row, not stored)" if result.status == 'UNMATCHED' else ""
+    print(f"[{result.seconds:8.3f}s] {result.code}{note}")
+    for row in result.rows:
+        counts = "  ".join(f"{label} {'-' if value is None else value:>7}" for label, value in
+                           (("IPP", row.initial_population), ("DEN", row.denominator), ("NUM", row.numerator)))
+        rate = "-" if row.performance_rate is None else f"{row.performance_rate}%"
+        print(f"             {row.population_group[:40]:<40} {counts}  {rate}")
+
+
+def print_summary(results: Sequence, elapsed: float, workers: int, measure_table: str = 'dim_measure') -> None:
+    serial = sum(result.seconds for result in results)
+    failed = [result for result in results if result.status == 'FAILURE']
+    unmatched = [result.code for result in results if result.status == 'UNMATCHED']
+    print("-" * 40)
+    print(f"{len(results)} measures in {elapsed:.3f}s on {workers} connections "
+          f"({serial:.3f}s of measure time).")
+    print("Slowest measures:")
+    for result in sorted(results, key=lambda r: r.seconds, reverse=True)[:5]:
+        print(f"  {result.seconds:8.3f}s  {result.code}")
+    if unmatched:
+        print(f"Not stored, no {measure_table} row: {', '.join(sorted(unmatched))}")
+    if failed:
+        print(f"{len(failed)} measures failed:")
+        for result in sorted(failed, key=lambda r: r.code):
+            print(f"  {result.code}: {result.error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the Measures/ eCQM scripts concurrently and store their counts in "
+                    "phm_star.fact_measure_summary."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Measures evaluated at once, one connection each (default {DEFAULT_WORKERS})."
+    )
+    parser.add_argument(
+        "--measure",
+        action="append",
+        default=[],
+        metavar="CODE",
+        help="Run only this measure (file name without .sql, e.g. CMS122v12); repeatable."
+    )
+    parser.add_argument(
+        "--measures-dir",
+        default=MEASURES_DIR,
+        help=f"Directory of measure scripts (default {MEASURES_DIR})."
+    )
+    parser.add_argument(
+        "--statement-timeout",
+        type=float,
+        default=DEFAULT_STATEMENT_TIMEOUT,
+        metavar="SECONDS",
+        help=f"Cancel a measure that runs longer than this (default {DEFAULT_STATEMENT_TIMEOUT}; 0 disables)."
+    )
+    parser.add_argument(
+        "--no-cache-refresh",
+        action="store_true",
+        help="Use the cohort cache and value set membership as they are instead of refreshing them first "
+             "(scripts that read an out-of-date cohort period fail)."
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Evaluate and report the measures without writing fact_measure_summary."
+    )
+    parser.add_argument(
+        "--care-gaps",
+        action="store_true",
+        help="Re-evaluate the patients changed since each measure's last run and update phm_edw.care_gap "
+             "instead of the summary counts."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="With --care-gaps, re-evaluate every patient instead of only the changed ones."
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.statement_timeout < 0:
+        parser.error("--statement-timeout cannot be negative")
+    if args.care_gaps and args.dry_run:
+        parser.error("--dry-run cannot be combined with --care-gaps")
+    if args.full and not args.care_gaps:
+        parser.error("--full only applies with --care-gaps")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    try:
+        scripts = discover_measures(args.measures_dir, args.measure)
+    except (OSError, ValueError) as e:
+        print(f"Error reading measure scripts: {e}")
+        sys.exit(1)
+    if args.care_gaps:
+        skipped = [script.code for script in scripts if script.patient_sql is None]
+        scripts = [script for script in scripts if script.patient_sql is not None]
+        if skipped:
+            print(f"No patient-level statement, skipped: {', '.join(skipped)}")
+    if not scripts:
+        print(f"No measure scripts found in {args.measures_dir}.")
+        sys.exit(1)
+
+    workers = min(args.workers, len(scripts))
+    mode = " (dry run)" if args.dry_run else " (care gaps, all patients)" if args.full else \
+        " (care gaps, changed patients)" if args.care_gaps else ""
+    print(f"Running {len(scripts)} measures on {workers} connections{mode}")
+    print("-" * 40)
+    start = time.perf_counter()
+    try:
+        if args.care_gaps:
+            results = run_care_gaps(connect_kwargs(), scripts, workers, args.full, args.statement_timeout,
+                                    not args.no_cache_refresh)
+        else:
+            results = run_measures(connect_kwargs(), scripts, workers, not args.dry_run, args.statement_timeout,
+                                   not args.no_cache_refresh)
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+    print_summary(results, time.perf_counter() - start, workers,
+                  'measure_definition' if args.care_gaps else 'dim_measure')
+    sys.exit(1 if any(result.status == 'FAILURE' for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
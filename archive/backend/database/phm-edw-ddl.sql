@@ -735,6 +735,268 @@ CREATE TABLE phm_edw.code_crosswalk (
 COMMENT ON TABLE phm_edw.code_crosswalk
   IS 'Generic reference for mapping codes between systems (ICD-9, ICD-10, SNOMED, etc.).';
 
+
+-- *********************************************************************
+-- SECTION D: ETL SUPPORT INDEXES
+-- *********************************************************************
+
+-- ---------------------------------------------------------------------
+-- D1. Change-date indexes
+-- The star ETL loads facts incrementally from rows whose
+-- COALESCE(updated_date, created_date) is past the last watermark
+-- (see etl_watermarks.py); these keep that predicate an index range scan.
+-- ---------------------------------------------------------------------
+CREATE INDEX idx_encounter_changed           ON phm_edw.encounter           ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_condition_diagnosis_changed ON phm_edw.condition_diagnosis ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_procedure_performed_changed ON phm_edw.procedure_performed ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_medication_order_changed    ON phm_edw.medication_order    ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_observation_changed         ON phm_edw.observation         ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_care_gap_changed            ON phm_edw.care_gap            ((COALESCE(updated_date, created_date)));
+CREATE INDEX idx_patient_changed             ON phm_edw.patient             ((COALESCE(updated_date, created_date)));
+-- zip_centroids.py fingerprints phm_edw.address by its latest change on every start
+CREATE INDEX idx_address_changed             ON phm_edw.address             ((COALESCE(updated_date, created_date)));
+
+-- ---------------------------------------------------------------------
+-- D2. ETL_Log lookups (checkpoints and watermarks by source_system)
+-- ---------------------------------------------------------------------
+CREATE INDEX idx_etl_log_source ON phm_edw.etl_log (source_system, load_start_timestamp);
+
+-- ---------------------------------------------------------------------
+-- D3. ETL_Pending_Index
+-- Fact indexes dropped by etl_monitor.py --full-rebuild and not yet
+-- recreated (see etl_full_load.py). A row is written with the DROP INDEX
+-- and deleted with the CREATE INDEX, so an interrupted rebuild can finish.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.etl_pending_index (
+    index_name         VARCHAR(200)  PRIMARY KEY,   -- Qualified, e.g. phm_star.idx_fact_encounter_patient
+    table_name         VARCHAR(200)  NOT NULL,
+    index_definition   TEXT          NOT NULL,      -- pg_get_indexdef() output
+    dropped_date       TIMESTAMP     NOT NULL DEFAULT NOW()
+);
+COMMENT ON TABLE phm_edw.etl_pending_index
+  IS 'Star fact indexes dropped by a full rebuild and still to be recreated.';
+
+-- *********************************************************************
+-- SECTION E: MEASURE EVALUATION CACHE
+-- *********************************************************************
+
+-- ---------------------------------------------------------------------
+-- E1. Measure_Period
+-- One row per measurement period the cohort cache is kept for. Maintained
+-- by measure_cohorts.py; refreshed_through is the database time the last
+-- refresh started, the watermark for the next incremental refresh.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.measure_period (
+    period_id          SERIAL        PRIMARY KEY,
+    start_date         DATE          NOT NULL,
+    end_date           DATE          NOT NULL,
+    refreshed_through  TIMESTAMP     NULL,
+    refresh_seconds    DECIMAL(10,3) NULL,
+    created_date       TIMESTAMP     NOT NULL DEFAULT NOW(),
+
+    CONSTRAINT uq_measure_period UNIQUE (start_date, end_date)
+);
+COMMENT ON TABLE phm_edw.measure_period
+  IS 'Measurement periods for which measure_cohort is cached (see measure_cohorts.py).';
+
+-- ---------------------------------------------------------------------
+-- E2. Measure_Cohort
+-- The building blocks the Measures/ scripts share, one row per patient and
+-- period: age at the period bounds, encounters in the period (active only,
+-- and of any active_ind) and the two hospice definitions the scripts use.
+-- Encounter filters by type or status read measure_cohort_encounter (E3).
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.measure_cohort (
+    period_id            INT           NOT NULL,
+    patient_id           INT           NOT NULL,
+    gender               VARCHAR(50)   NULL,
+    date_of_birth        DATE          NOT NULL,
+    active_ind           CHAR(1)       NOT NULL,   -- patient.active_ind
+    age_at_start         INT           NOT NULL,   -- DATE_PART('year', AGE(start_date, date_of_birth))
+    age_at_end           INT           NOT NULL,   -- DATE_PART('year', AGE(end_date, date_of_birth))
+    encounter_count      INT           NOT NULL,   -- Active encounters with encounter_datetime BETWEEN start_date AND end_date
+    any_encounter_count  INT           NOT NULL,   -- The same, whatever the encounter's active_ind
+    first_encounter      TIMESTAMP     NULL,
+    last_encounter       TIMESTAMP     NULL,
+    hospice_diagnosis    BOOLEAN       NOT NULL,   -- Z51.5 diagnosis overlapping the period
+    hospice_encounter    BOOLEAN       NOT NULL,   -- HOSPICE encounter on a day in the period
+
+    CONSTRAINT pk_measure_cohort PRIMARY KEY (period_id, patient_id),
+
+    CONSTRAINT fk_cohort_period
+        FOREIGN KEY (period_id)
+        REFERENCES phm_edw.measure_period(period_id)
+        ON DELETE CASCADE
+);
+CREATE INDEX idx_measure_cohort_age ON phm_edw.measure_cohort (period_id, age_at_end) WHERE encounter_count > 0;
+CREATE INDEX idx_measure_cohort_hospice ON phm_edw.measure_cohort (period_id, patient_id)
+    WHERE hospice_diagnosis OR hospice_encounter;
+COMMENT ON TABLE phm_edw.measure_cohort
+  IS 'Per-period patient cohorts shared by the measure scripts; refreshed incrementally by measure_cohorts.py.';
+
+-- ---------------------------------------------------------------------
+-- E3. Measure_Cohort_Encounter
+-- A cohort row's encounters in the period, counted per encounter_type,
+-- status and active_ind, for scripts that filter on those, e.g. "two
+-- OUTPATIENT or OFFICE_VISIT encounters". encounter_count uses the same
+-- timestamp comparison as measure_cohort; encounter_day_count compares
+-- encounter_datetime::DATE, so it also counts encounters later on the
+-- period's last day. Only combinations with encounter_day_count > 0 are
+-- stored. The rows go when their measure_cohort row is deleted.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.measure_cohort_encounter (
+    period_id            INT           NOT NULL,
+    patient_id           INT           NOT NULL,
+    encounter_type       VARCHAR(50)   NULL,
+    status               VARCHAR(50)   NULL,
+    active_ind           CHAR(1)       NOT NULL,
+    encounter_count      INT           NOT NULL,   -- encounter_datetime BETWEEN start_date AND end_date
+    encounter_day_count  INT           NOT NULL,   -- encounter_datetime::DATE BETWEEN start_date AND end_date
+
+    CONSTRAINT fk_cohort_encounter_cohort
+        FOREIGN KEY (period_id, patient_id)
+        REFERENCES phm_edw.measure_cohort(period_id, patient_id)
+        ON DELETE CASCADE
+);
+CREATE INDEX idx_measure_cohort_encounter ON phm_edw.measure_cohort_encounter (period_id, patient_id, encounter_type);
+COMMENT ON TABLE phm_edw.measure_cohort_encounter
+  IS 'Per-period encounter counts by type, status and active_ind for the cohorts in measure_cohort.';
+
+-- ---------------------------------------------------------------------
+-- E4. Cohort_Period
+-- How the measure scripts look up a cached period. Raises instead of
+-- letting a script read an empty or stale cohort: when the period was
+-- never refreshed, or when patient, encounter, condition_diagnosis or
+-- condition rows changed after its last refresh started. Refresh with
+-- measure_cohorts.py, or run the scripts through measure_runner.py, which
+-- refreshes first.
+-- ---------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION phm_edw.cohort_period(p_start_date DATE, p_end_date DATE)
+RETURNS TABLE (period_id INT, start_date DATE, end_date DATE)
+LANGUAGE plpgsql STABLE ROWS 1 AS $$
+DECLARE
+    v_period_id INT;
+    v_refreshed_through TIMESTAMP;
+BEGIN
+    SELECT mp.period_id, mp.refreshed_through
+    INTO v_period_id, v_refreshed_through
+    FROM phm_edw.measure_period mp
+    WHERE mp.start_date = p_start_date AND mp.end_date = p_end_date;
+
+    IF v_refreshed_through IS NULL THEN
+        RAISE EXCEPTION 'measure cohort for % to % has never been refreshed', p_start_date, p_end_date
+            USING HINT = 'Run measure_cohorts.py --period START:END, or run the measure through measure_runner.py.';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM phm_edw.patient p WHERE COALESCE(p.updated_date, p.created_date) >= v_refreshed_through)
+       OR EXISTS (SELECT 1 FROM phm_edw.encounter e WHERE COALESCE(e.updated_date, e.created_date) >= v_refreshed_through)
+       OR EXISTS (SELECT 1 FROM phm_edw.condition_diagnosis cd WHERE COALESCE(cd.updated_date, cd.created_date) >= v_refreshed_through)
+       OR EXISTS (SELECT 1 FROM phm_edw.condition c WHERE COALESCE(c.updated_date, c.created_date) >= v_refreshed_through)
+    THEN
+        RAISE EXCEPTION 'measure cohort for % to % is out of date (EDW rows changed after its refresh at %)',
+                        p_start_date, p_end_date, v_refreshed_through
+            USING HINT = 'Run measure_cohorts.py --period START:END, or run the measure through measure_runner.py.';
+    END IF;
+
+    RETURN QUERY SELECT v_period_id, p_start_date, p_end_date;
+END;
+$$;
+
+-- *********************************************************************
+-- SECTION F: VALUE SETS
+-- *********************************************************************
+
+-- ---------------------------------------------------------------------
+-- F1. Value_Set
+-- Named code lists the measure scripts test membership in (e.g. "Diabetes
+-- Type 2"), loaded from value_sets.csv by value_sets.py.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.value_set (
+    value_set_id       SERIAL        PRIMARY KEY,
+    value_set_name     VARCHAR(200)  NOT NULL,
+    created_date       TIMESTAMP     NOT NULL DEFAULT NOW(),
+    updated_date       TIMESTAMP     NULL,
+
+    CONSTRAINT uq_value_set_name UNIQUE (value_set_name)
+);
+COMMENT ON TABLE phm_edw.value_set
+  IS 'Named measure value sets (see value_sets.py).';
+
+-- ---------------------------------------------------------------------
+-- F2. Value_Set_Code
+-- The codes of a value set. A PREFIX entry stands for every code that
+-- starts with it, as LIKE 'E11%' did in the scripts.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.value_set_code (
+    value_set_id       INT           NOT NULL,
+    code_system        VARCHAR(50)   NOT NULL,   -- ICD-10, ICD-9, SNOMED, LOINC, CPT, ...; '*' = any
+    code               VARCHAR(50)   NOT NULL,
+    match_type         VARCHAR(10)   NOT NULL DEFAULT 'EXACT'
+                                     CHECK (match_type IN ('EXACT', 'PREFIX')),
+    description        VARCHAR(255)  NULL,
+
+    CONSTRAINT pk_value_set_code PRIMARY KEY (value_set_id, code_system, code, match_type),
+
+    CONSTRAINT fk_vscode_value_set
+        FOREIGN KEY (value_set_id)
+        REFERENCES phm_edw.value_set(value_set_id)
+        ON DELETE CASCADE
+);
+CREATE INDEX idx_value_set_code_lookup ON phm_edw.value_set_code (code_system, code);
+COMMENT ON TABLE phm_edw.value_set_code
+  IS 'Codes (exact or prefix) making up each value set.';
+
+-- ---------------------------------------------------------------------
+-- F3. Condition_Value_Set
+-- Precomputed membership of phm_edw.condition rows in each value set:
+-- direct matches plus conditions whose code maps onto a member through
+-- phm_edw.code_crosswalk (via_crosswalk). Rebuilt by value_sets.py, so
+-- scripts test membership with an indexed semi-join instead of LIKE.
+-- ---------------------------------------------------------------------
+CREATE TABLE phm_edw.condition_value_set (
+    value_set_id       INT           NOT NULL,
+    condition_id       INT           NOT NULL,
+    via_crosswalk      BOOLEAN       NOT NULL,   -- Member only through a crosswalk mapping
+
+    CONSTRAINT pk_condition_value_set PRIMARY KEY (value_set_id, condition_id),
+
+    CONSTRAINT fk_cvs_value_set
+        FOREIGN KEY (value_set_id)
+        REFERENCES phm_edw.value_set(value_set_id)
+        ON DELETE CASCADE,
+
+    CONSTRAINT fk_cvs_condition
+        FOREIGN KEY (condition_id)
+        REFERENCES phm_edw.condition(condition_id)
+        ON DELETE CASCADE
+);
+CREATE INDEX idx_condition_value_set_condition ON phm_edw.condition_value_set (condition_id);
+CREATE INDEX idx_condition_diagnosis_condition ON phm_edw.condition_diagnosis (condition_id, patient_id);
+COMMENT ON TABLE phm_edw.condition_value_set
+  IS 'Condition -> value set membership, expanded through code_crosswalk (see value_sets.py).';
+
+-- *********************************************************************
+-- SECTION G: INCREMENTAL CARE GAP EVALUATION
+-- *********************************************************************
+
+-- ---------------------------------------------------------------------
+-- G1. Care gap upserts
+-- care_gaps.py keeps one active care_gap row per patient and measure,
+-- opened and closed in place as the patient's measure status changes.
+-- ---------------------------------------------------------------------
+CREATE UNIQUE INDEX uq_care_gap_active ON phm_edw.care_gap (patient_id, measure_id) WHERE active_ind = 'Y';
+
+-- ---------------------------------------------------------------------
+-- G2. Per-patient lookups
+-- Incremental evaluation restricts each clinical table to the changed
+-- patients; these keep that an index lookup instead of a full scan.
+-- ---------------------------------------------------------------------
+CREATE INDEX idx_encounter_patient           ON phm_edw.encounter           (patient_id);
+CREATE INDEX idx_condition_diagnosis_patient ON phm_edw.condition_diagnosis (patient_id);
+CREATE INDEX idx_procedure_performed_patient ON phm_edw.procedure_performed (patient_id);
+CREATE INDEX idx_medication_order_patient    ON phm_edw.medication_order    (patient_id);
+CREATE INDEX idx_observation_patient         ON phm_edw.observation         (patient_id);
+
 -- =====================================================================
 -- End of DDL.sql
 -- =====================================================================
@@ -460,6 +460,44 @@ COMMENT ON TABLE phm_star.fact_measure_result
   IS 'Optional table to store periodic snapshots or computed measure results (e.g., monthly eCQM).';
 
 
+-- 3.8 FactMeasureSummary
+-- Written by measure_runner.py: the summary counts of each Measures/*.sql
+-- script, one row per population group (stratum) the script reports.
+-- Keyed by dim_measure.measure_code rather than measure_key, with no
+-- foreign key: the star ETL reloads dim_measure on every run (TRUNCATE ...
+-- CASCADE or a shadow swap), which would empty this table or renumber it.
+CREATE TABLE phm_star.fact_measure_summary (
+    measure_summary_key BIGSERIAL      PRIMARY KEY,
+    measure_code        VARCHAR(50)    NOT NULL,   -- dim_measure.measure_code, e.g. 'CMS122v12'
+    population_group    VARCHAR(255)   NOT NULL,   -- e.g. 'Overall', 'Age 50-75'
+    initial_population  INT            NULL,
+    denominator         INT            NULL,
+    numerator           INT            NULL,
+    exclusions          INT            NULL,
+    exceptions          INT            NULL,
+    performance_rate    DECIMAL(7,2)   NULL,       -- Percent, as reported by the script
+    run_seconds         DECIMAL(10,3)  NOT NULL,
+    computed_at         TIMESTAMP      NOT NULL DEFAULT NOW()
+);
+CREATE INDEX idx_fact_measure_summary_code ON phm_star.fact_measure_summary (measure_code);
+COMMENT ON TABLE phm_star.fact_measure_summary
+  IS 'Latest population counts per measure and stratum from the measure SQL library (measure_runner.py).';
+
+
+
+-- ---------------------------------------------------------------------
+-- 4. Fact Lookup Indexes
+-- Serve the NOT EXISTS checks of the incremental fact loads in
+-- ETL_edw_to_star.sql. They back no constraint, so etl_monitor.py
+-- --full-rebuild drops them before a full load and rebuilds them after.
+-- ---------------------------------------------------------------------
+CREATE INDEX idx_fact_encounter_encounter_id  ON phm_star.fact_encounter        (encounter_id);
+CREATE INDEX idx_fact_diagnosis_lookup        ON phm_star.fact_diagnosis        (encounter_key, condition_key, patient_key);
+CREATE INDEX idx_fact_procedure_lookup        ON phm_star.fact_procedure        (patient_key, procedure_key, date_key_procedure);
+CREATE INDEX idx_fact_medication_order_lookup ON phm_star.fact_medication_order (patient_key, medication_key, date_key_start);
+CREATE INDEX idx_fact_observation_lookup      ON phm_star.fact_observation      (patient_key, observation_code, date_key_obs);
+CREATE INDEX idx_fact_care_gap_lookup         ON phm_star.fact_care_gap         (patient_key, measure_key, date_key_identified);
+
 -- =====================================================================
 -- End of Comprehensive Kimball DDL for PHM
 -- =====================================================================
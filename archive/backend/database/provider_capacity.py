@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Capacity-aware provider assignment for assign_providers_by_geo.py.
+
+Each patient goes to the nearest organization that still has an active
+provider under ``MAX_PATIENTS_PER_PROVIDER``, and within that organization to
+its least-loaded provider. Every organization keeps a min-heap of
+``(load, provider_id)`` for providers with free capacity, so choosing a
+provider is a heap pop/push (O(log P)). Providers that reach the cap are
+dropped from their heap instead of being pushed back, so full providers are
+never rescanned.
+
+An organization whose heap empties is marked full and excluded from later
+nearest-site searches. Patients whose nearby sites are all full fall back to
+a global least-loaded heap over every provider, which also serves providers
+not linked to an organization.
+"""
+
+import heapq
+from collections import defaultdict
+
+from geo_index import OrgBallTree
+
+
+class CapacityAssigner:
+    """Greedy capacitated nearest-site assignment.
+
+    ``providers`` is a list of ``(provider_id, org_id)`` pairs (org_id may be
+    None). ``orgs_with_latlon`` is the geocoded org list whose positions the
+    nearest-site phase reports. ``initial_load`` seeds provider panel sizes,
+    e.g. from existing assignments.
+
+    Both heaps use lazy deletion: an entry whose load no longer matches the
+    provider's current load is refreshed when it reaches the top, and entries
+    for full providers are discarded there. Each load change leaves at most
+    one stale entry behind, so selection stays O(log P) amortized.
+    """
+
+    def __init__(self, providers, orgs_with_latlon, capacity, initial_load=None):
+        self.capacity = capacity
+        self.orgs = orgs_with_latlon
+        self.load = defaultdict(int)
+        if initial_load:
+            self.load.update(initial_load)
+
+        self._org_heaps = defaultdict(list)
+        self._global_heap = []
+        for provider_id, org_id in providers:
+            if self.load[provider_id] >= capacity:
+                continue
+            entry = (self.load[provider_id], provider_id)
+            if org_id is not None:
+                self._org_heaps[org_id].append(entry)
+            self._global_heap.append(entry)
+        for heap in self._org_heaps.values():
+            heapq.heapify(heap)
+        heapq.heapify(self._global_heap)
+
+        # Geocoded orgs that cannot take more patients (no providers, or all full)
+        self._position_by_org = {org['id']: position for position, org in enumerate(orgs_with_latlon)}
+        self._full_positions = set(
+            position for position, org in enumerate(orgs_with_latlon)
+            if not self._org_heaps.get(org['id'])
+        )
+
+        # Ball tree over the sites that were open when it was last built
+        self._open_index = None
+        self._open_positions = None
+        self._open_filter = None
+        self._full_at_rebuild = 0
+
+        # Counters for reporting
+        self.heap_operations = 0
+        self.provider_probes = 0
+        self.fallback_assignments = 0
+        self.distance_evaluations = 0
+
+    # --- Provider selection ---
+    def _take(self, heap):
+        """Pops the least-loaded provider with free capacity from a heap, or None."""
+        while heap:
+            load, provider_id = heapq.heappop(heap)
+            self.heap_operations += 1
+            self.provider_probes += 1
+            current = self.load[provider_id]
+            if current >= self.capacity:
+                continue  # Filled up through another heap since this entry was pushed
+            if current != load:
+                heapq.heappush(heap, (current, provider_id))
+                self.heap_operations += 1
+                continue
+            self.load[provider_id] = current + 1
+            if current + 1 < self.capacity:
+                heapq.heappush(heap, (current + 1, provider_id))
+                self.heap_operations += 1
+            return provider_id
+        return None
+
+    def _take_from_org(self, org_id):
+        heap = self._org_heaps.get(org_id)
+        provider_id = self._take(heap) if heap else None
+        if not heap and org_id in self._position_by_org:
+            self._full_positions.add(self._position_by_org[org_id])
+        return provider_id
+
+    def _take_from_global(self):
+        provider_id = self._take(self._global_heap)
+        if provider_id is not None:
+            self.fallback_assignments += 1
+        return provider_id
+
+    # --- Nearest open site ---
+    def _nearest_open_position(self, patient_loc):
+        """Nearest geocoded org with free capacity, or None when every site is full."""
+        if len(self._full_positions) >= len(self.orgs):
+            return None
+        # Rebuild over the still-open sites once half of the indexed ones have
+        # filled, so searches stop wading through excluded leaves.
+        if (self._open_index is None
+                or len(self._full_positions) - self._full_at_rebuild > len(self._open_positions) // 2):
+            self._open_positions = [p for p in range(len(self.orgs)) if p not in self._full_positions]
+            self._open_index = OrgBallTree([self.orgs[p] for p in self._open_positions])
+            self._open_filter = _PositionFilter(self._open_positions, self._full_positions)
+            self._full_at_rebuild = len(self._full_positions)
+        evaluations_before = self._open_index.distance_evaluations
+        matches = self._open_index.nearest(patient_loc, k=1, exclude=self._open_filter)
+        self.distance_evaluations += self._open_index.distance_evaluations - evaluations_before
+        return self._open_positions[matches[0][1]] if matches else None
+
+    def assign_near(self, patient_loc, nearest_position=-1):
+        """Assigns a geocoded patient; ``nearest_position`` may come from the nearest-site phase."""
+        if nearest_position >= 0 and nearest_position not in self._full_positions:
+            provider_id = self._take_from_org(self.orgs[nearest_position]['id'])
+            if provider_id is not None:
+                return provider_id
+        while True:
+            position = self._nearest_open_position(patient_loc)
+            if position is None:
+                return self._take_from_global()
+            provider_id = self._take_from_org(self.orgs[position]['id'])
+            if provider_id is not None:
+                return provider_id
+            # The site's providers were filled through the global heap; it is
+            # now marked full, so the next search moves outward.
+
+    def assign_in_zip(self, zip_orgs):
+        """Assigns a patient without coordinates to an org in the same ZIP code."""
+        for org in zip_orgs:
+            provider_id = self._take_from_org(org['id'])
+            if provider_id is not None:
+                return provider_id
+        # The ZIP's sites are full: search outward from a geocoded one, if any.
+        for org in zip_orgs:
+            if org['lat'] is not None and org['lon'] is not None:
+                return self.assign_near((org['lat'], org['lon']))
+        return self._take_from_global()
+
+
+class _PositionFilter:
+    """Maps positions in a rebuilt open-site index back to full-list positions for exclusion."""
+
+    def __init__(self, open_positions, full_positions):
+        self._open_positions = open_positions
+        self._full_positions = full_positions
+
+    def __contains__(self, position):
+        return self._open_positions[position] in self._full_positions
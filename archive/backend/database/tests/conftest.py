@@ -0,0 +1,6 @@
+"""Puts the database scripts on sys.path so the tests can import them as modules."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+"""Mapping measure status texts to care gap statuses."""
+
+import pytest
+
+from care_gaps import gap_status, patient_statuses
+
+
+@pytest.mark.parametrize("code, status, expected", [
+    ('CMS125v12', 'Met', 'Closed'),
+    ('CMS125v12', 'Numerator', 'Closed'),
+    ('CMS125v12', 'Not Met', 'Open'),
+    ('CMS125v12', ' missing screening ', 'Open'),
+    ('CMS125v12', 'Excluded - hospice', 'Closed'),
+    ('CMS125v12', 'Exception', 'Closed'),
+    ('CMS125v12', 'Something else', None),
+    ('CMS125v12', None, None),
+    # Lower-is-better: the numerator is the gap
+    ('CMS122v12', 'Numerator', 'Open'),
+    ('CMS122v12', 'Not Met', 'Closed'),
+    ('CMS122v12', 'Excluded', 'Closed'),
+    # Measure-specific texts
+    ('CMS646v4', 'Received BCG', 'Closed'),
+    ('CMS646v4', 'No BCG', 'Open'),
+])
+def test_gap_status(code, status, expected):
+    assert gap_status(code, status) == expected
+
+
+def test_patient_statuses_prefers_excluded_then_open():
+    columns = ['patient_id', 'measure_status']
+    rows = [
+        (1, 'Met'), (1, 'Not Met'),
+        (2, 'Not Met'), (2, 'Excluded'), (2, 'Met'),
+        (3, 'Met'), (3, 'Unknown'),
+        (4, 'Unknown'),
+    ]
+    assert patient_statuses('CMS125v12', columns, rows) == {
+        1: ('Open', 'Not Met'),
+        2: ('Closed', 'Excluded'),
+        3: ('Closed', 'Met'),
+        4: (None, 'Unknown'),
+    }
+
+
+def test_patient_statuses_needs_patient_and_status_columns():
+    with pytest.raises(ValueError):
+        patient_statuses('CMS125v12', ['measure_status'], [])
+    with pytest.raises(ValueError):
+        patient_statuses('CMS125v12', ['patient_id', 'result'], [])
@@ -0,0 +1,53 @@
+"""Rewriting the script's dblink calls and ordering the load into waves."""
+
+import pytest
+
+from etl_population import LoadStep, rewrite_dblink, load_waves
+
+
+def test_rewrite_dblink_reads_the_raw_schema():
+    statement = (
+        "INSERT INTO phm_edw.organization (name)\n"
+        "SELECT o.name FROM phm_edw.dblink('dbname=ohdsi user=postgres'::text, "
+        "$$SELECT id, \"start\" FROM population.organizations JOIN population.\"providers\" p ON true$$::text)\n"
+        "    AS o(id text, \"start\" text)\n"
+        "JOIN phm_edw.dblink('dbname=ohdsi', $$SELECT code FROM population.conditions$$) AS c(code text) ON true"
+    )
+    rewritten, sources = rewrite_dblink(statement)
+    assert rewritten == (
+        "INSERT INTO phm_edw.organization (name)\n"
+        "SELECT o.name FROM (SELECT id, \"start\" FROM population_raw.organizations "
+        "JOIN population_raw.\"providers\" p ON true) AS o(id, \"start\")\n"
+        "JOIN (SELECT code FROM population_raw.conditions) AS c(code) ON true"
+    )
+    assert sources == {'organizations', 'providers', 'conditions'}
+
+
+def test_rewrite_dblink_leaves_other_statements_alone():
+    assert rewrite_dblink("INSERT INTO phm_edw.x SELECT 1") == ("INSERT INTO phm_edw.x SELECT 1", set())
+
+
+def _step(table, *parents):
+    return LoadStep(table, '', parents)
+
+
+def test_load_waves_orders_parents_first():
+    steps = [
+        _step('phm_edw.encounter', 'phm_edw.patient', 'phm_edw.provider'),
+        _step('phm_edw.patient', 'phm_edw.address'),
+        _step('phm_edw.provider', 'phm_edw.organization'),
+        _step('phm_edw.organization', 'phm_edw.address', 'phm_edw.organization'),  # Self-reference is ignored
+        _step('phm_edw.address'),
+    ]
+    waves = [sorted(step.table for step in wave) for wave in load_waves(steps)]
+    assert waves == [
+        ['phm_edw.address'],
+        ['phm_edw.organization', 'phm_edw.patient'],
+        ['phm_edw.provider'],
+        ['phm_edw.encounter'],
+    ]
+
+
+def test_load_waves_rejects_cycles():
+    with pytest.raises(ValueError, match='circular'):
+        load_waves([_step('phm_edw.a', 'phm_edw.b'), _step('phm_edw.b', 'phm_edw.a')])
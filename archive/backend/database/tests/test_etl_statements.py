@@ -0,0 +1,41 @@
+"""Statement splitting and the per-patient table restriction."""
+
+from etl_statements import restrict_tables, split_sql
+
+
+def test_split_sql_respects_quotes_comments_and_steps():
+    text = """-- STEP 1: Load things
+INSERT INTO t VALUES ('a;b', $$x;y$$, $tag$ ; $tag$, E'it\\'s;');
+/* block /* nested ; */ still ; */
+-- only a comment;
+;
+-- STEP 2: Select
+SELECT "semi;colon" FROM t"""
+    statements = split_sql(text)
+    assert [s.sql for s in statements] == [
+        "INSERT INTO t VALUES ('a;b', $$x;y$$, $tag$ ; $tag$, E'it\\'s;')",
+        'SELECT "semi;colon" FROM t',
+    ]
+    assert [(s.line, s.step, s.step_title) for s in statements] == [(2, 1, 'Load things'), (7, 2, 'Select')]
+
+
+def test_split_sql_step_banner_inside_a_statement_is_ignored():
+    statements = split_sql("SELECT 1\n-- STEP 9: not a banner\n;\nSELECT 2;")
+    assert [s.step for s in statements] == [None, None]
+
+
+def test_restrict_tables_wraps_references_and_keeps_aliases():
+    sql = ("SELECT * FROM phm_edw.encounter e JOIN phm_edw.patient ON true, phm_edw.patient_x px "
+           "LEFT JOIN phm_edw.encounter WHERE phm_edw.encounter.encounter_id = 1")
+    assert restrict_tables(sql, ['phm_edw.encounter', 'phm_edw.patient'], 'patient_id = 1') == (
+        "SELECT * FROM (SELECT * FROM phm_edw.encounter WHERE patient_id = 1) e "
+        "JOIN (SELECT * FROM phm_edw.patient WHERE patient_id = 1) AS patient ON true, phm_edw.patient_x px "
+        "LEFT JOIN (SELECT * FROM phm_edw.encounter WHERE patient_id = 1) AS encounter "
+        "WHERE phm_edw.encounter.encounter_id = 1"
+    )
+
+
+def test_restrict_tables_ignores_comments_and_strings():
+    sql = "SELECT 'FROM phm_edw.encounter' -- JOIN phm_edw.encounter e\nFROM phm_edw.patient"
+    assert restrict_tables(sql, ['phm_edw.encounter'], 'patient_id = 1') == sql
+    assert restrict_tables(sql, [], 'patient_id = 1') == sql
@@ -0,0 +1,44 @@
+"""The NumPy haversine kernel must pick the same org as the pure-Python reference."""
+
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from geo_distance import nearest_orgs_numpy, verify_against_reference
+from geo_index import nearest_orgs_brute
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_reference_on_random_points(seed):
+    assert verify_against_reference(300, 200, seed=seed) == 0
+
+
+@pytest.mark.parametrize("patient_block, org_block", [(1, 1), (7, 13), (64, 1000)])
+def test_block_sizes_do_not_change_results(patient_block, org_block):
+    rng = random.Random(42)
+    orgs = [{'id': i, 'lat': rng.uniform(25.0, 49.0), 'lon': rng.uniform(-124.0, -67.0)} for i in range(50)]
+    orgs.append(dict(orgs[10], id=50))  # Exact tie: the earlier position must win
+    patients = [(rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0)) for _ in range(40)]
+    patients.append((orgs[10]['lat'], orgs[10]['lon']))
+
+    positions, distances = nearest_orgs_numpy(
+        [p[0] for p in patients], [p[1] for p in patients],
+        [o['lat'] for o in orgs], [o['lon'] for o in orgs],
+        patient_block=patient_block, org_block=org_block,
+    )
+    for i, patient_loc in enumerate(patients):
+        ref_distance, ref_position = nearest_orgs_brute(patient_loc, orgs)[0]
+        assert int(positions[i]) == ref_position
+        assert math.isclose(float(distances[i]), ref_distance, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def test_empty_inputs():
+    positions, distances = nearest_orgs_numpy([40.0], [-75.0], [], [])
+    assert positions.tolist() == [-1]
+    assert distances.tolist() == [math.inf]
+
+    positions, distances = nearest_orgs_numpy([], [], [40.0], [-75.0])
+    assert len(positions) == 0 and len(distances) == 0
@@ -0,0 +1,42 @@
+"""OrgBallTree.nearest must return exactly what a stable sort of all distances would."""
+
+import random
+
+from geo_index import OrgBallTree, nearest_orgs_brute
+
+
+def _orgs(n, seed):
+    rng = random.Random(seed)
+    orgs = [{'id': i, 'lat': rng.uniform(25.0, 49.0), 'lon': rng.uniform(-124.0, -67.0)} for i in range(n)]
+    # Co-located sites, so ties are broken by position
+    orgs += [dict(org, id=n + i) for i, org in enumerate(orgs[:5])]
+    return orgs
+
+
+def test_nearest_matches_brute_force():
+    orgs = _orgs(200, seed=3)
+    tree = OrgBallTree(orgs, leaf_size=4)
+    rng = random.Random(4)
+    patients = [(rng.uniform(25.0, 49.0), rng.uniform(-124.0, -67.0)) for _ in range(50)]
+    patients += [(org['lat'], org['lon']) for org in orgs[:5]]
+    for patient_loc in patients:
+        for k in (1, 3, 10):
+            assert tree.nearest(patient_loc, k=k) == nearest_orgs_brute(patient_loc, orgs, k=k)
+
+
+def test_nearest_skips_excluded_positions():
+    orgs = _orgs(100, seed=5)
+    tree = OrgBallTree(orgs, leaf_size=8)
+    patient_loc = (39.0, -95.0)
+    exclude = {position for _, position in nearest_orgs_brute(patient_loc, orgs, k=5)}
+    remaining = [(distance, position) for distance, position in nearest_orgs_brute(patient_loc, orgs, k=len(orgs))
+                 if position not in exclude]
+    assert tree.nearest(patient_loc, k=3, exclude=exclude) == remaining[:3]
+
+
+def test_nearest_edge_cases():
+    assert OrgBallTree([]).nearest((39.0, -95.0)) == []
+    orgs = _orgs(10, seed=6)
+    tree = OrgBallTree(orgs)
+    assert tree.nearest((39.0, -95.0), k=0) == []
+    assert len(tree.nearest((39.0, -95.0), k=100)) == len(orgs)
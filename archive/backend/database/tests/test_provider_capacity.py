@@ -0,0 +1,56 @@
+"""CapacityAssigner: nearest open site, least-loaded provider, capacity caps and fallbacks."""
+
+from provider_capacity import CapacityAssigner
+
+# Three sites west to east; 'c' has no providers.
+ORGS = [
+    {'id': 'a', 'lat': 40.0, 'lon': -100.0},
+    {'id': 'b', 'lat': 40.0, 'lon': -90.0},
+    {'id': 'c', 'lat': 40.0, 'lon': -80.0},
+]
+
+
+def test_least_loaded_provider_at_nearest_site():
+    assigner = CapacityAssigner([(1, 'a'), (2, 'a'), (3, 'b')], ORGS, capacity=10, initial_load={1: 3})
+    assert [assigner.assign_near((40.0, -101.0)) for _ in range(4)] == [2, 2, 2, 1]
+    assert assigner.load[1] == 4 and assigner.load[2] == 3
+    assert assigner.fallback_assignments == 0
+
+
+def test_full_site_moves_to_next_nearest():
+    assigner = CapacityAssigner([(1, 'a'), (3, 'b')], ORGS, capacity=2)
+    assert [assigner.assign_near((40.0, -101.0)) for _ in range(4)] == [1, 1, 3, 3]
+    # Every provider is full
+    assert assigner.assign_near((40.0, -101.0)) is None
+    assert all(load <= 2 for load in assigner.load.values())
+
+
+def test_providers_full_from_initial_load_are_skipped():
+    assigner = CapacityAssigner([(1, 'a'), (3, 'b')], ORGS, capacity=2, initial_load={1: 2})
+    assert assigner.assign_near((40.0, -101.0)) == 3
+    assert assigner.load[1] == 2
+
+
+def test_nearest_position_hint():
+    assigner = CapacityAssigner([(1, 'a'), (3, 'b')], ORGS, capacity=5)
+    assert assigner.assign_near((40.0, -101.0), nearest_position=1) == 3
+    # A hint for a site without providers falls back to the search
+    assert assigner.assign_near((40.0, -81.0), nearest_position=2) == 3
+
+
+def test_unlocated_providers_only_serve_the_global_fallback():
+    assigner = CapacityAssigner([(1, 'a'), (9, None)], ORGS, capacity=1)
+    assert assigner.assign_near((40.0, -101.0)) == 1
+    assert assigner.assign_near((40.0, -101.0)) == 9
+    assert assigner.fallback_assignments == 1
+
+
+def test_assign_in_zip():
+    assigner = CapacityAssigner([(1, 'a'), (2, 'x'), (3, 'b')], ORGS, capacity=1)
+    ungeocoded = {'id': 'x', 'lat': None, 'lon': None}
+    assert assigner.assign_in_zip([ungeocoded, ORGS[0]]) == 2
+    assert assigner.assign_in_zip([ungeocoded, ORGS[0]]) == 1
+    # Both ZIP sites are full: search outward from the geocoded one
+    assert assigner.assign_in_zip([ungeocoded, ORGS[0]]) == 3
+    # Nothing left anywhere
+    assert assigner.assign_in_zip([ungeocoded]) is None
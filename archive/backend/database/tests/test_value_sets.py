@@ -0,0 +1,41 @@
+"""Reading value set definitions from CSV."""
+
+import pytest
+
+from value_sets import VALUE_SETS_CSV, ValueSetCode, read_value_sets
+
+HEADER = '"value_set_name","code_system","code","match_type","description"\n'
+
+
+def _write(tmp_path, body):
+    path = tmp_path / 'value_sets.csv'
+    path.write_text(HEADER + body, encoding='utf-8')
+    return str(path)
+
+
+def test_read_value_sets(tmp_path):
+    path = _write(tmp_path, (
+        '"Diabetes","ICD-10","E11","prefix","Type 2"\n'
+        '" Diabetes ","ICD-10"," E10 ","",""\n'
+        '"Diabetes","ICD-10","E11","PREFIX","Duplicate"\n'
+        '"Hypertension","ICD-10","I10","EXACT","Essential"\n'
+    ))
+    assert read_value_sets(path) == {
+        'Diabetes': [ValueSetCode('ICD-10', 'E11', 'PREFIX', 'Type 2'), ValueSetCode('ICD-10', 'E10', 'EXACT', '')],
+        'Hypertension': [ValueSetCode('ICD-10', 'I10', 'EXACT', 'Essential')],
+    }
+
+
+@pytest.mark.parametrize("row, message", [
+    ('"Diabetes","ICD-10","","EXACT",""\n', 'required'),
+    ('"Diabetes","ICD-10","E11","LIKE",""\n', 'match_type'),
+])
+def test_read_value_sets_rejects_bad_rows(tmp_path, row, message):
+    with pytest.raises(ValueError, match=message) as error:
+        read_value_sets(_write(tmp_path, row))
+    assert ':2:' in str(error.value)
+
+
+def test_shipped_value_sets_parse():
+    sets = read_value_sets(VALUE_SETS_CSV)
+    assert sets and all(codes for codes in sets.values())
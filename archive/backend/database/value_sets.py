@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Loads measure value sets and rebuilds the condition -> value set index.
+
+The Measures/ scripts used to find diagnoses with patterns such as
+``c.condition_code LIKE 'E11%' AND c.code_system = 'ICD-10'``, which
+re-scanned phm_edw.condition in every script that needed them. Value sets
+name those code lists instead (SECTION F of phm-edw-ddl.sql):
+
+- value_sets.csv lists each set's codes (ICD-10, ICD-9, SNOMED, LOINC, CPT,
+  ...). A PREFIX code matches every code starting with it, as the LIKE
+  patterns did; an EXACT code matches only itself. Code system ``*``
+  matches any code system, for scripts whose LIKE did not test code_system.
+- ``load_value_sets`` replaces the codes of every set in the file; sets not
+  in the file are left alone.
+- ``rebuild_membership`` recomputes phm_edw.condition_value_set: every
+  condition whose (code_system, condition_code) matches a set's code, plus,
+  marked via_crosswalk, every condition whose code phm_edw.code_crosswalk
+  maps onto a match (one hop, active mappings only).
+
+Scripts then test membership with an indexed semi-join:
+
+    AND cd.condition_id IN (
+        SELECT cvs.condition_id
+        FROM phm_edw.condition_value_set cvs
+        JOIN phm_edw.value_set vs ON vs.value_set_id = cvs.value_set_id
+        WHERE vs.value_set_name = 'Diabetes Type 2'
+    )
+
+LOINC and CPT sets have no condition members; scripts look their codes up in
+phm_edw.value_set_code directly. measure_runner.py rebuilds the membership
+before running scripts that use it, since the condition dictionary grows
+with every EDW load. verify_value_sets.py checks the index against the LIKE
+semantics it replaces.
+
+    python value_sets.py [--file value_sets.csv] [--membership-only]
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# --- Configuration ---
+VALUE_SETS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "value_sets.csv")
+MATCH_TYPES = ('EXACT', 'PREFIX')
+MEMBERSHIP_TABLE = 'phm_edw.condition_value_set'   # Scripts referencing it need a current index
+
+# Conditions matching a value set code: directly, or through one crosswalk hop.
+# left() rather than LIKE, so '_' and '%' in a code are taken literally.
+MEMBERSHIP_SQL = """
+INSERT INTO phm_edw.condition_value_set (value_set_id, condition_id, via_crosswalk)
+SELECT value_set_id, condition_id, bool_and(via_crosswalk)
+FROM (
+    SELECT vsc.value_set_id, c.condition_id, FALSE AS via_crosswalk
+    FROM phm_edw.value_set_code vsc
+    JOIN phm_edw.condition c
+      ON (vsc.code_system = '*' OR c.code_system = vsc.code_system)
+     AND CASE WHEN vsc.match_type = 'PREFIX'
+              THEN left(c.condition_code, length(vsc.code)) = vsc.code
+              ELSE c.condition_code = vsc.code END
+    UNION ALL
+    SELECT vsc.value_set_id, c.condition_id, TRUE
+    FROM phm_edw.value_set_code vsc
+    JOIN phm_edw.code_crosswalk cw
+      ON (vsc.code_system = '*' OR cw.target_code_system = vsc.code_system)
+     AND cw.active_ind = 'Y'
+     AND CASE WHEN vsc.match_type = 'PREFIX'
+              THEN left(cw.target_code, length(vsc.code)) = vsc.code
+              ELSE cw.target_code = vsc.code END
+    JOIN phm_edw.condition c
+      ON c.code_system = cw.source_code_system
+     AND c.condition_code = cw.source_code
+) AS matches
+GROUP BY value_set_id, condition_id;
+"""
+
+
+class ValueSetCode(NamedTuple):
+    code_system: str
+    code: str
+    match_type: str       # 'EXACT' or 'PREFIX'
+    description: str
+
+
+def read_value_sets(path: str = VALUE_SETS_CSV) -> Dict[str, List[ValueSetCode]]:
+    """value set name -> codes, from a value_sets.csv-style file (header row required)."""
+    sets: Dict[str, List[ValueSetCode]] = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            name = (row.get('value_set_name') or '').strip()
+            code_system = (row.get('code_system') or '').strip()
+            code = (row.get('code') or '').strip()
+            match_type = (row.get('match_type') or 'EXACT').strip().upper()
+            if not (name and code_system and code):
+                raise ValueError(f"{path}:{line}: value_set_name, code_system and code are required")
+            if match_type not in MATCH_TYPES:
+                raise ValueError(f"{path}:{line}: match_type must be one of {', '.join(MATCH_TYPES)}, got {match_type!r}")
+            codes = sets.setdefault(name, [])
+            entry = ValueSetCode(code_system, code, match_type, (row.get('description') or '').strip())
+            if entry[:3] not in {existing[:3] for existing in codes}:
+                codes.append(entry)
+    return sets
+
+
+def load_value_sets(conn, sets: Dict[str, List[ValueSetCode]]) -> int:
+    """Creates or replaces the codes of each set in one transaction; returns the codes written."""
+    written = 0
+    with conn.cursor() as cursor:
+        for name, codes in sorted(sets.items()):
+            cursor.execute("""
+                INSERT INTO phm_edw.value_set (value_set_name) VALUES (%s)
+                ON CONFLICT (value_set_name) DO UPDATE SET updated_date = NOW()
+                RETURNING value_set_id;
+            """, (name,))
+            value_set_id = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM phm_edw.value_set_code WHERE value_set_id = %s;", (value_set_id,))
+            cursor.executemany("""
+                INSERT INTO phm_edw.value_set_code (value_set_id, code_system, code, match_type, description)
+                VALUES (%s, %s, %s, %s, %s);
+            """, [(value_set_id, *code) for code in codes])
+            written += len(codes)
+    conn.commit()
+    return written
+
+
+def rebuild_membership(conn) -> Tuple[int, int, float]:
+    """Recomputes phm_edw.condition_value_set and commits; returns (members, via crosswalk only, seconds).
+
+    DELETE rather than TRUNCATE, so measures reading the index concurrently
+    keep their snapshot instead of waiting on the table lock.
+    """
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM phm_edw.condition_value_set;")
+        cursor.execute(MEMBERSHIP_SQL)
+        cursor.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE via_crosswalk) FROM phm_edw.condition_value_set;")
+        members, crosswalked = cursor.fetchone()
+        cursor.execute("ANALYZE phm_edw.condition_value_set;")
+    conn.commit()
+    return members, crosswalked, time.perf_counter() - start
+
+
+def print_membership(members: int, crosswalked: int, seconds: float) -> None:
+    print(f"Value set membership: {members} condition memberships "
+          f"({crosswalked} through code_crosswalk) in {seconds:.3f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load measure value sets and rebuild phm_edw.condition_value_set.")
+    parser.add_argument(
+        "--file",
+        default=VALUE_SETS_CSV,
+        help=f"Value set CSV (value_set_name, code_system, code, match_type, description; default {VALUE_SETS_CSV})."
+    )
+    parser.add_argument(
+        "--membership-only",
+        action="store_true",
+        help="Only rebuild the condition membership index from the value sets already loaded."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    from measure_runner import connect_kwargs  # measure_runner imports this module
+    sets = {}
+    if not args.membership_only:
+        try:
+            sets = read_value_sets(args.file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading value sets: {e}")
+            sys.exit(1)
+    try:
+        conn = psycopg2.connect(**connect_kwargs())
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+    try:
+        if sets:
+            written = load_value_sets(conn, sets)
+            print(f"Loaded {len(sets)} value sets ({written} codes) from {args.file}")
+        print_membership(*rebuild_membership(conn))
+    except psycopg2.Error as e:
+        print(f"Error loading value sets: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
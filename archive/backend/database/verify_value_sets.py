@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Checks phm_edw.condition_value_set against the LIKE semantics it replaces.
+
+For every value set, the conditions the index holds as direct members
+(via_crosswalk = FALSE) must be exactly those the old script predicates
+select: ``code_system = <system> AND condition_code LIKE '<code>%'`` for a
+PREFIX code, ``condition_code = '<code>'`` for an EXACT one, without the
+code_system test for code system ``*``. Members the
+index adds through phm_edw.code_crosswalk are listed separately; they are
+the intended difference. The Measures/ scripts are also scanned for value
+set names that are not loaded.
+
+An index rebuilt before the latest EDW load shows up as missing members;
+``python value_sets.py --membership-only`` brings it up to date.
+
+    python verify_value_sets.py [--value-set "Diabetes Type 2"] [--show 5]
+
+Exits with status 1 when any value set differs.
+"""
+
+import argparse
+import re
+import sys
+from typing import Dict, List, NamedTuple, Sequence, Set
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# A script's membership test names its value set like this.
+VALUE_SET_REFERENCE = re.compile(r"value_set_name\s*=\s*'([^']+)'", re.IGNORECASE)
+
+
+class ValueSetCheck(NamedTuple):
+    name: str
+    like_members: int          # Conditions the LIKE / equality predicates select
+    missing: List[str]         # Selected by LIKE but not direct members of the index
+    extra: List[str]           # Direct members LIKE does not select
+    crosswalked: List[str]     # Members only through code_crosswalk
+
+
+def like_pattern(code: str) -> str:
+    """LIKE pattern for a PREFIX code, with LIKE's wildcards in the code escaped."""
+    return re.sub(r'([\\%_])', r'\\\1', code) + '%'
+
+
+def _labels(cursor, condition_ids: Set[int]) -> List[str]:
+    if not condition_ids:
+        return []
+    cursor.execute("""
+        SELECT code_system || ' ' || condition_code FROM phm_edw.condition
+        WHERE condition_id = ANY(%s) ORDER BY 1;
+    """, (sorted(condition_ids),))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def check_value_set(cursor, value_set_id: int, name: str) -> ValueSetCheck:
+    cursor.execute("""
+        SELECT code_system, code, match_type FROM phm_edw.value_set_code WHERE value_set_id = %s;
+    """, (value_set_id,))
+    expected: Set[int] = set()
+    for code_system, code, match_type in cursor.fetchall():
+        if match_type == 'PREFIX':
+            cursor.execute("""
+                SELECT condition_id FROM phm_edw.condition
+                WHERE (%(system)s = '*' OR code_system = %(system)s) AND condition_code LIKE %(code)s;
+            """, {'system': code_system, 'code': like_pattern(code)})
+        else:
+            cursor.execute("""
+                SELECT condition_id FROM phm_edw.condition
+                WHERE (%(system)s = '*' OR code_system = %(system)s) AND condition_code = %(code)s;
+            """, {'system': code_system, 'code': code})
+        expected.update(row[0] for row in cursor.fetchall())
+
+    cursor.execute("""
+        SELECT condition_id, via_crosswalk FROM phm_edw.condition_value_set WHERE value_set_id = %s;
+    """, (value_set_id,))
+    direct: Set[int] = set()
+    crosswalked: Set[int] = set()
+    for condition_id, via_crosswalk in cursor.fetchall():
+        (crosswalked if via_crosswalk else direct).add(condition_id)
+    return ValueSetCheck(name, len(expected), _labels(cursor, expected - direct),
+                         _labels(cursor, direct - expected), _labels(cursor, crosswalked))
+
+
+def script_references(scripts) -> Dict[str, List[str]]:
+    """value set name -> codes of the measure scripts that name it."""
+    references: Dict[str, List[str]] = {}
+    for script in scripts:
+        for name in sorted(set(VALUE_SET_REFERENCE.findall(script.sql))):
+            references.setdefault(name, []).append(script.code)
+    return references
+
+
+def print_check(check: ValueSetCheck, show: int) -> None:
+    status = "OK" if not (check.missing or check.extra) else "MISMATCH"
+    print(f"{status:<9} {check.name:<32} {check.like_members:>6} by LIKE  "
+          f"{len(check.missing):>4} missing  {len(check.extra):>4} extra  "
+          f"{len(check.crosswalked):>4} via crosswalk")
+    for label, codes in (("missing", check.missing), ("extra", check.extra), ("via crosswalk", check.crosswalked)):
+        if codes and show:
+            more = f" (+{len(codes) - show} more)" if len(codes) > show else ""
+            print(f"          {label}: {', '.join(codes[:show])}{more}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the value set membership index against LIKE matching.")
+    parser.add_argument(
+        "--value-set",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="Value set to check (repeatable). Default: every loaded value set."
+    )
+    parser.add_argument(
+        "--show",
+        type=int,
+        default=5,
+        help="Codes to list for each difference (default 5; 0 lists none)."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if psycopg2 is None:
+        print("Error: psycopg2 and python-dotenv are required to connect (see requirements.txt).")
+        sys.exit(1)
+    from measure_runner import connect_kwargs, discover_measures
+    try:
+        conn = psycopg2.connect(**connect_kwargs())
+    except psycopg2.Error as e:
+        print(f"Error connecting to database: {e}")
+        sys.exit(1)
+    failed = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT value_set_name, value_set_id FROM phm_edw.value_set ORDER BY value_set_name;")
+            loaded = dict(cursor.fetchall())
+            names: Sequence[str] = args.value_set or list(loaded)
+            for name in names:
+                if name not in loaded:
+                    print(f"MISSING   {name:<32} not loaded (see value_sets.py)")
+                    failed = True
+                    continue
+                check = check_value_set(cursor, loaded[name], name)
+                print_check(check, args.show)
+                failed = failed or bool(check.missing or check.extra)
+        conn.rollback()
+    except psycopg2.Error as e:
+        print(f"Error verifying value sets: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    for name, codes in sorted(script_references(discover_measures()).items()):
+        if name not in loaded:
+            print(f"MISSING   {name:<32} referenced by {', '.join(codes)} but not loaded")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+ZIP code centroids for patients whose address has no coordinates.
+
+Centroids come from either a local CSV (``zip,latitude,longitude``; a header
+row is optional) or from the mean coordinates of geocoded rows in
+``phm_edw.address``. The result is cached on disk in a small binary file:
+
+    magic b'ZIPC' | version u32 | count u32 | 16-byte source fingerprint
+    count x 5-byte ASCII ZIPs | count float64 latitudes | count float64 longitudes
+
+Loading the cache is three ``array.frombytes`` calls. The fingerprint is the
+CSV's path, size and mtime, or the highest address_id and latest
+created/updated timestamp of ``phm_edw.address`` (two index probes, via the
+primary key and idx_address_changed); when it no longer matches, the cache
+is rebuilt from the source. Deleting an address alone does not change the
+fingerprint; the cache catches up at the next insert or update.
+
+Run this module directly to rebuild the cache from a CSV:
+
+    python zip_centroids.py --csv us_zip_centroids.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import struct
+import sys
+from array import array
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zip_centroids.cache')
+ADDRESS_SOURCE = 'address'
+
+_MAGIC = b'ZIPC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sII16s')
+_ZIP_WIDTH = 5
+
+
+def normalize_zip(zip_code):
+    """Reduces a ZIP or ZIP+4 string to its 5-digit form, or None if it has none."""
+    if not zip_code:
+        return None
+    digits = str(zip_code).strip()[:_ZIP_WIDTH]
+    if len(digits) != _ZIP_WIDTH or not digits.isdigit():
+        return None
+    return digits
+
+
+class ZipCentroids:
+    """ZIP -> (lat, lon) lookup backed by parallel arrays."""
+
+    def __init__(self, zips, lat, lon):
+        self.lat = lat
+        self.lon = lon
+        self._positions = {zip_code: i for i, zip_code in enumerate(zips)}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def get(self, zip_code):
+        i = self._positions.get(normalize_zip(zip_code))
+        if i is None:
+            return None
+        return (self.lat[i], self.lon[i])
+
+
+# --- Sources ---
+def csv_fingerprint(path):
+    stat = os.stat(path)
+    return hashlib.md5(f"csv|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).digest()
+
+
+def read_csv_centroids(path):
+    """Reads (zips, lat, lon) from a CSV; rows that do not parse are skipped."""
+    zips = []
+    lat = array('d')
+    lon = array('d')
+    seen = set()
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            zip_code = normalize_zip(row[0])
+            try:
+                row_lat, row_lon = float(row[1]), float(row[2])
+            except ValueError:
+                continue  # Header row or blank coordinates
+            if zip_code is None or zip_code in seen:
+                continue
+            seen.add(zip_code)
+            zips.append(zip_code)
+            lat.append(row_lat)
+            lon.append(row_lon)
+    return zips, lat, lon
+
+
+def address_fingerprint(cursor):
+    cursor.execute("""
+        SELECT MAX(address_id), MAX(COALESCE(updated_date, created_date))
+        FROM phm_edw.address;
+    """)
+    last_id, last_change = cursor.fetchone()
+    return hashlib.md5(f"address|{last_id}|{last_change}".encode()).digest()
+
+
+def read_address_centroids(cursor):
+    """Averages geocoded phm_edw.address rows per 5-digit ZIP."""
+    cursor.execute("""
+        SELECT LEFT(zip, 5), AVG(latitude), AVG(longitude)
+        FROM phm_edw.address
+        WHERE zip ~ '^[0-9]{5}'
+          AND latitude IS NOT NULL
+          AND longitude IS NOT NULL
+        GROUP BY LEFT(zip, 5)
+        ORDER BY LEFT(zip, 5);
+    """)
+    zips = []
+    lat = array('d')
+    lon = array('d')
+    for zip_code, row_lat, row_lon in cursor.fetchall():
+        zips.append(zip_code)
+        lat.append(float(row_lat))
+        lon.append(float(row_lon))
+    return zips, lat, lon
+
+
+# --- Binary cache ---
+def write_cache(path, fingerprint, zips, lat, lon):
+    """Writes the cache atomically (temp file + rename)."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(zips), fingerprint))
+        f.write(''.join(zips).encode('ascii'))
+        f.write(lat.tobytes())
+        f.write(lon.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_cache(path, fingerprint):
+    """Returns ZipCentroids from the cache, or None if it is missing, stale or unreadable."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, count, cached_fingerprint = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or cached_fingerprint != fingerprint:
+        return None
+
+    zips_end = _HEADER.size + count * _ZIP_WIDTH
+    lat_end = zips_end + count * 8
+    if len(data) != lat_end + count * 8:
+        return None
+    packed_zips = data[_HEADER.size:zips_end].decode('ascii')
+    zips = [packed_zips[i:i + _ZIP_WIDTH] for i in range(0, len(packed_zips), _ZIP_WIDTH)]
+    lat = array('d')
+    lat.frombytes(data[zips_end:lat_end])
+    lon = array('d')
+    lon.frombytes(data[lat_end:])
+    return ZipCentroids(zips, lat, lon)
+
+
+def load_zip_centroids(source, cursor=None, cache_path=CACHE_PATH):
+    """Loads centroids from ``source`` (a CSV path or ADDRESS_SOURCE), using the cache when current."""
+    if source == ADDRESS_SOURCE:
+        fingerprint = address_fingerprint(cursor)
+    else:
+        fingerprint = csv_fingerprint(source)
+
+    centroids = read_cache(cache_path, fingerprint)
+    if centroids is not None:
+        return centroids
+
+    if source == ADDRESS_SOURCE:
+        zips, lat, lon = read_address_centroids(cursor)
+    else:
+        zips, lat, lon = read_csv_centroids(source)
+    try:
+        write_cache(cache_path, fingerprint, zips, lat, lon)
+    except OSError as e:
+        print(f"Warning: could not write ZIP centroid cache {cache_path}: {e}")
+    return ZipCentroids(zips, lat, lon)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the binary ZIP centroid cache from a CSV.")
+    parser.add_argument("--csv", required=True, help="CSV of zip,latitude,longitude rows.")
+    parser.add_argument("--cache", default=CACHE_PATH, help=f"Cache file to write (default {CACHE_PATH}).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv):
+        print(f"Error: CSV not found: {args.csv}")
+        sys.exit(1)
+    centroids = load_zip_centroids(args.csv, cache_path=args.cache)
+    print(f"Cached {len(centroids)} ZIP centroids in {args.cache}.")